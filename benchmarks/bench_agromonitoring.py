@@ -0,0 +1,46 @@
+"""Benchmarks of the Agromonitoring functions against a local mock API."""
+
+import pytest
+
+from leafagro.agromonitoring import Agromonitoring, clear_search_cache
+from leafagro.stats import get_stats_batch
+
+KEY = "benchmark"
+START, END = "2021-01-01", "2021-12-31"
+POLYGONS = [f"polygon{i}" for i in range(10)]
+
+
+@pytest.mark.benchmark(group="agromonitoring")
+def bench_get_agromonitoring_tile(benchmark, mock_api):
+    benchmark.pedantic(
+        Agromonitoring.get_agromonitoring_tile,
+        args=(KEY, POLYGONS[0], START, END, "ndvi"),
+        setup=clear_search_cache,
+        rounds=5,
+    )
+
+
+@pytest.mark.benchmark(group="agromonitoring")
+def bench_get_agromonitoring_tile_cached(benchmark, mock_api):
+    Agromonitoring.get_agromonitoring_tile(KEY, POLYGONS[0], START, END, "ndvi")
+    benchmark(Agromonitoring.get_agromonitoring_tile, KEY, POLYGONS[0], START, END, "evi")
+
+
+@pytest.mark.benchmark(group="agromonitoring")
+def bench_get_agromonitoring_batch(benchmark, mock_api):
+    benchmark.pedantic(
+        Agromonitoring.get_agromonitoring_batch,
+        args=(KEY, POLYGONS, START, END, "ndvi"),
+        setup=clear_search_cache,
+        rounds=5,
+    )
+
+
+@pytest.mark.benchmark(group="agromonitoring")
+def bench_get_stats_batch(benchmark, mock_api):
+    benchmark.pedantic(
+        get_stats_batch,
+        args=(KEY, POLYGONS[:3], START, END, ["ndvi", "evi"]),
+        setup=clear_search_cache,
+        rounds=3,
+    )
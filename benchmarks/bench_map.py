@@ -0,0 +1,53 @@
+"""Benchmarks of the Map widget."""
+
+import pytest
+
+from leafagro import Map
+
+SIZES = [1000, 10000, 100000]
+
+
+@pytest.mark.benchmark(group="map")
+def bench_map_construction(benchmark):
+    benchmark(Map)
+
+
+@pytest.mark.benchmark(group="add_geojson")
+@pytest.mark.parametrize("count", SIZES)
+def bench_add_geojson_dict(benchmark, parcels, count):
+    data, _, _ = parcels(count)
+    benchmark.pedantic(lambda m: m.add_geojson(data), setup=lambda: ((Map(),), {}), rounds=3)
+
+
+@pytest.mark.benchmark(group="add_geojson")
+@pytest.mark.parametrize("count", SIZES)
+def bench_add_geojson_file(benchmark, parcels, count):
+    _, path, _ = parcels(count)
+    benchmark.pedantic(lambda m: m.add_geojson(path), setup=lambda: ((Map(),), {}), rounds=3)
+
+
+@pytest.mark.benchmark(group="add_shp")
+@pytest.mark.parametrize("count", SIZES)
+def bench_add_shp(benchmark, parcels, count):
+    _, _, path = parcels(count)
+    benchmark.pedantic(lambda m: m.add_shp(path), setup=lambda: ((Map(),), {}), rounds=3)
+
+
+@pytest.mark.benchmark(group="add_vector_tiles")
+@pytest.mark.parametrize("count", SIZES)
+def bench_add_vector_tiles(benchmark, parcels, count):
+    pytest.importorskip("mapbox_vector_tile")
+    from leafagro.tiles import lonlat_to_tile
+    from leafagro.tileserver import get_tile_server
+
+    _, _, path = parcels(count)
+
+    def run(m):
+        m.add_vector_tiles(path)
+        # Render the tile under the center, as the browser would on first display.
+        layer = m.layers[-1]
+        lat, lon = m.center
+        x, y = lonlat_to_tile(lon, lat, int(m.zoom))
+        get_tile_server().get_tile(layer.tile_source_id, int(m.zoom), x, y)
+
+    benchmark.pedantic(run, setup=lambda: ((Map(),), {}), rounds=3)
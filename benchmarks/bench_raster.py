@@ -0,0 +1,33 @@
+"""Benchmarks of the raster processing."""
+
+import pytest
+
+from leafagro import Map
+
+SIZES = [512, 2048, 8192]
+
+
+@pytest.mark.benchmark(group="normalizedDifference")
+@pytest.mark.parametrize("size", SIZES)
+def bench_normalized_difference(benchmark, bands, tmp_path, size):
+    nir, red = bands(size)
+    output = str(tmp_path / "nd.tif")
+    benchmark.pedantic(
+        lambda m: m.normalizedDifference(nir, red, "ndvi", "RdYlGn", output=output),
+        setup=lambda: ((Map(),), {}),
+        rounds=3,
+    )
+
+
+@pytest.mark.benchmark(group="compute_indices")
+@pytest.mark.parametrize("size", SIZES[:2])
+def bench_compute_indices(benchmark, bands, tmp_path, size):
+    from leafagro.indices import compute_indices
+
+    nir, red = bands(size)
+    output = str(tmp_path / "indices.tif")
+    benchmark.pedantic(
+        compute_indices,
+        args=({"N": nir, "R": red}, ["ndvi", "evi2", "savi"], output),
+        rounds=3,
+    )
@@ -0,0 +1,197 @@
+"""Fixtures of the leafagro benchmark suite.
+
+Run the suite from the repository root with::
+
+    pip install pytest-benchmark
+    python -m pytest benchmarks
+
+Every run is saved under ``benchmarks/results`` (one JSON file per run,
+tagged with the leafagro version), so two versions can be compared with::
+
+    python -m pytest benchmarks --benchmark-compare --benchmark-compare-fail=median:20%
+    pytest-benchmark --storage benchmarks/results compare --group-by=group
+"""
+
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pytest
+
+RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+PRODUCTS = ["truecolor", "falsecolor", "ndvi", "evi", "evi2", "nri", "dswi", "ndwi"]
+
+
+def pytest_configure(config):
+    # Keep the results next to the suite whatever the working directory.
+    if getattr(config.option, "benchmark_storage", None) == "file://./.benchmarks":
+        config.option.benchmark_storage = f"file://{RESULTS}"
+
+
+def pytest_benchmark_update_machine_info(config, machine_info):
+    import leafagro
+
+    machine_info["leafagro_version"] = leafagro.__version__
+
+
+# Vector data ---------------------------------------------------------------
+
+
+def make_parcels(count):
+    """Returns a GeoJSON FeatureCollection of square parcels on a regular grid."""
+    side = int(np.ceil(np.sqrt(count)))
+    size = 0.001
+    features = []
+    for i in range(count):
+        x = 10 + (i % side) * size * 1.2
+        y = 45 + (i // side) * size * 1.2
+        ring = [[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]
+        features.append(
+            {
+                "type": "Feature",
+                "properties": {"id": i, "crop": "wheat" if i % 2 else "maize"},
+                "geometry": {"type": "Polygon", "coordinates": [ring]},
+            }
+        )
+    return {"type": "FeatureCollection", "features": features}
+
+
+@pytest.fixture(scope="session")
+def parcels(tmp_path_factory):
+    """Returns a function giving the GeoJSON dict, GeoJSON file and shapefile of n parcels."""
+    import geopandas as gpd
+
+    directory = tmp_path_factory.mktemp("parcels")
+    cache = {}
+
+    def get(count):
+        if count not in cache:
+            data = make_parcels(count)
+            geojson = str(directory / f"parcels_{count}.geojson")
+            with open(geojson, "w") as f:
+                json.dump(data, f)
+            shp = str(directory / f"parcels_{count}.shp")
+            gpd.GeoDataFrame.from_features(data["features"], crs="EPSG:4326").to_file(shp)
+            cache[count] = (data, geojson, shp)
+        return cache[count]
+
+    return get
+
+
+# Rasters -------------------------------------------------------------------
+
+
+@pytest.fixture(scope="session")
+def bands(tmp_path_factory):
+    """Returns a function giving the paths of synthetic NIR and red bands of a given size."""
+    import rasterio
+    from rasterio.transform import from_origin
+
+    directory = tmp_path_factory.mktemp("bands")
+    cache = {}
+
+    def get(size):
+        if size not in cache:
+            rng = np.random.default_rng(size)
+            paths = []
+            for name in ("nir", "red"):
+                path = str(directory / f"{name}_{size}.tif")
+                profile = {
+                    "driver": "GTiff",
+                    "width": size,
+                    "height": size,
+                    "count": 1,
+                    "dtype": "uint16",
+                    "crs": "EPSG:32633",
+                    "transform": from_origin(500000, 5000000, 10, 10),
+                    "nodata": 0,
+                    "tiled": True,
+                    "compress": "DEFLATE",
+                }
+                with rasterio.open(path, "w", **profile) as dst:
+                    dst.write(rng.integers(1, 10000, (size, size), dtype="uint16"), 1)
+                paths.append(path)
+            cache[size] = tuple(paths)
+        return cache[size]
+
+    return get
+
+
+# Mock Agromonitoring API ---------------------------------------------------
+
+
+def _scenes(base, polygon_id, start, end):
+    scenes = []
+    for dt in range(start, end, 5 * 86400):
+        scenes.append(
+            {
+                "dt": dt,
+                "type": "Sentinel-2",
+                "dc": 100,
+                "cl": float(dt % 37),
+                "tile": {p: f"{base}/tile/{p}/{polygon_id}/{dt}/{{z}}/{{x}}/{{y}}.png" for p in PRODUCTS},
+                "stats": {p: f"{base}/stats/{p}/{polygon_id}/{dt}" for p in PRODUCTS[2:]},
+                "image": {p: f"{base}/image/{p}/{polygon_id}/{dt}.png" for p in PRODUCTS},
+                "data": {p: f"{base}/data/{p}/{polygon_id}/{dt}.tif" for p in PRODUCTS},
+            }
+        )
+    return scenes
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    """A minimal Agromonitoring API answering after ``latency`` seconds."""
+
+    latency = 0.0
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        base = f"http://127.0.0.1:{self.server.server_port}/agro/1.0"
+        if url.path.endswith("/image/search"):
+            body = _scenes(base, query["polyid"][0], int(query["start"][0]), int(query["end"][0]))
+        elif "/stats/" in url.path:
+            body = {"std": 0.1, "p25": 0.2, "num": 100, "min": 0.0, "max": 0.9, "median": 0.5, "p75": 0.7, "mean": 0.45}
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(params=[0.0, 0.05], ids=["0ms", "50ms"])
+def mock_api(request):
+    """Points leafagro at a local mock API with the given latency per request."""
+    from leafagro import agromonitoring
+    from leafagro.client import AgroClient, set_client
+
+    handler = type("Handler", (_MockHandler,), {"latency": request.param})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    previous_url = agromonitoring.API_URL
+    agromonitoring.API_URL = f"http://127.0.0.1:{server.server_port}/agro/1.0"
+    set_client(AgroClient(calls_per_minute=None, backoff_factor=0))
+    agromonitoring.clear_search_cache()
+    try:
+        yield request.param
+    finally:
+        agromonitoring.API_URL = previous_url
+        # The next call to get_client() creates a fresh default client.
+        set_client(None)
+        agromonitoring.clear_search_cache()
+        server.shutdown()
+        server.server_close()
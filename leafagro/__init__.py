@@ -4,4 +4,78 @@ __author__ = """Haseeb Habeebulla"""
 __email__ = "ibnhabeebulla@gmail.com"
 __version__ = "0.0.12"
 
-from .leafagro import Map
\ No newline at end of file
+import importlib
+from typing import TYPE_CHECKING
+
+# Public names and the submodule defining them. They are imported on first
+# access (PEP 562), so the data functions can be used without loading the
+# widget stack (ipyleaflet, ipywidgets, IPython) or pandas up front.
+_ATTRIBUTES = {
+    "Map": "leafagro",
+    "Agromonitoring": "agromonitoring",
+    "search_images": "agromonitoring",
+    "set_scene_catalog": "agromonitoring",
+    "AgroClient": "client",
+    "SceneCatalog": "catalog",
+    "ChangeDetector": "change",
+    "get_stats_batch": "stats",
+    "get_stats_timeseries": "stats",
+    "normalized_difference": "raster",
+    "compute_indices": "indices",
+    "Mosaic": "mosaic",
+    "zonal_stats": "zonal",
+    "set_raster_store": "store",
+}
+
+_SUBMODULES = [
+    "agromonitoring",
+    "cache",
+    "catalog",
+    "change",
+    "cli",
+    "client",
+    "common",
+    "foliumap",
+    "indices",
+    "leafagro",
+    "mosaic",
+    "perf",
+    "raster",
+    "stats",
+    "store",
+    "tiles",
+    "tileserver",
+    "utils",
+    "vector",
+    "zonal",
+]
+
+__all__ = list(_ATTRIBUTES)
+
+if TYPE_CHECKING:
+    from .agromonitoring import Agromonitoring, search_images, set_scene_catalog
+    from .catalog import SceneCatalog
+    from .change import ChangeDetector
+    from .client import AgroClient
+    from .indices import compute_indices
+    from .leafagro import Map
+    from .mosaic import Mosaic
+    from .raster import normalized_difference
+    from .stats import get_stats_batch, get_stats_timeseries
+    from .store import set_raster_store
+    from .zonal import zonal_stats
+
+
+def __getattr__(name):
+    if name in _ATTRIBUTES:
+        module = importlib.import_module(f".{_ATTRIBUTES[name]}", __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    if name in _SUBMODULES:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_ATTRIBUTES) | set(_SUBMODULES))
@@ -1,9 +1,365 @@
-import requests
+import calendar
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date as date_type
 from datetime import datetime
-import pandas as pd
+
+from . import perf
+from .client import API_URL, get_client
+
+ALLOWED_DATA = ["truecolor", "falsecolor", "ndvi", "evi", "evi2", "nri", "dswi", "ndwi"]
+
+# Keys of a search entry that hold one URL per product.
+URL_SOURCES = ["tile", "stats", "image", "data"]
+
+SEARCH_CACHE_SIZE = 128
+_search_cache = OrderedDict()
+_search_lock = threading.Lock()
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+_catalog = None
+
+
+def _to_timestamp(date):
+    """Converts a "YYYY-MM-DD" date, a date or a timestamp to UNIX seconds.
+
+    Dates without a time zone are taken as UTC, like the scene dates
+    returned by the API, whatever the time zone of the machine.
+    """
+    if date is None or isinstance(date, (int, float)):
+        return date
+    if isinstance(date, str):
+        date = datetime.fromisoformat(date)
+    if isinstance(date, datetime) and date.tzinfo is not None:
+        return int(date.timestamp())
+    return calendar.timegm(date.timetuple())
+
+
+def _end_timestamp(date):
+    """Converts the end of a date range to UNIX seconds.
+
+    A "YYYY-MM-DD" date or a date includes its whole day, so scenes taken
+    on the end date are found. Timestamps and datetimes are exact instants.
+    """
+    timestamp = _to_timestamp(date)
+    whole_day = (isinstance(date, str) and len(date) == 10) or (
+        isinstance(date, date_type) and not isinstance(date, datetime)
+    )
+    return timestamp + 86400 - 1 if whole_day else timestamp
+
+
+def _image_search(API_Key, PolygonId, StartDate, EndDate):
+    """Runs one image search request.
+
+    Returns:
+        list: The scenes, or None when the request failed.
+    """
+    url = (
+        f"{API_URL}/image/search?start={_to_timestamp(StartDate)}"
+        f"&end={_end_timestamp(EndDate)}&polyid={PolygonId}&appid={API_Key}"
+    )
+    with perf.span("agromonitoring.image_search"):
+        response = get_client().get(url)
+    if response.status_code == 200:
+        with perf.span("json.parse"):
+            return response.json()
+    print(
+        f"Error: API request for polygon {PolygonId} failed with status code "
+        f"{response.status_code}"
+    )
+    print(f"Response content: {response.content}")
+    return None
+
+
+class ImageSearch():
+    """The scenes found by one Agromonitoring image search.
+
+    A single search already contains the tile, stats, image and data URLs of
+    every product, so one ``ImageSearch`` serves all product lookups of a
+    polygon and date range.
+
+    Args:
+        polygon_id (str): Polygon Id the search was made for.
+        start_date (str): Start date of the search ("YYYY-MM-DD").
+        end_date (str): End date of the search ("YYYY-MM-DD").
+        scenes (list): The JSON entries returned by the API.
+    """
+
+    def __init__(self, polygon_id, start_date, end_date, scenes):
+        self.polygon_id = polygon_id
+        self.start_date = start_date
+        self.end_date = end_date
+        self.scenes = scenes
+        self._df = None
+
+    def __len__(self):
+        return len(self.scenes)
+
+    def __repr__(self):
+        return (
+            f"ImageSearch(polygon_id={self.polygon_id!r}, "
+            f"start_date={self.start_date!r}, end_date={self.end_date!r}, "
+            f"scenes={len(self)})"
+        )
+
+    @property
+    def dataframe(self):
+        """Returns one row per scene with its metadata and every URL.
+
+        Columns are Polygon, Date, dt, Satellite, Cloud, Coverage and one
+        ``<source>_<product>`` column per URL (e.g. ``tile_ndvi``, ``stats_evi``).
+        """
+        if self._df is None:
+            with perf.span("agromonitoring.dataframe"):
+                self._df = self._build_dataframe()
+        return self._df
+
+    def _build_dataframe(self):
+        import pandas as pd
+
+        columns = {
+            'Polygon': [self.polygon_id] * len(self.scenes),
+            'Date': [
+                datetime.utcfromtimestamp(entry['dt']).strftime('%Y-%m-%d')
+                for entry in self.scenes
+            ],
+            'dt': [entry['dt'] for entry in self.scenes],
+            'Satellite': [entry.get('type') for entry in self.scenes],
+            'Cloud': [entry.get('cl') for entry in self.scenes],
+            'Coverage': [entry.get('dc') for entry in self.scenes],
+        }
+        for source in URL_SOURCES:
+            for product in ALLOWED_DATA:
+                values = [
+                    (entry.get(source) or {}).get(product) for entry in self.scenes
+                ]
+                if any(value is not None for value in values):
+                    columns[f"{source}_{product}"] = values
+        return pd.DataFrame(columns)
+
+    def urls(self, data, source="tile"):
+        """Returns the dates and URLs of one product.
+
+        Args:
+            data (str): The product, e.g. "ndvi".
+            source (str, optional): One of "tile", "stats", "image" or "data".
+                Defaults to "tile".
+
+        Returns:
+            pd.DataFrame: The 'Date' and 'URL' of every scene.
+        """
+        import pandas as pd
+
+        df = self.dataframe
+        column = f"{source}_{data}"
+        urls = df[column] if column in df else [None] * len(df)
+        return pd.DataFrame({'Date': df['Date'], 'URL': list(urls)})
+
+
+def search_images(API_Key, PolygonId, StartDate, EndDate):
+    """Search the scenes of a polygon, reusing earlier results of the same search.
+
+    Results are kept in an in-memory LRU cache keyed by (API key, polygon,
+    start, end), so asking for several products, or for tiles and then stats,
+    of the same polygon and dates sends a single request. With a scene
+    catalogue (see ``set_scene_catalog``) every result is also saved to
+    Parquet, and searches it already covers never reach the API. Both dates
+    are included, in UTC like the scene dates.
+
+    Args:
+        API_Key (str): Agromonitoring API Key.
+        PolygonId (str): Polygon Id created in Agromonitoring (Area of Interest)
+        StartDate (str): Provide the date of starting from (format ex."YYYY-MM-DD")
+        EndDate (str): Provide the date of till last search (format ex."YYYY-MM-DD")
+
+    Returns:
+        ImageSearch: The search result, or None if the request failed.
+    """
+    key = (API_Key, PolygonId, StartDate, EndDate)
+    with _search_lock:
+        if key in _search_cache:
+            _search_cache.move_to_end(key)
+            perf.count("search_cache.hits")
+            return _search_cache[key]
+    perf.count("search_cache.misses")
+
+    catalog = _catalog
+    search = None
+    if catalog is not None:
+        search = catalog.search(PolygonId, StartDate, EndDate)
+    if search is not None:
+        perf.count("catalog.hits")
+    else:
+        scenes = _image_search(API_Key, PolygonId, StartDate, EndDate)
+        if scenes is None:
+            return None
+        search = ImageSearch(PolygonId, StartDate, EndDate, scenes)
+        if catalog is not None:
+            catalog.add(search)
+
+    with _search_lock:
+        _search_cache[key] = search
+        _search_cache.move_to_end(key)
+        while len(_search_cache) > SEARCH_CACHE_SIZE:
+            _search_cache.popitem(last=False)
+    return search
+
+
+def clear_search_cache():
+    """Clears the in-memory cache of image search results."""
+    with _search_lock:
+        _search_cache.clear()
+
+
+def set_scene_catalog(catalog=True):
+    """Saves every image search to a Parquet scene catalogue and answers from it.
+
+    Args:
+        catalog (SceneCatalog | str | bool, optional): A
+            ``leafagro.catalog.SceneCatalog``, the directory of one, True for the
+            default directory, or None/False to stop using it. Defaults to True.
+
+    Returns:
+        SceneCatalog: The catalogue in use, or None.
+    """
+    global _catalog
+    if catalog is True or isinstance(catalog, str):
+        from .catalog import SceneCatalog
+
+        catalog = SceneCatalog(None if catalog is True else catalog)
+    _catalog = catalog or None
+    return _catalog
+
+
+def get_scene_catalog():
+    """Returns the scene catalogue set by ``set_scene_catalog``, or None."""
+    return _catalog
+
+
+class PolygonRegistry():
+    """The polygons of an Agromonitoring account, indexed by Id.
+
+    The ``/polygons`` list is downloaded once and kept in a dict, so looking a
+    polygon up is O(1). The list is reloaded when older than ``max_age``, and
+    polygons created after the last load are fetched one by one on lookup.
+
+    Args:
+        API_Key (str): Agromonitoring API Key.
+        max_age (float, optional): Seconds before the polygon list is reloaded.
+            Defaults to 3600.
+    """
+
+    def __init__(self, API_Key, max_age=3600):
+        self.API_Key = API_Key
+        self.max_age = max_age
+        self._polygons = {}
+        self._loaded = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self._polygons)
+
+    def __contains__(self, polygon_id):
+        return self.get(polygon_id) is not None
+
+    def _fetch(self, path):
+        response = get_client().get(f"{API_URL}/{path}?appid={self.API_Key}")
+        if response.status_code == 200:
+            return response.json()
+        print(f"Error fetching {path}: {response.status_code}")
+        return None
+
+    def _ensure_loaded(self):
+        if self._loaded is None or time.monotonic() - self._loaded > self.max_age:
+            self.refresh()
+
+    def refresh(self):
+        """Reloads the polygon list, replacing only the polygons that changed.
+
+        Returns:
+            bool: True if the list was reloaded.
+        """
+        polygons = self._fetch("polygons")
+        if not isinstance(polygons, list):
+            return False
+        latest = {polygon.get('id'): polygon for polygon in polygons}
+        with self._lock:
+            for polygon_id in list(self._polygons):
+                if polygon_id not in latest:
+                    del self._polygons[polygon_id]
+            for polygon_id, polygon in latest.items():
+                if self._polygons.get(polygon_id) != polygon:
+                    self._polygons[polygon_id] = polygon
+            self._loaded = time.monotonic()
+        return True
+
+    def ids(self):
+        """Returns the Ids of all polygons of the account.
+
+        Returns:
+            list: The polygon Ids.
+        """
+        self._ensure_loaded()
+        return list(self._polygons)
+
+    def get(self, polygon_id):
+        """Returns a polygon of the account.
+
+        Args:
+            polygon_id (str): The polygon Id.
+
+        Returns:
+            dict: The polygon as returned by the API, or None if it does not exist.
+        """
+        self._ensure_loaded()
+        polygon = self._polygons.get(polygon_id)
+        if polygon is None:
+            polygon = self._fetch(f"polygons/{polygon_id}")
+            if isinstance(polygon, dict) and polygon.get('id') == polygon_id:
+                with self._lock:
+                    self._polygons[polygon_id] = polygon
+            else:
+                polygon = None
+        return polygon
+
+    def geometry(self, polygon_id):
+        """Returns the GeoJSON Feature of a polygon.
+
+        Args:
+            polygon_id (str): The polygon Id.
+
+        Returns:
+            dict: The GeoJSON of the polygon, or None if it does not exist.
+        """
+        polygon = self.get(polygon_id)
+        if polygon is None:
+            return None
+        return polygon.get('geo_json')
+
+
+def get_polygon_registry(API_Key):
+    """Returns the shared polygon registry of an account.
+
+    Args:
+        API_Key (str): Agromonitoring API Key.
+
+    Returns:
+        PolygonRegistry: The registry of the account's polygons.
+    """
+    with _registries_lock:
+        registry = _registries.get(API_Key)
+        if registry is None:
+            registry = _registries[API_Key] = PolygonRegistry(API_Key)
+    return registry
+
 
 class Agromonitoring():
+    @perf.timed("agromonitoring.get_tile")
     def get_agromonitoring_tile(API_Key,PolygonId,StartDate,EndDate,data):
 
         """Get the tile from Agromonitoring
@@ -13,41 +369,23 @@ class Agromonitoring():
             PolygonId (str): Polygon Id created in Agromonitor (Area of Interest)
             StartDate (str): Provide the date of starting from (format ex."YYYY-MM-DD")
             EndDate (str): Provide the date of till last search (format ex."YYYY-MM-DD")
-            data (str): Data to retrieve from Agromonitoring. Available data ["truecolor", "falsecolor", "ndvi", "evi", "evi2", "nri", "dswi", "ndwi"] 
+            data (str): Data to retrieve from Agromonitoring. Available data
+                ["truecolor", "falsecolor", "ndvi", "evi", "evi2", "nri", "dswi",
+                "ndwi"]
         """
-        dates = []
-        data_files = []
-        allowed = ["truecolor", "falsecolor", "ndvi", "evi", "evi2", "nri", "dswi", "ndwi"]
-        if data in allowed:
-            start_date = int(time.mktime(time.strptime(StartDate, '%Y-%m-%d')))
-            end_date = int(time.mktime(time.strptime(EndDate, '%Y-%m-%d')))
-
-            url = f"http://api.agromonitoring.com/agro/1.0/image/search?start={start_date}&end={end_date}&polyid={PolygonId}&appid={API_Key}"
-            response = requests.get(url)
-
-                    # Check if the response is successful
-            if response.status_code == 200:  
-                    response_json = response.json()  # Try to parse as JSON
-                    for entry in response_json:
-                                # Convert UNIX timestamp to human-readable date
-                        dt = entry['dt']
-                        date_str = datetime.utcfromtimestamp(dt).strftime('%Y-%m-%d')
-
-                                # Print the date
-                        dates.append(date_str)
-
-                                # add the tile URLs
-                        data_files.append(entry["tile"][data])
-                    df = pd.DataFrame({'Date': dates, 'URL': data_files})
-                    pd.set_option('display.max_colwidth', None)
-                    return df
-            else:
-                    print(f"Error: API request failed with status code {response.status_code}")
-                    print(f"Response content: {response.content}")
+        import pandas as pd
+
+        if data in ALLOWED_DATA:
+            search = search_images(API_Key, PolygonId, StartDate, EndDate)
+            if search is not None:
+                df = search.urls(data, "tile")
+                pd.set_option('display.max_colwidth', None)
+                return df
         else:
             print(f"The given data is not available in Agromonitoring")
             return None
-    
+
+    @perf.timed("agromonitoring.get_stat")
     def get_agromonitoring_stat(API_Key,PolygonId,StartDate,EndDate,data):
 
         """Get the Statistics from Agromonitoring
@@ -57,38 +395,106 @@ class Agromonitoring():
             PolygonId (str): Polygon Id created in Agromonitoring (Area of Interest)
             StartDate (str): Provide the date of starting from (format ex."YYYY-MM-DD")
             EndDate (str): Provide the date of till last search (format ex."YYYY-MM-DD")
-            data (str): Data to retrieve from Agromonitoring. Available data ["truecolor", "falsecolor", "ndvi", "evi", "evi2", "nri", "dswi", "ndwi"] 
+            data (str): Data to retrieve from Agromonitoring. Available data
+                ["truecolor", "falsecolor", "ndvi", "evi", "evi2", "nri", "dswi",
+                "ndwi"]
         """
-        dates = []
-        data_files = []
-        allowed = ["truecolor", "falsecolor", "ndvi", "evi", "evi2", "nri", "dswi", "ndwi"]
-        if data in allowed:
-            start_date = int(time.mktime(time.strptime(StartDate, '%Y-%m-%d')))
-            end_date = int(time.mktime(time.strptime(EndDate, '%Y-%m-%d')))
-
-            url = f"http://api.agromonitoring.com/agro/1.0/image/search?start={start_date}&end={end_date}&polyid={PolygonId}&appid={API_Key}"
-            response = requests.get(url)
-
-                    # Check if the response is successful
-            if response.status_code == 200:  
-                    response_json = response.json()  # Try to parse as JSON
-                    for entry in response_json:
-                                # Convert UNIX timestamp to human-readable date
-                        dt = entry['dt']
-                        date_str = datetime.utcfromtimestamp(dt).strftime('%Y-%m-%d')
-
-                                # Print the date
-                        dates.append(date_str)
-
-                                # add the tile URLs
-                        data_files.append(entry["stats"][data])
-                    df = pd.DataFrame({'Date': dates, 'URL': data_files})
-                    pd.set_option('display.max_colwidth', None)
-                    return df
-            else:
-                    print(f"Error: API request failed with status code {response.status_code}")
-                    print(f"Response content: {response.content}")
+        import pandas as pd
+
+        if data in ALLOWED_DATA:
+            search = search_images(API_Key, PolygonId, StartDate, EndDate)
+            if search is not None:
+                df = search.urls(data, "stats")
+                pd.set_option('display.max_colwidth', None)
+                return df
         else:
             return None
 
-    
\ No newline at end of file
+    def get_agromonitoring_scenes(API_Key, PolygonId, StartDate, EndDate):
+        """Get the metadata and all URLs of the scenes of a polygon
+
+        Args:
+            API_Key (str): Agromonitoring API Key.
+            PolygonId (str): Polygon Id created in Agromonitoring (Area of Interest)
+            StartDate (str): Provide the date of starting from (format ex."YYYY-MM-DD")
+            EndDate (str): Provide the date of till last search (format ex."YYYY-MM-DD")
+
+        Returns:
+            pd.DataFrame: One row per scene, see ``ImageSearch.dataframe``.
+        """
+        import pandas as pd
+
+        search = search_images(API_Key, PolygonId, StartDate, EndDate)
+        if search is None:
+            return None
+        pd.set_option('display.max_colwidth', None)
+        return search.dataframe
+
+    @perf.timed("agromonitoring.batch")
+    def get_agromonitoring_batch(
+        API_Key, PolygonIds, StartDate, EndDate, data, source="tile", max_workers=8
+    ):
+        """Get the tiles or statistics of several polygons from Agromonitoring
+
+        The image search requests are sent concurrently, at most ``max_workers``
+        at a time, through the shared client (see ``leafagro.client``), so the
+        overall rate still follows the API quota configured on that client.
+
+        Args:
+            API_Key (str): Agromonitoring API Key.
+            PolygonIds (list): Polygon Ids created in Agromonitoring (Areas of Interest)
+            StartDate (str): Provide the date of starting from (format ex."YYYY-MM-DD")
+            EndDate (str): Provide the date of till last search (format ex."YYYY-MM-DD")
+            data (str | list): One or more products to retrieve, e.g.
+                ["ndvi", "evi", "ndwi"]. Available data ["truecolor", "falsecolor",
+                "ndvi", "evi", "evi2", "nri", "dswi", "ndwi"]
+            source (str, optional): "tile" for tile URLs or "stats" for statistics
+                URLs. Defaults to "tile".
+            max_workers (int, optional): Maximum number of concurrent requests.
+                Defaults to 8.
+
+        Returns:
+            pd.DataFrame: One row per (Polygon, Date, Product) with its URL.
+        """
+        import pandas as pd
+
+        if isinstance(data, str):
+            data = [data]
+        unknown = [product for product in data if product not in ALLOWED_DATA]
+        if unknown:
+            print(f"The given data is not available in Agromonitoring: {unknown}")
+            return None
+        if source not in ("tile", "stats"):
+            raise ValueError("source must be either 'tile' or 'stats'.")
+
+        PolygonIds = list(dict.fromkeys(PolygonIds))
+        workers = max(1, min(max_workers, len(PolygonIds)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            searches = list(executor.map(
+                lambda polygon: search_images(API_Key, polygon, StartDate, EndDate),
+                PolygonIds,
+            ))
+
+        frames = []
+        for search in searches:
+            if search is None or len(search) == 0:
+                continue
+            df = search.dataframe
+            for product in data:
+                column = f"{source}_{product}"
+                frames.append(pd.DataFrame({
+                    'Polygon': df['Polygon'],
+                    'Date': df['Date'],
+                    'Product': product,
+                    'URL': df[column] if column in df else None,
+                }))
+
+        if frames:
+            df = pd.concat(frames, ignore_index=True)
+        else:
+            df = pd.DataFrame(columns=['Polygon', 'Date', 'Product', 'URL'])
+        df = df.sort_values(
+            ['Polygon', 'Date', 'Product'], kind='stable', ignore_index=True
+        )
+        pd.set_option('display.max_colwidth', None)
+        return df
@@ -0,0 +1,268 @@
+"""The cache module contains a persistent on-disk cache for Agromonitoring API responses.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+# Time to live in seconds of each API endpoint. Stats of a past scene never
+# change, searches may gain new scenes and polygons may be edited.
+DEFAULT_TTL = {
+    "image/search": 24 * 3600,
+    "stats": 30 * 24 * 3600,
+    "polygons": 3600,
+}
+
+
+# Paths of the JSON API and of the stats URLs that searches return
+# (``/stats/1.0/<hash>/<polygon id>``).
+API_PATH = "/agro/1.0/"
+STATS_PATH = "/stats/1.0/"
+
+
+def default_cache_dir():
+    """Returns the directory used for cached data.
+
+    The location can be set with the ``LEAFAGRO_CACHE_DIR`` environment
+    variable and defaults to ``~/.cache/leafagro``.
+
+    Returns:
+        str: The cache directory.
+    """
+    return os.environ.get(
+        "LEAFAGRO_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "leafagro")
+    )
+
+
+def endpoint_of(url):
+    """Returns the API endpoint of a URL, e.g. "image/search", "stats" or "polygons".
+
+    Args:
+        url (str): The requested URL.
+
+    Returns:
+        str: The endpoint name.
+    """
+    path = urlparse(url).path
+    if STATS_PATH in path:
+        return "stats"
+    if API_PATH in path:
+        path = path.split(API_PATH, 1)[1]
+    segments = [segment for segment in path.split("/") if segment]
+    if not segments:
+        return ""
+    if segments[0] == "image" and len(segments) > 1:
+        return "image/" + segments[1]
+    return segments[0]
+
+
+class CachedResponse:
+    """A cached API response.
+
+    Args:
+        content (bytes): The response body.
+        etag (str): The ETag header of the response, if any.
+        last_modified (str): The Last-Modified header of the response, if any.
+        stored (float): When the response was stored or last revalidated.
+    """
+
+    def __init__(self, content, etag, last_modified, stored):
+        self.content = content
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored = stored
+
+
+class DiskCache:
+    """A size-bounded SQLite cache of API responses with per-endpoint TTLs.
+
+    Entries are keyed by a hash of the URL, so API keys are never stored in
+    clear. When the total size exceeds ``max_bytes`` the least recently used
+    entries are evicted.
+
+    Args:
+        path (str, optional): The SQLite file. Defaults to "responses.sqlite" in ``default_cache_dir()``.
+        ttl (dict, optional): TTL in seconds per endpoint, merged over ``DEFAULT_TTL``. Defaults to None.
+        default_ttl (float, optional): TTL of endpoints missing from ``ttl``. Defaults to 3600.
+        max_bytes (int, optional): Maximum total size of the cached bodies. Defaults to 256 MB.
+    """
+
+    def __init__(self, path=None, ttl=None, default_ttl=3600, max_bytes=256 * 1024**2):
+        if path is None:
+            path = os.path.join(default_cache_dir(), "responses.sqlite")
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.ttl = dict(DEFAULT_TTL)
+        if ttl:
+            self.ttl.update(ttl)
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, endpoint TEXT, body BLOB, etag TEXT, "
+            "last_modified TEXT, stored REAL, accessed REAL, size INTEGER)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _key(url):
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def accepts(self, url):
+        """Checks whether a URL is an API call that should be cached.
+
+        Only the JSON endpoints under ``/agro/1.0/`` and the stats under
+        ``/stats/1.0/`` are cached, map tiles and images are not.
+
+        Args:
+            url (str): The requested URL.
+
+        Returns:
+            bool: True if the response of the URL is cached.
+        """
+        path = urlparse(url).path
+        return API_PATH in path or STATS_PATH in path
+
+    def ttl_for(self, url):
+        """Returns the time to live of a URL in seconds.
+
+        Args:
+            url (str): The requested URL.
+
+        Returns:
+            float: The TTL of the URL's endpoint.
+        """
+        return self.ttl.get(endpoint_of(url), self.default_ttl)
+
+    def get(self, url):
+        """Returns the cached response of a URL, fresh or not.
+
+        Args:
+            url (str): The requested URL.
+
+        Returns:
+            CachedResponse: The cached response, or None if the URL is not cached.
+        """
+        key = self._key(url)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, etag, last_modified, stored FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+        return CachedResponse(*row)
+
+    def is_fresh(self, url, entry):
+        """Checks whether a cached response is still within its TTL.
+
+        Args:
+            url (str): The requested URL.
+            entry (CachedResponse): The cached response.
+
+        Returns:
+            bool: True if the entry can be served without revalidation.
+        """
+        return time.time() - entry.stored < self.ttl_for(url)
+
+    def set(self, url, content, etag=None, last_modified=None):
+        """Stores the response of a URL and evicts old entries if needed.
+
+        Args:
+            url (str): The requested URL.
+            content (bytes): The response body.
+            etag (str, optional): The ETag header. Defaults to None.
+            last_modified (str, optional): The Last-Modified header. Defaults to None.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self._key(url),
+                    endpoint_of(url),
+                    content,
+                    etag,
+                    last_modified,
+                    now,
+                    now,
+                    len(content),
+                ),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def touch(self, url):
+        """Marks a cached response as revalidated now.
+
+        Args:
+            url (str): The requested URL.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE responses SET stored = ?, accessed = ? WHERE key = ?",
+                (now, now, self._key(url)),
+            )
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY accessed ASC"
+        ).fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+
+    def size(self):
+        """Returns the number of entries and their total size in bytes.
+
+        Returns:
+            tuple: (entries, bytes)
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+
+    def clear(self, endpoint=None):
+        """Removes cached responses.
+
+        Args:
+            endpoint (str, optional): Only remove this endpoint, e.g. "polygons". Defaults to None (everything).
+        """
+        with self._lock:
+            if endpoint is None:
+                self._conn.execute("DELETE FROM responses")
+            else:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE endpoint = ?", (endpoint,)
+                )
+            self._conn.commit()
+
+    def close(self):
+        """Closes the SQLite connection."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,290 @@
+"""The catalog module keeps every Agromonitoring image search in a partitioned Parquet dataset.
+"""
+
+import json
+import os
+import threading
+import uuid
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+from .agromonitoring import (
+    ALLOWED_DATA,
+    URL_SOURCES,
+    ImageSearch,
+    _end_timestamp,
+    _to_timestamp,
+)
+from .cache import default_cache_dir
+
+URL_COLUMNS = [f"{source}_{product}" for source in URL_SOURCES for product in ALLOWED_DATA]
+SCENE_COLUMNS = ["Polygon", "Date", "dt", "Satellite", "Cloud", "Coverage"] + URL_COLUMNS
+PARTITIONS = ["Polygon", "year"]
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise ImportError("Please install pyarrow package")
+    return pyarrow
+
+
+def _schema(pa):
+    fields = [
+        ("Polygon", pa.string()),
+        ("Date", pa.string()),
+        ("dt", pa.int64()),
+        ("Satellite", pa.string()),
+        ("Cloud", pa.float64()),
+        ("Coverage", pa.float64()),
+    ]
+    fields += [(column, pa.string()) for column in URL_COLUMNS]
+    fields.append(("year", pa.int32()))
+    return pa.schema(fields)
+
+
+class SceneCatalog():
+    """A local catalogue of Agromonitoring scenes stored as Parquet.
+
+    Scenes are partitioned by polygon and year (hive layout), so a query for
+    some polygons and dates only opens their files, and the filters on date,
+    cloud and coverage are pushed down to the Parquet row groups. The date
+    ranges that were searched are recorded too, so a search already covered
+    by the catalogue is answered without calling the API.
+
+    Args:
+        path (str, optional): Directory of the dataset. Defaults to "catalog" in ``default_cache_dir()``.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(default_cache_dir(), "catalog")
+        self.scenes_path = os.path.join(self.path, "scenes")
+        self.searches_path = os.path.join(self.path, "searches.json")
+        self._lock = threading.Lock()
+        os.makedirs(self.scenes_path, exist_ok=True)
+
+    def __repr__(self):
+        return f"SceneCatalog(path={self.path!r})"
+
+    # Searched ranges ------------------------------------------------------
+
+    def _load_searches(self):
+        if not os.path.exists(self.searches_path):
+            return {}
+        with open(self.searches_path) as f:
+            return json.load(f)
+
+    def _record_search(self, polygon_id, start_date, end_date):
+        first, last = _whole_days(start_date, end_date)
+        # Scenes of the last days may still be processed, so they are never considered covered.
+        last = min(last, date.today() - timedelta(days=1))
+        if last < first:
+            return
+        with self._lock:
+            searches = self._load_searches()
+            ranges = searches.get(polygon_id, []) + [[first.isoformat(), last.isoformat()]]
+            searches[polygon_id] = _merge_ranges(ranges)
+            partial = f"{self.searches_path}.{uuid.uuid4().hex}"
+            with open(partial, "w") as f:
+                json.dump(searches, f)
+            os.replace(partial, self.searches_path)
+
+    def covers(self, polygon_id, start_date, end_date):
+        """Tells whether a search was already made for a polygon and dates.
+
+        Args:
+            polygon_id (str): The polygon Id.
+            start_date (str): Start date ("YYYY-MM-DD"), included.
+            end_date (str): End date ("YYYY-MM-DD"), included.
+
+        Returns:
+            bool: True if every date of the range is in the catalogue.
+        """
+        first = _utc_day(_to_timestamp(start_date)).isoformat()
+        last = _utc_day(_end_timestamp(end_date)).isoformat()
+        with self._lock:
+            ranges = self._load_searches().get(polygon_id, [])
+        return any(start <= first and last <= end for start, end in ranges)
+
+    # Scenes ---------------------------------------------------------------
+
+    def add(self, search):
+        """Appends the scenes of a search that are not in the catalogue yet.
+
+        Args:
+            search (ImageSearch): The search result.
+
+        Returns:
+            int: The number of scenes written.
+        """
+        pa = _pyarrow()
+        df = search.dataframe
+        if len(df):
+            known = self.query(
+                polygons=search.polygon_id,
+                start=int(df['dt'].min()),
+                end=int(df['dt'].max()),
+                columns=['dt', 'Satellite'],
+            )
+            if len(known):
+                seen = set(zip(known['dt'], known['Satellite']))
+                df = df[[(dt, satellite) not in seen for dt, satellite in zip(df['dt'], df['Satellite'])]]
+        if len(df):
+            df = df.reindex(columns=SCENE_COLUMNS)
+            df = df.assign(year=pd.to_datetime(df['dt'], unit='s').dt.year.astype('int32'))
+            table = pa.Table.from_pandas(df, schema=_schema(pa), preserve_index=False)
+            with self._lock:
+                pa.dataset.write_dataset(
+                    table,
+                    self.scenes_path,
+                    format="parquet",
+                    partitioning=self._partitioning(pa),
+                    basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+                    existing_data_behavior="overwrite_or_ignore",
+                )
+        self._record_search(search.polygon_id, search.start_date, search.end_date)
+        return len(df)
+
+    def _partitioning(self, pa):
+        schema = _schema(pa)
+        return pa.dataset.partitioning(pa.schema([schema.field(name) for name in PARTITIONS]), flavor="hive")
+
+    def dataset(self):
+        """Returns the scenes as a ``pyarrow.dataset.Dataset``.
+
+        Returns:
+            pyarrow.dataset.Dataset: The dataset.
+        """
+        pa = _pyarrow()
+        return pa.dataset.dataset(self.scenes_path, schema=_schema(pa), format="parquet", partitioning=self._partitioning(pa))
+
+    def query(self, polygons=None, start=None, end=None, max_cloud=None, min_coverage=None, satellites=None, columns=None):
+        """Reads the scenes matching some filters.
+
+        Only the partitions of the requested polygons and years are opened,
+        and the other filters are applied while reading.
+
+        Args:
+            polygons (str | list, optional): Polygon Ids. Defaults to all of them.
+            start (str | int, optional): First date ("YYYY-MM-DD") or timestamp. Defaults to None.
+            end (str | int, optional): Last date ("YYYY-MM-DD", inclusive) or timestamp. Defaults to None.
+            max_cloud (float, optional): Maximum cloud cover in %. Defaults to None.
+            min_coverage (float, optional): Minimum data coverage in %. Defaults to None.
+            satellites (str | list, optional): Satellite names, e.g. "s2" or "l8". Defaults to None.
+            columns (list, optional): Columns to read. Defaults to all of them.
+
+        Returns:
+            pd.DataFrame: The matching scenes sorted by polygon and date.
+        """
+        pa = _pyarrow()
+        field = pa.dataset.field
+        filters = []
+        if polygons is not None:
+            polygons = [polygons] if isinstance(polygons, str) else list(polygons)
+            filters.append(field("Polygon").isin(polygons))
+        if start is not None:
+            start = _to_timestamp(start)
+            filters.append(field("year") >= datetime.utcfromtimestamp(start).year)
+            filters.append(field("dt") >= start)
+        if end is not None:
+            end = _end_timestamp(end)
+            filters.append(field("year") <= datetime.utcfromtimestamp(end).year)
+            filters.append(field("dt") <= end)
+        if max_cloud is not None:
+            filters.append(field("Cloud") <= max_cloud)
+        if min_coverage is not None:
+            filters.append(field("Coverage") >= min_coverage)
+        if satellites is not None:
+            satellites = [satellites] if isinstance(satellites, str) else list(satellites)
+            filters.append(field("Satellite").isin(satellites))
+
+        expression = None
+        for condition in filters:
+            expression = condition if expression is None else expression & condition
+        if columns is None:
+            columns = SCENE_COLUMNS
+        df = self.dataset().to_table(columns=list(columns), filter=expression).to_pandas()
+        sort = [column for column in ('Polygon', 'dt') if column in df]
+        if sort:
+            df = df.sort_values(sort, ignore_index=True)
+        return df
+
+    def urls(self, data, source="tile", **filters):
+        """Returns the dates and URLs of one product from the catalogue.
+
+        Args:
+            data (str): The product, e.g. "ndvi".
+            source (str, optional): One of "tile", "stats", "image" or "data". Defaults to "tile".
+            **filters: The filters of ``query``.
+
+        Returns:
+            pd.DataFrame: The Polygon, Date and URL of every matching scene.
+        """
+        column = f"{source}_{data}"
+        if column not in URL_COLUMNS:
+            raise ValueError(f"Unknown product {data!r} or source {source!r}")
+        df = self.query(columns=['Polygon', 'Date', 'dt', column], **filters)
+        return df.drop(columns='dt').rename(columns={column: 'URL'})
+
+    def search(self, polygon_id, start_date, end_date):
+        """Rebuilds an image search from the catalogue.
+
+        Args:
+            polygon_id (str): The polygon Id.
+            start_date (str): Start date ("YYYY-MM-DD").
+            end_date (str): End date ("YYYY-MM-DD").
+
+        Returns:
+            ImageSearch: The scenes, or None if the range was never searched.
+        """
+        if not self.covers(polygon_id, start_date, end_date):
+            return None
+        df = self.query(polygons=polygon_id, start=start_date, end=end_date)
+        return ImageSearch(polygon_id, start_date, end_date, _rows_to_scenes(df))
+
+
+def _rows_to_scenes(df):
+    """Converts catalogue rows back to the JSON entries of the image search API."""
+    scenes = []
+    for row in df.to_dict('records'):
+        entry = {'dt': int(row['dt']), 'type': row['Satellite'], 'cl': row['Cloud'], 'dc': row['Coverage']}
+        for source in URL_SOURCES:
+            urls = {product: row[f"{source}_{product}"] for product in ALLOWED_DATA if pd.notna(row.get(f"{source}_{product}"))}
+            if urls:
+                entry[source] = urls
+        scenes.append(entry)
+    return scenes
+
+
+def _utc_day(timestamp):
+    return datetime.utcfromtimestamp(timestamp).date()
+
+
+def _whole_days(start_date, end_date):
+    """Returns the first and last days fully inside a searched range, in UTC.
+
+    Dates include their whole day. A range given as timestamps only covers
+    the days it spans from midnight to midnight.
+    """
+    start = _to_timestamp(start_date)
+    end = _end_timestamp(end_date) + 1
+    first = _utc_day(start) + timedelta(days=1 if start % 86400 else 0)
+    last = _utc_day(end) - timedelta(days=1)
+    return first, last
+
+
+def _merge_ranges(ranges):
+    """Merges overlapping or adjacent [start, end] date ranges."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged:
+            following = (date.fromisoformat(merged[-1][1]) + timedelta(days=1)).isoformat()
+            if start <= following:
+                merged[-1][1] = max(merged[-1][1], end)
+                continue
+        merged.append([start, end])
+    return merged
@@ -0,0 +1,377 @@
+"""The change module tracks how an index changes between consecutive scenes of
+each polygon.
+"""
+
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from . import perf
+from .agromonitoring import ALLOWED_DATA, search_images
+from .catalog import _pyarrow
+from .client import get_client
+from .raster import _check_rasterio, band_math
+
+SUMMARY_COLUMNS = [
+    "PreviousDate",
+    "Days",
+    "pixels",
+    "mean_change",
+    "std_change",
+    "min_change",
+    "max_change",
+    "loss_pct",
+    "gain_pct",
+]
+
+
+class _ChangeSummary:
+    """Accumulates the statistics of a change raster block by block."""
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.count = 0
+        self.total = 0.0
+        self.squares = 0.0
+        self.minimum = np.inf
+        self.maximum = -np.inf
+        self.loss = 0
+        self.gain = 0
+        self._lock = threading.Lock()
+
+    def add(self, values):
+        values = values[np.isfinite(values)].astype("float64")
+        if values.size == 0:
+            return
+        part = (
+            values.size,
+            values.sum(),
+            np.dot(values, values),
+            values.min(),
+            values.max(),
+            int((values < -self.threshold).sum()),
+            int((values > self.threshold).sum()),
+        )
+        with self._lock:
+            self.count += part[0]
+            self.total += part[1]
+            self.squares += part[2]
+            self.minimum = min(self.minimum, part[3])
+            self.maximum = max(self.maximum, part[4])
+            self.loss += part[5]
+            self.gain += part[6]
+
+    def result(self):
+        if self.count == 0:
+            return {"pixels": 0}
+        mean = self.total / self.count
+        return {
+            "pixels": self.count,
+            "mean_change": mean,
+            "std_change": float(
+                np.sqrt(max(self.squares / self.count - mean * mean, 0.0))
+            ),
+            "min_change": self.minimum,
+            "max_change": self.maximum,
+            "loss_pct": 100 * self.loss / self.count,
+            "gain_pct": 100 * self.gain / self.count,
+        }
+
+
+class ChangeDetector():
+    """Computes the change of an index between consecutive scenes, one at a time.
+
+    For every polygon only the index raster of the latest processed scene is
+    kept. ``update`` searches the scenes after it, downloads their index
+    rasters and writes the difference with the previous scene as a
+    Cloud-Optimized GeoTIFF, computed block by block on a thread pool, along
+    with a per-field summary. A daily run therefore only processes the new
+    scenes, whatever the length of the history.
+
+    Outputs, per polygon, under ``directory/<polygon>/``:
+
+    - ``changes/<previous date>_<date>.tif``: the change rasters (current - previous);
+    - ``changes.parquet``: one summary row per change raster;
+    - ``state.json`` and ``latest.tif``: the latest processed scene.
+
+    Args:
+        directory (str): The output directory.
+        data (str, optional): The index product, e.g. "ndvi". Defaults to "ndvi".
+        threshold (float, optional): Change counted as loss (below -threshold) or
+            gain (above threshold). Defaults to 0.1.
+        max_cloud (float, optional): Skip scenes with a cloud cover above this
+            percentage. Defaults to None.
+        blocksize (int, optional): Block size in pixels. Defaults to 512.
+        max_workers (int, optional): Number of threads per change raster. Defaults
+            to the number of CPUs.
+    """
+
+    def __init__(
+        self,
+        directory,
+        data="ndvi",
+        threshold=0.1,
+        max_cloud=None,
+        blocksize=512,
+        max_workers=None,
+    ):
+        if data not in ALLOWED_DATA or data in ("truecolor", "falsecolor"):
+            raise ValueError(f"{data!r} is not an index product of Agromonitoring.")
+        # The summaries are written as Parquet: fail before any download, not after.
+        _pyarrow()
+        self.directory = directory
+        self.data = data
+        self.threshold = threshold
+        self.max_cloud = max_cloud
+        self.blocksize = blocksize
+        self.max_workers = max_workers
+        os.makedirs(directory, exist_ok=True)
+
+    def __repr__(self):
+        return f"ChangeDetector(directory={self.directory!r}, data={self.data!r})"
+
+    def _path(self, polygon_id, *parts):
+        return os.path.join(self.directory, polygon_id, *parts)
+
+    def state(self, polygon_id):
+        """Returns the latest processed scene of a polygon.
+
+        Args:
+            polygon_id (str): The polygon Id.
+
+        Returns:
+            dict: The Date, dt and Satellite of the scene, or None if the polygon
+                was never updated.
+        """
+        path = self._path(polygon_id, "state.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def _save_state(self, polygon_id, state):
+        path = self._path(polygon_id, "state.json")
+        partial = f"{path}.{uuid.uuid4().hex}"
+        with open(partial, "w") as f:
+            json.dump(state, f)
+        os.replace(partial, path)
+
+    @perf.timed("change.update")
+    def update(self, API_Key, PolygonId, EndDate, StartDate=None):
+        """Processes the scenes of a polygon that are newer than the latest one.
+
+        The search includes both dates, so a scene taken on ``EndDate`` is
+        processed by this run. The next run searches again from the date of
+        the latest processed scene and skips the scenes up to it.
+
+        Args:
+            API_Key (str): Agromonitoring API Key.
+            PolygonId (str): Polygon Id created in Agromonitoring (Area of Interest)
+            EndDate (str): Provide the date of till last search (format ex."YYYY-MM-DD")
+            StartDate (str, optional): Provide the date of starting from (format
+                ex."YYYY-MM-DD"), only used on the first update. Defaults to None.
+
+        Returns:
+            pd.DataFrame: The summaries of the new change rasters, or None if the
+                search failed.
+        """
+        state = self.state(PolygonId)
+        if state is not None:
+            StartDate = state["Date"]
+        elif StartDate is None:
+            raise ValueError(
+                f"StartDate is required for the first update of polygon {PolygonId}."
+            )
+
+        search = search_images(API_Key, PolygonId, StartDate, EndDate)
+        if search is None:
+            return None
+        scenes = search.dataframe
+        column = f"data_{self.data}"
+        if len(scenes) and column in scenes:
+            scenes = scenes[scenes[column].notna()]
+            if state is not None:
+                scenes = scenes[scenes['dt'] > state["dt"]]
+            if self.max_cloud is not None:
+                scenes = scenes[scenes['Cloud'].fillna(0) <= self.max_cloud]
+            scenes = scenes.sort_values('dt')
+        else:
+            scenes = scenes.iloc[0:0]
+
+        os.makedirs(self._path(PolygonId, "changes"), exist_ok=True)
+        rows = []
+        for scene in scenes.to_dict('records'):
+            current = self._download(PolygonId, scene[column])
+            if current is None:
+                break
+            latest = self._path(PolygonId, "latest.tif")
+            if state is not None and os.path.exists(latest):
+                rows.append(self._compare(PolygonId, state, scene, latest, current))
+                # Saved before the state moves on, so an interrupted run never
+                # loses a summary.
+                self._append_summaries(PolygonId, _summary_frame(rows[-1:]))
+            os.replace(current, latest)
+            state = {
+                "Date": scene['Date'],
+                "dt": int(scene['dt']),
+                "Satellite": scene['Satellite'],
+            }
+            self._save_state(PolygonId, state)
+        return _summary_frame(rows)
+
+    def update_many(self, API_Key, PolygonIds, EndDate, StartDate=None, max_workers=4):
+        """Updates several polygons concurrently.
+
+        Args:
+            API_Key (str): Agromonitoring API Key.
+            PolygonIds (list): Polygon Ids created in Agromonitoring (Areas of Interest)
+            EndDate (str): Provide the date of till last search (format ex."YYYY-MM-DD")
+            StartDate (str, optional): Start date of the polygons that were never
+                updated. Defaults to None.
+            max_workers (int, optional): Number of polygons processed at once.
+                Defaults to 4.
+
+        Returns:
+            pd.DataFrame: The summaries of the new change rasters of every polygon.
+        """
+        import pandas as pd
+
+        PolygonIds = list(dict.fromkeys(PolygonIds))
+        workers = max(1, min(max_workers, len(PolygonIds)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            frames = list(
+                executor.map(
+                    lambda polygon: self.update(API_Key, polygon, EndDate, StartDate),
+                    PolygonIds,
+                )
+            )
+        frames = [frame for frame in frames if frame is not None]
+        if not frames:
+            return None
+        frames = [frame for frame in frames if len(frame)] or frames[:1]
+        return pd.concat(frames).sort_index()
+
+    def summaries(self, PolygonIds=None):
+        """Reads the summaries of every change raster computed so far.
+
+        Args:
+            PolygonIds (list, optional): Polygon Ids. Defaults to every polygon of
+                the directory.
+
+        Returns:
+            pd.DataFrame: Summary columns indexed by (Polygon, Product, Date).
+        """
+        import pandas as pd
+
+        if PolygonIds is None:
+            PolygonIds = sorted(os.listdir(self.directory))
+        paths = (self._path(polygon, "changes.parquet") for polygon in PolygonIds)
+        frames = [pd.read_parquet(path) for path in paths if os.path.exists(path)]
+        if not frames:
+            return None
+        return pd.concat(frames).sort_index()
+
+    def _append_summaries(self, polygon_id, df):
+        import pandas as pd
+
+        path = self._path(polygon_id, "changes.parquet")
+        if os.path.exists(path):
+            df = pd.concat([pd.read_parquet(path), df])
+            df = df[~df.index.duplicated(keep="last")]
+        partial = f"{path}.{uuid.uuid4().hex}"
+        df.sort_index().to_parquet(partial)
+        os.replace(partial, path)
+
+    def _download(self, polygon_id, url):
+        response = get_client().get(url)
+        if response.status_code != 200:
+            print(
+                f"Error: {self.data} data request for polygon {polygon_id} failed "
+                f"with status code {response.status_code}"
+            )
+            return None
+        path = self._path(polygon_id, f"download-{uuid.uuid4().hex}.tif")
+        with open(path, "wb") as f:
+            f.write(response.content)
+        return path
+
+    def _compare(self, polygon_id, state, scene, previous, current):
+        _check_rasterio()
+        summary = _ChangeSummary(self.threshold)
+
+        def kernel(arrays, out):
+            np.subtract(arrays["current"], arrays["previous"], out=out[0])
+            summary.add(out[0])
+
+        aligned = _align(previous, current)
+        output = self._path(
+            polygon_id, "changes", f"{state['Date']}_{scene['Date']}.tif"
+        )
+        try:
+            band_math(
+                {"current": current, "previous": aligned},
+                kernel,
+                output=output,
+                blocksize=self.blocksize,
+                max_workers=self.max_workers,
+                descriptions=[f"{self.data} change"],
+            )
+        finally:
+            if aligned != previous:
+                os.remove(aligned)
+
+        days = (int(scene['dt']) - state["dt"]) / 86400
+        return dict(
+            {
+                "Polygon": polygon_id,
+                "Product": self.data,
+                "Date": scene['Date'],
+                "PreviousDate": state["Date"],
+                "Days": days,
+            },
+            **summary.result(),
+        )
+
+
+def _summary_frame(rows):
+    """Builds the summary frame of some change rasters."""
+    import pandas as pd
+
+    df = pd.DataFrame(rows, columns=["Polygon", "Product", "Date"] + SUMMARY_COLUMNS)
+    df['Date'] = pd.to_datetime(df['Date'])
+    df['PreviousDate'] = pd.to_datetime(df['PreviousDate'])
+    return df.set_index(["Polygon", "Product", "Date"])
+
+
+def _align(path, reference):
+    """Resamples a raster onto the grid of another one if they differ.
+
+    Consecutive scenes can come from different satellites (e.g. Landsat and
+    Sentinel-2) and so have different grids.
+
+    Returns:
+        str: ``path`` if the grids match, else the path of the resampled raster.
+    """
+    import rasterio
+    from rasterio.enums import Resampling
+    from rasterio.warp import reproject
+
+    with rasterio.open(path) as src, rasterio.open(reference) as ref:
+        grid = (src.crs, src.transform, src.width, src.height)
+        if grid == (ref.crs, ref.transform, ref.width, ref.height):
+            return path
+        profile = dict(ref.profile, count=1, dtype="float32", nodata=np.nan)
+        output = f"{path}.aligned.tif"
+        with rasterio.open(output, "w", **profile) as dst:
+            reproject(
+                rasterio.band(src, 1),
+                rasterio.band(dst, 1),
+                src_nodata=src.nodata,
+                dst_nodata=np.nan,
+                resampling=Resampling.bilinear,
+            )
+    return output
@@ -0,0 +1,374 @@
+"""The cli module is the ``leafagro`` command, which extracts Agromonitoring data without Jupyter.
+
+Example::
+
+    leafagro extract --api-key KEY --polygons polygons.txt \\
+        --start 2023-01-01 --end 2023-12-31 --products ndvi evi \\
+        --rasters --index "ndvi_evi=(ndvi - evi)" --output out --workers 4
+
+writes ``out/stats/<polygon>.parquet`` (a Parquet dataset of the stats of
+every polygon, product and date) and, with ``--rasters``, one
+Cloud-Optimized GeoTIFF per scene in ``out/rasters/<polygon>/``. Progress is
+saved to ``out/checkpoint.json`` after every polygon, so running the same
+command again only processes the polygons that are missing or failed.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from . import __version__
+
+# Products with index values: the stats and data of the other ones are images.
+INDEX_PRODUCTS = ["ndvi", "evi", "evi2", "nri", "dswi", "ndwi"]
+CHECKPOINT = "checkpoint.json"
+
+
+def read_polygons(values):
+    """Reads polygon Ids from the command line.
+
+    Args:
+        values (list): Polygon Ids, or files with one Id per line ("#" starts a comment, "-" reads stdin).
+
+    Returns:
+        list: The unique polygon Ids, in order.
+    """
+    polygons = []
+    for value in values:
+        if value == "-" or os.path.isfile(value):
+            lines = sys.stdin.read().splitlines() if value == "-" else open(value).read().splitlines()
+            polygons += [line.split("#")[0].strip() for line in lines]
+        else:
+            polygons.append(value)
+    return list(dict.fromkeys(polygon for polygon in polygons if polygon))
+
+
+def parse_indices(values):
+    """Parses ``NAME=FORMULA`` index definitions.
+
+    Args:
+        values (list): The definitions, whose formulas use product names, e.g. "ndvi_evi=ndvi - evi".
+
+    Returns:
+        dict: Index name to ``leafagro.indices.Expression``.
+    """
+    from .indices import Expression
+
+    indices = {}
+    for value in values or []:
+        name, sep, formula = value.partition("=")
+        if not sep or not name.strip() or not formula.strip():
+            raise ValueError(f"Invalid index {value!r}, expected NAME=FORMULA")
+        expression = Expression(formula.strip())
+        unknown = [band for band in expression.bands if band not in INDEX_PRODUCTS]
+        if unknown:
+            raise ValueError(f"Index {name!r} uses unknown products {unknown}, available: {INDEX_PRODUCTS}")
+        indices[name.strip()] = expression
+    return indices
+
+
+class Checkpoint():
+    """The polygons a run has processed, saved to JSON after each of them.
+
+    A checkpoint only applies to the options it was made with: when they
+    change, the run starts over.
+
+    Args:
+        path (str): The JSON file.
+        options (dict): The options that determine the outputs.
+    """
+
+    def __init__(self, path, options):
+        self.path = path
+        self.options = options
+        self.done = {}
+        self.failed = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            if state.get("options") == options:
+                self.done = state.get("done", {})
+            else:
+                print(f"Options changed since the last run, ignoring {path}", file=sys.stderr)
+
+    def __contains__(self, polygon_id):
+        return polygon_id in self.done
+
+    def record(self, polygon_id, result=None, error=None):
+        """Saves the outcome of one polygon.
+
+        Args:
+            polygon_id (str): The polygon Id.
+            result (dict, optional): The summary of a processed polygon. Defaults to None.
+            error (str, optional): The error of a failed polygon. Defaults to None.
+        """
+        if error is None:
+            self.done[polygon_id] = result
+            self.failed.pop(polygon_id, None)
+        else:
+            self.failed[polygon_id] = error
+        state = {"options": self.options, "done": self.done, "failed": self.failed}
+        partial = f"{self.path}.{uuid.uuid4().hex}"
+        with open(partial, "w") as f:
+            json.dump(state, f, indent=1)
+        os.replace(partial, self.path)
+
+
+def _init_worker(api_url, calls_per_minute):
+    """Configures the Agromonitoring client of a worker process."""
+    from . import agromonitoring
+    from .client import AgroClient, set_client
+
+    if api_url:
+        agromonitoring.API_URL = api_url
+    set_client(AgroClient(calls_per_minute=calls_per_minute or None))
+
+
+def process_polygon(options, polygon_id):
+    """Extracts the stats and rasters of one polygon.
+
+    This is the unit of work of a run. Every output is written to a
+    temporary name first, so an interrupted polygon leaves no partial file.
+
+    Args:
+        options (dict): The run options, see ``run_options``.
+        polygon_id (str): The polygon Id.
+
+    Returns:
+        dict: The number of scenes, stats rows and rasters written.
+    """
+    from .agromonitoring import search_images
+
+    search = search_images(options["api_key"], polygon_id, options["start"], options["end"])
+    if search is None:
+        raise RuntimeError("image search failed")
+    result = {"scenes": len(search), "stats": 0, "rasters": 0}
+    if len(search) == 0:
+        return result
+    if options["products"]:
+        result["stats"] = _write_stats(options, polygon_id)
+    if options["rasters"]:
+        result["rasters"] = _write_rasters(options, search)
+    return result
+
+
+def _write_stats(options, polygon_id):
+    from .stats import get_stats_batch
+
+    df = get_stats_batch(
+        options["api_key"], [polygon_id], options["start"], options["end"], options["products"], options["threads"]
+    )
+    if df is None:
+        raise RuntimeError("stats request failed")
+    directory = os.path.join(options["output"], "stats")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{polygon_id}.parquet")
+    partial = f"{path}.partial"
+    df.reset_index().to_parquet(partial, index=False)
+    os.replace(partial, path)
+    return len(df)
+
+
+def _write_rasters(options, search):
+    import numpy as np
+
+    from .client import get_client
+    from .indices import Expression
+    from .raster import band_math
+
+    indices = {name: Expression(formula) for name, formula in options["indices"].items()}
+    needed = list(dict.fromkeys(options["products"] + [band for e in indices.values() for band in e.bands]))
+    names = options["products"] + list(indices)
+    if not names:
+        return 0
+
+    directory = os.path.join(options["output"], "rasters", search.polygon_id)
+    os.makedirs(directory, exist_ok=True)
+    df = search.dataframe
+    written = 0
+    for row in df.to_dict("records"):
+        path = os.path.join(directory, f"{row['Date']}_{row['Satellite']}.tif")
+        urls = [row.get(f"data_{product}") for product in needed]
+        if os.path.exists(path) or any(not isinstance(url, str) for url in urls):
+            continue
+
+        scratch = tempfile.mkdtemp(prefix="leafagro-")
+        try:
+            inputs = {}
+            for product, response in zip(needed, get_client().get_many(urls, max_workers=options["threads"])):
+                if response.status_code != 200:
+                    raise RuntimeError(f"{product} data request failed with status code {response.status_code}")
+                inputs[product] = os.path.join(scratch, f"{product}.tif")
+                with open(inputs[product], "wb") as f:
+                    f.write(response.content)
+
+            def kernel(arrays, out):
+                for i, product in enumerate(options["products"]):
+                    out[i] = arrays[product]
+                for i, expression in enumerate(indices.values(), len(options["products"])):
+                    expression.evaluate(arrays, out=out[i])
+                out[~np.isfinite(out)] = np.nan
+
+            partial = f"{path}.partial"
+            band_math(
+                {product: (inputs[product], 1) for product in needed},
+                kernel,
+                output=partial,
+                count=len(names),
+                descriptions=names,
+                max_workers=options["threads"],
+            )
+            os.replace(partial, path)
+            written += 1
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+    return written
+
+
+def run_options(args):
+    """Returns the options of a run from the parsed arguments."""
+    return {
+        "api_key": args.api_key,
+        "start": args.start,
+        "end": args.end,
+        "products": list(dict.fromkeys(args.products)),
+        "indices": {name: e.formula for name, e in parse_indices(args.index).items()},
+        "rasters": args.rasters,
+        "output": os.path.abspath(args.output),
+        "threads": args.threads,
+    }
+
+
+def extract(args):
+    """Runs the ``extract`` command.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments.
+
+    Returns:
+        int: The exit status, 1 if some polygons failed.
+    """
+    if not args.api_key:
+        raise ValueError("An API key is required: use --api-key or the LEAFAGRO_API_KEY environment variable.")
+    if args.index and not args.rasters:
+        raise ValueError("--index requires --rasters.")
+    # Checked before any API call: the stats are written as Parquet.
+    from .catalog import _pyarrow
+
+    _pyarrow()
+    options = run_options(args)
+    polygons = read_polygons(args.polygons)
+    if not polygons:
+        raise ValueError("No polygon Ids given.")
+
+    os.makedirs(options["output"], exist_ok=True)
+    checkpoint_options = {key: value for key, value in options.items() if key not in ("api_key", "threads")}
+    checkpoint = Checkpoint(os.path.join(options["output"], CHECKPOINT), checkpoint_options)
+    if args.restart:
+        checkpoint.done = {}
+    todo = [polygon for polygon in polygons if polygon not in checkpoint]
+    log = (lambda message: None) if args.quiet else (lambda message: print(message, file=sys.stderr, flush=True))
+    log(f"{len(polygons)} polygons, {len(polygons) - len(todo)} already done, {len(todo)} to process")
+
+    # The quota is shared by the whole run, so every worker gets its part of it.
+    calls_per_minute = args.calls_per_minute and max(1, args.calls_per_minute // args.workers)
+    started = time.perf_counter()
+    totals = {"scenes": 0, "stats": 0, "rasters": 0}
+
+    def completed(i, polygon, result, error):
+        if error is None:
+            checkpoint.record(polygon, result)
+            for key in totals:
+                totals[key] += result[key]
+            status = f"{result['scenes']} scenes, {result['stats']} stats, {result['rasters']} rasters"
+        else:
+            checkpoint.record(polygon, error=error)
+            status = f"FAILED: {error}"
+        elapsed = time.perf_counter() - started
+        eta = elapsed / i * (len(todo) - i)
+        log(f"[{i}/{len(todo)}] {polygon}: {status} ({elapsed:.0f}s elapsed, ~{eta:.0f}s left)")
+
+    if args.workers == 1:
+        _init_worker(args.api_url, calls_per_minute)
+        for i, polygon in enumerate(todo, 1):
+            try:
+                result, error = process_polygon(options, polygon), None
+            except Exception as e:
+                result, error = None, f"{type(e).__name__}: {e}"
+            completed(i, polygon, result, error)
+    else:
+        with ProcessPoolExecutor(
+            max_workers=args.workers, initializer=_init_worker, initargs=(args.api_url, calls_per_minute)
+        ) as executor:
+            futures = {executor.submit(process_polygon, options, polygon): polygon for polygon in todo}
+            for i, future in enumerate(as_completed(futures), 1):
+                error = future.exception()
+                result = None if error is not None else future.result()
+                completed(i, futures[future], result, error and f"{type(error).__name__}: {error}")
+
+    log(
+        f"Done in {time.perf_counter() - started:.0f}s: {totals['scenes']} scenes, {totals['stats']} stats, "
+        f"{totals['rasters']} rasters, {len(checkpoint.failed)} failed polygons. Outputs in {options['output']}"
+    )
+    return 1 if checkpoint.failed else 0
+
+
+def build_parser():
+    """Returns the argument parser of the ``leafagro`` command."""
+    parser = argparse.ArgumentParser(prog="leafagro", description="Analyze agriculture data from the Agromonitoring API.")
+    parser.add_argument("--version", action="version", version=f"%(prog)s {__version__}")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser(
+        "extract",
+        help="Extract stats and index rasters of many polygons.",
+        description="Extract the stats (Parquet) and index rasters (COG) of many polygons in parallel.",
+    )
+    p.add_argument("--api-key", default=os.environ.get("LEAFAGRO_API_KEY"), help="Agromonitoring API key. Defaults to $LEAFAGRO_API_KEY.")
+    p.add_argument("--polygons", nargs="+", required=True, metavar="ID|FILE", help="Polygon Ids, or files with one Id per line ('-' for stdin).")
+    p.add_argument("--start", required=True, help="Start date (YYYY-MM-DD).")
+    p.add_argument("--end", required=True, help="End date (YYYY-MM-DD).")
+    p.add_argument("--products", nargs="*", default=["ndvi"], choices=INDEX_PRODUCTS, help="Index products. Defaults to ndvi.")
+    p.add_argument("--rasters", action="store_true", help="Also write one COG per scene with a band per product and index.")
+    p.add_argument("--index", action="append", metavar="NAME=FORMULA", help="A local index computed from the products, e.g. 'diff=ndvi - evi'. Repeatable.")
+    p.add_argument("--output", "-o", default="leafagro-output", help="Output directory. Defaults to ./leafagro-output.")
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of worker processes. Defaults to the number of CPUs.")
+    p.add_argument("--threads", type=int, default=8, help="Concurrent requests and raster threads per worker. Defaults to 8.")
+    p.add_argument("--calls-per-minute", type=int, default=60, help="API quota shared by all workers, 0 for none. Defaults to 60.")
+    p.add_argument("--api-url", help="Base URL of the Agromonitoring API. Defaults to the public API.")
+    p.add_argument("--restart", action="store_true", help="Ignore the checkpoint and process every polygon again.")
+    p.add_argument("--quiet", "-q", action="store_true", help="Do not report progress.")
+    p.set_defaults(func=extract)
+    return parser
+
+
+def main(argv=None):
+    """Entry point of the ``leafagro`` command.
+
+    Args:
+        argv (list, optional): The arguments. Defaults to ``sys.argv[1:]``.
+
+    Returns:
+        int: The exit status.
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, "workers", 1) < 1:
+        parser.error("--workers must be at least 1")
+    try:
+        return args.func(args)
+    except (ValueError, ImportError) as e:
+        parser.error(str(e))
+    except KeyboardInterrupt:
+        print("Interrupted, run the same command again to resume.", file=sys.stderr)
+        return 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+"""The client module contains the shared HTTP layer used to talk to the Agromonitoring API.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import perf
+from .cache import DiskCache
+
+API_URL = "http://api.agromonitoring.com/agro/1.0"
+
+# Status codes worth retrying: quota exceeded and transient server errors.
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class RateLimiter:
+    """A thread-safe token bucket that limits the number of calls per period.
+
+    Args:
+        calls (int, optional): Number of calls allowed per period. Defaults to 60.
+        period (float, optional): Length of the period in seconds. Defaults to 60.
+    """
+
+    def __init__(self, calls=60, period=60.0):
+        self.calls = calls
+        self.period = period
+        self._tokens = float(calls)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a call is allowed by the quota."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                refill = (now - self._updated) * self.calls / self.period
+                self._tokens = min(self.calls, self._tokens + refill)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) * self.period / self.calls
+            time.sleep(wait)
+
+
+class AgroClient:
+    """A pooled HTTP client for the Agromonitoring API.
+
+    All requests share one ``requests.Session`` so TCP connections are reused,
+    are retried with exponential backoff on 429/5xx responses and go through a
+    rate limiter that follows the Agromonitoring quota (60 calls per minute on
+    the free plan).
+
+    Args:
+        timeout (float | tuple, optional): Connect and read timeout in seconds. Defaults to (5, 30).
+        retries (int, optional): Number of retries for failed requests. Defaults to 3.
+        backoff_factor (float, optional): Backoff factor between retries. Defaults to 0.5.
+        calls_per_minute (int, optional): API quota; None disables rate limiting. Defaults to 60.
+        pool_size (int, optional): Maximum number of pooled connections. Defaults to 32.
+        cache (DiskCache | bool, optional): On-disk response cache, True for the default one. Defaults to None.
+        offline (bool, optional): Serve API responses only from the cache and never use the network. Defaults to False.
+    """
+
+    def __init__(
+        self,
+        timeout=(5, 30),
+        retries=3,
+        backoff_factor=0.5,
+        calls_per_minute=60,
+        pool_size=32,
+        cache=None,
+        offline=False,
+    ):
+        if cache is True:
+            cache = DiskCache()
+        if offline and cache is None:
+            raise ValueError("Offline mode requires a cache.")
+        self.cache = cache or None
+        self.offline = offline
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.rate_limiter = RateLimiter(calls_per_minute) if calls_per_minute else None
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS,
+            allowed_methods=frozenset(["GET"]),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get(self, url, params=None, **kwargs):
+        """Sends a GET request through the pooled session.
+
+        API responses are served from the cache while fresh. Stale entries
+        are revalidated with If-None-Match/If-Modified-Since. In offline mode
+        no request is sent: any URL that is not cached, including tiles and
+        images, gets a 504 response.
+
+        Args:
+            url (str): The URL to request.
+            params (dict, optional): Query parameters. Defaults to None.
+
+        Returns:
+            requests.Response: The response of the request.
+        """
+        with perf.span("http.get") as span:
+            response = self._get(url, params, **kwargs)
+            span.response(response)
+        return response
+
+    def _get(self, url, params=None, **kwargs):
+        if params:
+            url = requests.Request("GET", url, params=params).prepare().url
+        cache = self.cache if self.cache is not None and self.cache.accepts(url) else None
+
+        cached = cache.get(url) if cache is not None else None
+        if cached is not None and (self.offline or cache.is_fresh(url, cached)):
+            return _cached_response(url, cached.content)
+        if self.offline:
+            return _offline_response(url)
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        if cached is not None:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        kwargs.setdefault("timeout", self.timeout)
+        response = self.session.get(url, headers=headers, **kwargs)
+
+        if cache is not None:
+            if cached is not None and response.status_code == 304:
+                cache.touch(url)
+                return _cached_response(url, cached.content)
+            if response.status_code == 200:
+                cache.set(
+                    url,
+                    response.content,
+                    response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"),
+                )
+        return response
+
+    def get_many(self, urls, max_workers=8):
+        """Sends GET requests for several URLs concurrently.
+
+        Args:
+            urls (list): The URLs to request.
+            max_workers (int, optional): Maximum number of concurrent requests. Defaults to 8.
+
+        Returns:
+            list: The responses, in the same order as the URLs.
+        """
+        urls = list(urls)
+        if not urls:
+            return []
+        max_workers = max(1, min(max_workers, self.pool_size, len(urls)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(self.get, urls))
+
+    def close(self):
+        """Closes the pooled connections and the cache."""
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+
+
+def _cached_response(url, content):
+    """Builds a ``requests.Response`` from a cached body."""
+    response = requests.Response()
+    response.status_code = 200
+    response.reason = "OK"
+    response.url = url
+    response.encoding = "utf-8"
+    response.headers["X-Leafagro-Cache"] = "hit"
+    response._content = content
+    return response
+
+
+def _offline_response(url):
+    """Builds the response returned for uncached URLs in offline mode."""
+    response = requests.Response()
+    response.status_code = 504
+    response.reason = "Gateway Timeout"
+    response.url = url
+    response.headers["X-Leafagro-Cache"] = "miss"
+    response._content = b"Not available in the cache (offline mode)"
+    return response
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Returns the shared Agromonitoring client, creating it on first use.
+
+    Returns:
+        AgroClient: The shared client.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = AgroClient()
+    return _client
+
+
+def set_client(client):
+    """Replaces the shared Agromonitoring client.
+
+    Args:
+        client (AgroClient): The client used by every Agromonitoring call.
+    """
+    global _client
+    with _client_lock:
+        if _client is not None and _client is not client:
+            _client.close()
+        _client = client
@@ -1,26 +1,166 @@
+import os
+import shutil
+
 import folium
 
+# File marking a directory of tiles written by add_raster, which may be replaced.
+TILES_MARKER = ".leafagro-tiles"
+
 
 class Map(folium.Map):
 
     def __init__(self, center=[20,0],zoom=2, **kwargs):
         super().__init__(location=center, zoom_start=zoom, **kwargs)
 
-    def add_raster(self, data, name="raster", **kwargs):
+    def add_layer_tile(self, url, name, **kwargs):
+        """Adds a tile layer to the map.
+
+        Args:
+            url (str): The XYZ URL template, or the path of a local .mbtiles file (e.g. from ``leafagro.tiles.harvest``).
+            name (str): The name of the layer.
+        """
+        if url.endswith(".mbtiles") and os.path.exists(url):
+            from leafagro.tiles import MBTilesSource
+            from leafagro.tileserver import get_tile_server
+
+            source = MBTilesSource(url)
+            _, url = get_tile_server().register(source)
+            kwargs.setdefault("max_native_zoom", source.max_zoom)
+
+        kwargs.setdefault("attr", name)
+        kwargs.setdefault("overlay", True)
+        layer = folium.TileLayer(tiles=url, name=name, **kwargs)
+        layer.add_to(self)
+
+    def add_raster(self, data, name="raster", static=None, tiles_dir=None, max_size=2048, zooms=None, **kwargs):
         """Add the Raster in map
 
+        By default tiles are served by the session's shared tile server (see
+        ``leafagro.tileserver``), which reuses open datasets and caches rendered
+        tiles, so they only show while the Python session runs. For maps
+        exported to HTML, render the raster statically instead:
+
+        - ``static="image"`` embeds one overview image of at most ``max_size``
+          pixels in the HTML, which is enough for fields and small scenes.
+        - ``static="tiles"`` writes a PNG tile pyramid to ``tiles_dir``, to be
+          kept next to the HTML, which suits large rasters.
+
+        Static rendering reads the raster through the raster store (see
+        ``leafagro.store``) and colors it with a colormap lookup table.
+
+        Args:
+            data (str | list | Mosaic): Path to the raster file, paths of the rasters of a mosaic, or a mosaic (see ``leafagro.mosaic``).
+            name (str, optional): The name of the layer. Defaults to "raster".
+            static (str, optional): None, "image" or "tiles". Defaults to None.
+            tiles_dir (str, optional): Directory of the tiles, relative to where the HTML will be saved. It must be new, empty or written earlier by add_raster, whose tiles are then replaced. Defaults to "<name>_tiles".
+            max_size (int, optional): Longest side of the overview image in pixels. Defaults to 2048.
+            zooms (int | range | list, optional): Zoom levels of the tiles. Defaults to the raster's zoom range.
+            **kwargs: Rendering options (indexes, colormap, vmin, vmax, nodata, stretch, expression) and folium layer options.
+        """
+        from leafagro.mosaic import Mosaic, MosaicSource
+        from leafagro.store import StoreSource, RasterStore, get_raster_store
+        from leafagro.tileserver import RasterSource, get_tile_server, split_style
+
+        if static not in (None, "image", "tiles"):
+            raise ValueError("static must be None, 'image' or 'tiles'.")
+        style, kwargs = split_style(kwargs)
+        kwargs.setdefault("attr", "Raster file served by leafagro")
+        kwargs.setdefault("overlay", True)
+        kwargs.setdefault("max_zoom", 30)
+
+        mosaic = None
+        if isinstance(data, (list, Mosaic)):
+            mosaic = MosaicSource(data if isinstance(data, Mosaic) else Mosaic(data), style)
+
+        if static is None:
+            source = mosaic or RasterSource(data, style)
+            _, url = get_tile_server().register(source)
+            folium.TileLayer(tiles=url, name=name, **kwargs).add_to(self)
+            return
+
+        if mosaic is not None:
+            source = mosaic
+        elif StoreSource.supports(style):
+            source = StoreSource((get_raster_store() or RasterStore()).open(data), style)
+        elif static == "tiles":
+            source = RasterSource(data, style)
+            source.load_metadata(get_tile_server())
+        else:
+            raise ValueError(f"static='image' only supports the {StoreSource.STYLE_KEYS} options.")
+        west, south, east, north = source.bounds
+        bounds = [[south, west], [north, east]]
+
+        if static == "image":
+            import base64
+
+            png, bounds = source.overview(max_size)
+            url = "data:image/png;base64," + base64.b64encode(png).decode("ascii")
+            kwargs.pop("max_zoom")
+            kwargs.pop("attr")
+            folium.raster_layers.ImageOverlay(image=url, bounds=bounds, name=name, **kwargs).add_to(self)
+        else:
+            from leafagro.tiles import render_tiles
+
+            if tiles_dir is None:
+                tiles_dir = f"{name}_tiles"
+            if zooms is None:
+                zooms = range(source.min_zoom, source.max_zoom + 1)
+            zooms = [zooms] if isinstance(zooms, int) else list(zooms)
+            _prepare_tiles_dir(tiles_dir)
+            render_tiles(source, tiles_dir, zooms)
+            kwargs.setdefault("max_native_zoom", max(zooms))
+            kwargs.setdefault("min_zoom", min(zooms))
+            url = tiles_dir.replace(os.sep, "/") + "/{z}/{x}/{y}.png"
+            folium.TileLayer(tiles=url, name=name, bounds=bounds, **kwargs).add_to(self)
+        self.fit_bounds(bounds)
+
+    def add_geojson(self, data, name="geojson", topojson=False, precision=None, quantization=1e5, **kwargs):
+        """Adds a GeoJSON layer to the map.
+
+        The data is embedded in the HTML. It can be made compact by rounding
+        the coordinates to ``precision`` decimals or, with ``topojson=True``,
+        by encoding it as TopoJSON, which stores the border shared by two
+        adjacent fields once and is much smaller for dense field maps.
+
         Args:
-            data (_type_): _description_
-            name (str, optional): _description_. Defaults to "raster".
-            zoom_to_layer (bool, optional): _description_. Defaults to True.
+            data (str | dict): The GeoJSON data, or the path of a GeoJSON file.
+            name (str, optional): The name of the layer. Defaults to "geojson".
+            topojson (bool, optional): Embed the data as TopoJSON. Defaults to False.
+            precision (int, optional): Decimals kept in the GeoJSON coordinates, e.g. 6 (about 10 cm). Defaults to None (unchanged).
+            quantization (float, optional): Number of grid steps across the TopoJSON data. Defaults to 1e5.
+            **kwargs: folium.GeoJson or folium.TopoJson options (e.g. style_function).
+
+        Returns:
+            folium.GeoJson | folium.TopoJson: The layer.
         """
-        try:
-            from localtileserver import TileClient, get_folium_tile_layer
-        except:
-            raise ImportError("Please install localtileserver package")
+        import json
+        from leafagro.vector import quantize_geojson, to_topojson
 
-        client = TileClient(data)
-        layer = get_folium_tile_layer(client, name=name, **kwargs)
+        if isinstance(data, str):
+            with open(data) as f:
+                data = json.load(f)
+
+        if topojson:
+            layer = folium.TopoJson(
+                to_topojson(data, quantization, name="features"), "objects.features", name=name, **kwargs
+            )
+        else:
+            if precision is not None:
+                data = quantize_geojson(data, precision)
+            layer = folium.GeoJson(data, name=name, **kwargs)
         layer.add_to(self)
+        return layer
+
+
+def _prepare_tiles_dir(tiles_dir):
+    """Empties a tiles directory written earlier by add_raster, or creates a new one.
 
-        
\ No newline at end of file
+    Raises:
+        ValueError: If the directory holds files that add_raster did not write.
+    """
+    if os.path.isdir(tiles_dir) and os.listdir(tiles_dir):
+        if not os.path.exists(os.path.join(tiles_dir, TILES_MARKER)):
+            raise ValueError(f"{tiles_dir!r} is not empty and was not written by add_raster: choose another tiles_dir.")
+        shutil.rmtree(tiles_dir)
+    os.makedirs(tiles_dir, exist_ok=True)
+    open(os.path.join(tiles_dir, TILES_MARKER), "w").close()
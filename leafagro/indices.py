@@ -0,0 +1,177 @@
+"""The indices module evaluates spectral index formulas (NDVI, EVI, SAVI, ...) over raster bands.
+
+Band names used in the formulas:
+
+- B: blue, G: green, R: red, RE: red edge, N: near infrared
+- S1: shortwave infrared 1 (~1.6 um), S2: shortwave infrared 2 (~2.2 um)
+"""
+
+import ast
+
+import numpy as np
+
+from .raster import DEFAULT_NODATA, band_math
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+# Built-in indices, named after the products of the Agromonitoring API where they exist.
+INDICES = {
+    "ndvi": "(N - R) / (N + R)",
+    "evi": "2.5 * (N - R) / (N + 6 * R - 7.5 * B + 1)",
+    "evi2": "2.5 * (N - R) / (N + 2.4 * R + 1)",
+    "ndwi": "(N - S1) / (N + S1)",
+    "nri": "(G - R) / (G + R)",
+    "dswi": "(N + G) / (S1 + R)",
+    "savi": "1.5 * (N - R) / (N + R + 0.5)",
+    "gndvi": "(N - G) / (N + G)",
+    "ndre": "(N - RE) / (N + RE)",
+    "nbr": "(N - S2) / (N + S2)",
+}
+
+FUNCTIONS = {
+    "abs": np.abs,
+    "sqrt": np.sqrt,
+    "exp": np.exp,
+    "log": np.log,
+    "where": np.where,
+}
+
+_ALLOWED_NODES = (
+    ast.Expression,
+    ast.BinOp,
+    ast.UnaryOp,
+    ast.Compare,
+    ast.Call,
+    ast.Name,
+    ast.Load,
+    ast.Constant,
+    ast.Add,
+    ast.Sub,
+    ast.Mult,
+    ast.Div,
+    ast.Pow,
+    ast.USub,
+    ast.UAdd,
+    ast.Gt,
+    ast.GtE,
+    ast.Lt,
+    ast.LtE,
+    ast.Eq,
+    ast.NotEq,
+)
+
+
+class Expression:
+    """A spectral index formula compiled for fast evaluation on band arrays.
+
+    The formula is evaluated as one fused numexpr kernel when numexpr is
+    installed, so no intermediate arrays are allocated, and with NumPy
+    otherwise.
+
+    Args:
+        formula (str): A built-in index name (see ``INDICES``) or a formula such as "2.5*(N-R)/(N+6*R-7.5*B+1)".
+
+    Raises:
+        ValueError: If the formula uses anything else than arithmetic, comparisons and ``FUNCTIONS``.
+    """
+
+    def __init__(self, formula):
+        self.name = formula.lower() if formula.lower() in INDICES else None
+        self.formula = INDICES[self.name] if self.name else formula
+
+        tree = ast.parse(self.formula, mode="eval")
+        names = set()
+        for node in ast.walk(tree):
+            if not isinstance(node, _ALLOWED_NODES):
+                raise ValueError(f"Unsupported syntax in formula: {self.formula}")
+            if isinstance(node, ast.Call):
+                if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS:
+                    raise ValueError(f"Unsupported function in formula: {self.formula}")
+            elif isinstance(node, ast.Name) and node.id not in FUNCTIONS:
+                names.add(node.id)
+        self.bands = sorted(names)
+        self._code = compile(tree, "<index>", "eval")
+
+    def __repr__(self):
+        return f"Expression({self.formula!r})"
+
+    def evaluate(self, arrays, out=None):
+        """Evaluates the formula.
+
+        Args:
+            arrays (dict): Band name to array.
+            out (np.ndarray, optional): Array to write the result to. Defaults to None.
+
+        Returns:
+            np.ndarray: The index values.
+        """
+        missing = [band for band in self.bands if band not in arrays]
+        if missing:
+            raise ValueError(f"Missing bands for {self.formula}: {missing}")
+        local = {band: arrays[band] for band in self.bands}
+
+        if numexpr is not None:
+            return numexpr.evaluate(self.formula, local_dict=local, out=out, casting="unsafe")
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result = eval(self._code, {"__builtins__": {}, **FUNCTIONS}, local)
+        if out is None:
+            return result
+        out[...] = result
+        return out
+
+
+def compute_indices(
+    bands,
+    indices,
+    output=None,
+    nodata=DEFAULT_NODATA,
+    blocksize=512,
+    max_workers=None,
+):
+    """Computes several spectral indices in one pass over the bands.
+
+    Each block of every band is read once and all the indices are evaluated
+    on it, and the result is one multi-band Cloud-Optimized GeoTIFF with a
+    band per index (band descriptions hold the index names).
+
+    Args:
+        bands (dict): Band name (e.g. "N", "R", "B") to path, (path, band) tuple or band object.
+        indices (str | list | dict): Index names or formulas, or a dict of output name to formula.
+        output (str, optional): The GeoTIFF to write. Defaults to a temporary file.
+        nodata (float, optional): Output nodata value. Defaults to -9999.
+        blocksize (int, optional): Block size in pixels. Defaults to 512.
+        max_workers (int, optional): Number of threads. Defaults to the number of CPUs.
+
+    Returns:
+        str: The path of the output raster.
+    """
+    if isinstance(indices, str):
+        indices = [indices]
+    if not isinstance(indices, dict):
+        indices = {index: index for index in indices}
+    expressions = [Expression(formula) for formula in indices.values()]
+
+    needed = sorted({band for expression in expressions for band in expression.bands})
+    missing = [band for band in needed if band not in bands]
+    if missing:
+        raise ValueError(f"Missing bands for the requested indices: {missing}")
+
+    def kernel(arrays, out):
+        for i, expression in enumerate(expressions):
+            expression.evaluate(arrays, out=out[i])
+        out[~np.isfinite(out)] = np.nan
+
+    return band_math(
+        {band: bands[band] for band in needed},
+        kernel,
+        output=output,
+        count=len(expressions),
+        nodata=nodata,
+        blocksize=blocksize,
+        max_workers=max_workers,
+        descriptions=list(indices),
+    )
@@ -1,9 +1,13 @@
+import os
+
 import ipyleaflet
 from ipyleaflet import basemaps, WidgetControl,SplitMapControl
 import ipywidgets as widgets
 from ipywidgets import Output
 from IPython.display import display, HTML
 
+from leafagro import perf
+
 class Map(ipyleaflet.Map):
     """This is the map class that inherits from ipyleaflet.Map.
 
@@ -11,6 +15,7 @@ class Map(ipyleaflet.Map):
         ipyleaflet (Map): The ipyleaflet.Map class.
     """
 
+    @perf.timed("map.init")
     def __init__(self, center=[20, 0], zoom=2, **kwargs):
         """initializing the Map
 
@@ -28,39 +33,194 @@ class Map(ipyleaflet.Map):
         kwargs.pop("add_layer_control", None)
 
         super().__init__(center=center, zoom=zoom, **kwargs)
+        # GeoJSON layers by digest of their data and style, see add_geojson.
+        self._geojson_layers = {}
+        # Layers and controls by key, see add_managed.
+        self._managed = {}
+        self.observe(self._release_tile_sources, names="layers")
         if layer_control_flag:
             self.add_layer_control()
 
         self.add_toolbar()
 
+    def perf_report(self, reset=False):
+        """Summarizes where the time of the session went.
+
+        Instrumentation must be turned on first with ``leafagro.perf.enable()``
+        (or ``LEAFAGRO_PERF=1``). The request counters (requests, bytes, status
+        codes, cache hits) are printed, and the time spent per operation (API
+        calls, JSON parsing, DataFrame building, tile server, raster
+        processing, widgets) is returned.
+
+        Args:
+            reset (bool, optional): Forget the recorded spans and counters afterwards.
+                Defaults to False.
+
+        Returns:
+            pd.DataFrame: calls, total_s, self_s, mean_ms, max_ms, errors and share per
+                operation, slowest first.
+        """
+        if not perf.is_enabled():
+            print(
+                "Instrumentation is off: call leafagro.perf.enable() to record timings."
+            )
+        report = perf.report()
+        counters = perf.counters()
+        if len(counters):
+            print(counters.to_string())
+        if reset:
+            perf.reset()
+        return report
+
+    @perf.timed("map.add_layer_tile")
     def add_layer_tile(self, url, name, **kwargs):
+        """Adds a tile layer to the map.
+
+        Args:
+            url (str): The XYZ URL template, or the path of a local .mbtiles file (e.g.
+                from ``leafagro.tiles.harvest``).
+            name (str): The name of the layer.
+        """
+        source_id = None
+        if url.endswith(".mbtiles") and os.path.exists(url):
+            from leafagro.tiles import MBTilesSource
+            from leafagro.tileserver import get_tile_server
+
+            source = MBTilesSource(url)
+            source_id, url = get_tile_server().register(source)
+            kwargs.setdefault("max_native_zoom", source.max_zoom)
+
         layer = ipyleaflet.TileLayer(url=url, name=name, **kwargs)
+        if source_id is not None:
+            layer.tile_source_id = source_id
         self.add(layer)
 
-    def add_basemap(self, name):
+    def add_basemap(self, name, key=None):
         """
         Adds a basemap to the current map.
 
+        With a ``key``, the basemap replaces the one previously added with the
+        same key, so switching basemaps does not stack tile layers.
+
         Args:
-            name (str or object): The name of the basemap as a string, or an object representing the basemap.
+            name (str or object): The name of the basemap as a string, or an object
+                representing the basemap.
+            key (str, optional): Registry key of the basemap (see ``add_managed``).
+                Defaults to None (the previous basemaps are kept).
 
         Raises:
-            TypeError: If the name is neither a string nor an object representing a basemap.
+            TypeError: If the name is neither a string nor an object representing a
+                basemap.
 
         Returns:
             None
         """
         if isinstance(name, str):
             url = eval(f"basemaps.{name}").build_url()
-            self.add_layer_tile(url, name)
+            layer = ipyleaflet.TileLayer(url=url, name=name)
         else:
-            self.add(name)
+            layer = name
+        if key is None:
+            self.add(layer)
+        else:
+            self.add_managed(layer, key)
+
+    def add_managed(self, item, key):
+        """Adds a layer or control, replacing the previous one with the same key.
+
+        The replaced layer or control is removed from the map and its widgets
+        are closed, so repeated calls (e.g. from a widget callback) keep the
+        number of widgets of a long session constant. The map is synced with
+        the front-end once for the whole replacement.
+
+        Args:
+            item (ipyleaflet.Layer | ipyleaflet.Control): The layer or control.
+            key (str): The registry key.
+
+        Returns:
+            ipyleaflet.Layer | ipyleaflet.Control: The item.
+        """
+        with self.hold_sync():
+            previous = self._managed.get(key)
+            if previous is not None and previous is not item:
+                self._discard(previous)
+            if item not in self.layers and item not in self.controls:
+                self.add(item)
+        self._managed[key] = item
+        return item
+
+    def remove_managed(self, key):
+        """Removes the layer or control added with ``add_managed`` under a key.
+
+        Args:
+            key (str): The registry key.
+        """
+        item = self._managed.pop(key, None)
+        if item is not None:
+            self._discard(item)
+
+    def get_managed(self, key):
+        """Returns the layer or control added under a key if it is still on the map.
+
+        Args:
+            key (str): The registry key.
+
+        Returns:
+            ipyleaflet.Layer | ipyleaflet.Control: The item, or None.
+        """
+        item = self._managed.get(key)
+        if item is not None and (item in self.layers or item in self.controls):
+            return item
+        return None
+
+    def _discard(self, item):
+        """Removes a layer or control from the map and closes its widgets."""
+        if item in self.layers or item in self.controls:
+            self.remove(item)
+        for widget in (getattr(item, "widget", None), item):
+            if widget is None:
+                continue
+            # The layout and style of a widget are widgets of their own.
+            for name in ("layout", "style"):
+                child = getattr(widget, name, None)
+                if isinstance(child, widgets.Widget):
+                    child.close()
+            widget.close()
+
+    def widget_report(self):
+        """Counts the layers, controls and widgets of the session.
+
+        Returns:
+            dict: layers, controls and managed items of the map, live widgets
+            (comms) of the kernel, and the peak memory of the process in MB.
+        """
+        from ipywidgets.widgets import widget
+
+        instances = getattr(widget, "_instances", None)
+        if instances is None:
+            instances = widgets.Widget.widgets
+        try:
+            import resource
+
+            peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        except ImportError:
+            peak_memory = None
+        return {
+            "layers": len(self.layers),
+            "controls": len(self.controls),
+            "managed": sum(
+                1 for key in self._managed if self.get_managed(key) is not None
+            ),
+            "widgets": len(instances),
+            "peak_memory_mb": peak_memory,
+        }
 
     def add_layer_control(self, position='topright'):
         """Adds a layers Control in the map.
 
         Args:
-            position (str, optional): The position the layer control. Defaults to 'topright'.
+            position (str, optional): The position the layer control. Defaults to
+                'topright'.
         """
         has_control = False
         for controls in self.controls:
@@ -71,15 +231,31 @@ class Map(ipyleaflet.Map):
         if not has_control:
             self.add_control(ipyleaflet.LayersControl(position=position))
 
-    def add_geojson(self,data,name='geojson', **kwargs):
+    @perf.timed("map.add_geojson")
+    def add_geojson(
+        self, data, name='geojson', precision=None, deduplicate=False, **kwargs
+    ):
         """Adds a GeoJSON layer to the map.
 
+        Large layers can be made lighter to send to the browser by rounding
+        their coordinates with ``precision``. With ``deduplicate``, adding the
+        same data under the same name and style as a layer already on the
+        map returns that layer instead of a new copy.
+
         Args:
             data (str | dict): The GeoJSON data as a string or a dictionary.
             name (str, optional): The name of the layer. Defaults to "geojson".
+            precision (int, optional): Decimals kept in the coordinates, e.g. 6 (about
+                10 cm). Defaults to None (unchanged).
+            deduplicate (bool, optional): Reuse an identical layer already on the map.
+                Defaults to False.
+
+        Returns:
+            ipyleaflet.GeoJSON: The layer.
         """
 
         import json
+        from leafagro.vector import geojson_digest, quantize_geojson
 
         if isinstance(data,str):
             with open(data) as f:
@@ -91,34 +267,205 @@ class Map(ipyleaflet.Map):
         if 'hover_style' not in kwargs:
             kwargs['hover_style'] = {'fillColor':'blue','fillOpacity': 0.5}
 
+        if precision is not None:
+            data = quantize_geojson(data, precision)
+
+        if deduplicate:
+            digest = geojson_digest({"data": data, "name": name, "options": kwargs})
+            layer = self._geojson_layers.get(digest)
+            if layer is not None and layer in self.layers:
+                print(
+                    f"The layer {name!r} is already on the map with the same data "
+                    "and style."
+                )
+                return layer
+
         layer = ipyleaflet.GeoJSON(data=data,name=name, **kwargs)
 
         self.add(layer)
+        if deduplicate:
+            self._geojson_layers[digest] = layer
+        return layer
     
+    @perf.timed("map.add_shp")
     def add_shp(self, data, name='Shapefile', **kwargs):
         """
         Adds a shapefile to the current map.
 
         Args:
-            data (str or dict): The path to the shapefile as a string, or a dictionary representing the shapefile.
+            data (str or dict): The path to the shapefile as a string (loaded with
+                ``add_vector``), or a dictionary representing the shapefile.
             name (str, optional): The name of the layer. Defaults to "shp".
-            **kwargs: Arbitrary keyword arguments.
+            **kwargs: Arbitrary keyword arguments. The geometries are sent unchanged
+                unless ``simplify=True`` is given (see ``add_vector``).
 
         Raises:
-            TypeError: If the data is neither a string nor a dictionary representing a shapefile.
+            TypeError: If the data is neither a string nor a dictionary representing a
+                shapefile.
 
         Returns:
             None
         """
 
-        import shapefile
-        import json
-
         if isinstance(data, str):
-            with shapefile.Reader(data) as shp:
-                data = shp.__geo_interface__
+            kwargs.setdefault("simplify", False)
+            self.add_vector(data, name, **kwargs)
+            return
 
         self.add_geojson(data, name, **kwargs)
+
+    @perf.timed("map.add_vector")
+    def add_vector(
+        self,
+        data,
+        name="vector",
+        bbox=None,
+        simplify=True,
+        zoom=None,
+        columns=None,
+        where=None,
+        chunk_size=10000,
+        **kwargs,
+    ):
+        """Adds a large vector layer (shapefile, GeoJSON, GeoPackage, ...) to the map.
+
+        The file is streamed in chunks through pyogrio, and each chunk is
+        filtered by ``bbox``, simplified for the zoom level and converted to
+        GeoJSON as it is read, so only one chunk is held as a GeoDataFrame and
+        only the detail visible on the map is sent to the browser. The
+        geometries are simplified for one zoom level: zooming in further
+        shows them at that level of detail.
+
+        Args:
+            data (str | GeoDataFrame): The path of the vector file, or a GeoDataFrame.
+            name (str, optional): The name of the layer. Defaults to "vector".
+            bbox (tuple, optional): Only load features intersecting (west, south, east,
+                north) in lon/lat. Defaults to None.
+            simplify (bool, optional): Simplify the geometries for the zoom level.
+                Defaults to True.
+            zoom (int, optional): The zoom level to simplify for. Defaults to the larger
+                of the map's current zoom and the zoom at which the layer fits the map.
+            columns (list, optional): Attribute columns to load. Defaults to all of
+                them.
+            where (str, optional): An SQL WHERE clause on the attributes, e.g.
+                "area > 1". Defaults to None.
+            chunk_size (int, optional): Features read at once. Defaults to 10000.
+            **kwargs: ipyleaflet.GeoJSON options, as for ``add_geojson``.
+        """
+        from leafagro import vector
+
+        if isinstance(data, str):
+            if simplify and zoom is None:
+                bounds = bbox or vector.layer_bounds(data)
+                zoom = int(self.zoom)
+                if bounds:
+                    zoom = max(zoom, vector.fit_zoom(bounds))
+            zoom = zoom if simplify else None
+            chunks = vector.iter_vector(
+                data,
+                bbox=bbox,
+                columns=columns,
+                where=where,
+                chunk_size=chunk_size,
+                zoom=zoom,
+            )
+            features = []
+            for chunk in chunks:
+                features.extend(vector.to_geojson(chunk)["features"])
+            geojson = {"type": "FeatureCollection", "features": features}
+            self.add_geojson(geojson, name, **kwargs)
+            return
+
+        gdf = data.to_crs(vector.WGS84) if data.crs is not None else data
+        if simplify and zoom is None and len(gdf):
+            zoom = max(int(self.zoom), vector.fit_zoom(bbox or gdf.total_bounds))
+        zoom = zoom if simplify else None
+        if columns is not None:
+            gdf = gdf[list(columns) + [gdf.geometry.name]]
+        if bbox is not None:
+            gdf = gdf.cx[bbox[0]:bbox[2], bbox[1]:bbox[3]]
+        if zoom is not None:
+            gdf = vector.simplify_for_zoom(gdf, zoom)
+        self.add_geojson(vector.to_geojson(gdf), name, **kwargs)
+
+    @perf.timed("map.add_vector_tiles")
+    def add_vector_tiles(
+        self,
+        data,
+        name="vector tiles",
+        style=None,
+        hover_style=None,
+        columns=None,
+        bbox=None,
+        where=None,
+        zoom_to_layer=True,
+        **kwargs,
+    ):
+        """Adds a large vector layer to the map as vector tiles.
+
+        Unlike ``add_geojson``, the features are not stored in the widget: the
+        session's shared tile server (see ``leafagro.tileserver``) cuts them
+        into Mapbox Vector Tiles, so only the features visible at the current
+        zoom reach the browser. The layer is released when it is removed from
+        the map.
+
+        Args:
+            data (str | GeoDataFrame): The path of a vector file, or a GeoDataFrame.
+            name (str, optional): The name of the layer. Defaults to "vector tiles".
+            style (dict, optional): Style of the features. Defaults to the style of
+                ``add_geojson``.
+            hover_style (dict, optional): Style of the feature under the mouse. Defaults
+                to the hover style of ``add_geojson``.
+            columns (list, optional): Attribute columns to include in the tiles.
+                Defaults to all of them.
+            bbox (tuple, optional): Only serve features intersecting (west, south, east,
+                north) in lon/lat. Defaults to None.
+            where (str, optional): An SQL WHERE clause on the attributes of a file.
+                Defaults to None.
+            zoom_to_layer (bool, optional): Zoom the map to the layer. Defaults to True.
+            **kwargs: ipyleaflet.VectorTileLayer options.
+        """
+        from leafagro.tileserver import get_tile_server
+        from leafagro.vector import FEATURE_ID, VectorTileSource, fit_zoom
+
+        if style is None:
+            style = {'color': 'blue', 'weight': 1, 'fillOpacity': 0}
+        if hover_style is None:
+            hover_style = {'fillColor': 'blue', 'fillOpacity': 0.5}
+        style = {'fill': True, **style}
+
+        source = VectorTileSource(data, columns=columns, bbox=bbox, where=where)
+        source_id, url = get_tile_server().register(source)
+
+        kwargs.setdefault("max_zoom", source.max_zoom)
+        layer = ipyleaflet.VectorTileLayer(
+            url=url,
+            name=name,
+            layer_styles={source.layer_name: style},
+            interactive=True,
+            feature_id=FEATURE_ID,
+            **kwargs,
+        )
+        layer.tile_source_id = source_id
+
+        def handle_hover(widget, content, buffers):
+            if content.get("event") != "interaction":
+                return
+            feature = (content.get("properties") or {}).get(FEATURE_ID)
+            if feature is None:
+                return
+            if content.get("type") == "mouseover":
+                layer.set_feature_style(feature, {**style, **hover_style})
+            elif content.get("type") == "mouseout":
+                layer.reset_feature_style(feature)
+
+        if hover_style:
+            layer.on_msg(handle_hover)
+        self.add(layer)
+
+        if zoom_to_layer and len(source):
+            self.center = source.center
+            self.zoom = fit_zoom(source.bounds)
     
     def add_imageOverlay(self, url, bounds, name="image", **kwargs):
         """Overlays the image on the map
@@ -126,80 +473,153 @@ class Map(ipyleaflet.Map):
         Args:
             urls (str): The URL of image in String
             bounds (list): The bounds of the image to Overlay on map
-            name (str, Optional): The name of the overlaying image, Default is "image".  
+            name (str, Optional): The name of the overlaying image, Default is "image".
         """
         layer = ipyleaflet.ImageOverlay(url=url, bounds=bounds, name=name, **kwargs)
         self.add(layer)
     
+    @perf.timed("map.add_raster")
     def add_raster(self, data, name="raster", zoom_to_layer=True, **kwargs):
         """Add the Raster in map
 
+        Tiles are served by the session's shared tile server (see
+        ``leafagro.tileserver``), which reuses open datasets and caches rendered
+        tiles. The raster is released when its layer is removed from the map.
+        When a raster store is set (see ``leafagro.store.set_raster_store``),
+        tiles using only indexes, colormap, vmin and vmax are rendered from its
+        memory-mapped overviews instead.
+
+        A list of rasters, e.g. the scenes covering a large farm, or a
+        ``leafagro.mosaic.Mosaic`` is shown as one layer, each tile being
+        warped from the rasters it overlaps.
+
         Args:
-            data (_type_): _description_
-            name (str, optional): _description_. Defaults to "raster".
-            zoom_to_layer (bool, optional): _description_. Defaults to True.
+            data (str | list | Mosaic): Path to the raster file, paths of the rasters of
+                a mosaic, or a mosaic.
+            name (str, optional): The name of the layer. Defaults to "raster".
+            zoom_to_layer (bool, optional): Zoom the map to the raster. Defaults to
+                True.
+            **kwargs: Rendering options (indexes, colormap, vmin, vmax, nodata, stretch,
+                expression) and ipyleaflet.TileLayer options.
         """
-        try:
-            from localtileserver import TileClient, get_leaflet_tile_layer
-        except:
-            raise ImportError("Please install localtileserver package")
+        from leafagro.mosaic import Mosaic, MosaicSource
+        from leafagro.store import StoreSource, get_raster_store
+        from leafagro.tileserver import RasterSource, get_tile_server, split_style
+
+        style, kwargs = split_style(kwargs)
+        server = get_tile_server()
+        store = get_raster_store()
+        if isinstance(data, (list, Mosaic)):
+            mosaic = data if isinstance(data, Mosaic) else Mosaic(data)
+            source = MosaicSource(mosaic, style)
+        elif (
+            store is not None
+            and StoreSource.supports(style)
+            and os.path.isfile(str(data))
+        ):
+            source = StoreSource(store.open(data), style)
+        else:
+            source = RasterSource(data, style)
+        source_id, url = server.register(source)
 
-        client = TileClient(data)
-        layer = get_leaflet_tile_layer(client, name=name, **kwargs)
+        kwargs.setdefault("max_zoom", 30)
+        kwargs.setdefault("max_native_zoom", 30)
+        layer = ipyleaflet.TileLayer(url=url, name=name, **kwargs)
+        layer.tile_source_id = source_id
         self.add(layer)
 
         if zoom_to_layer:
-            self.center = client.center()
-            self.zoom = client.default_zoom
-
-    
-
-    def normalizedDifference(self, firstBand, secondBand, layer_name, colormap, **kwargs):
+            self.center = source.center
+            self.zoom = source.min_zoom
+
+    def _release_tile_sources(self, change):
+        """Unregisters the tile server sources of the layers removed from the map."""
+        from leafagro.tileserver import get_tile_server
+
+        remaining = set(map(id, change["new"]))
+        for layer in change["old"]:
+            source_id = getattr(layer, "tile_source_id", None)
+            if source_id is not None and id(layer) not in remaining:
+                get_tile_server().unregister(source_id)
+
+    @perf.timed("map.normalizedDifference")
+    def normalizedDifference(
+        self, firstBand, secondBand, layer_name, colormap, output=None, **kwargs
+    ):
         """
-        Add Normalized Difference data in map (firstBand - secondBand) / (firstBand + secondBand + 1e-10).
+        Add Normalized Difference data in map
+        (firstBand - secondBand) / (firstBand + secondBand).
+
+        The bands are processed block by block in parallel (see ``leafagro.raster``),
+        so large scenes run in bounded memory, and the result is written as a
+        georeferenced Cloud-Optimized GeoTIFF with nodata where either band is nodata.
 
         Args:
-            firstBand (str): Path to the first band file (e.g., NIR).
-            secondBand (str): Path to the second band file (e.g., Red).
+            firstBand (str | list): Path to the first band file (e.g., NIR), or the
+                files of a mosaic.
+            secondBand (str | list): Path to the second band file (e.g., Red), or the
+                files of a mosaic.
             layer_name (str): Layer name for the map.
             colormap (str): Colormap for the visualization (e.g., 'terrain', 'viridis').
-        """
-        from PIL import Image
-        import numpy as np
-        
-        # Open both bands using PIL.Image
-        band1_img = Image.open(firstBand)
-        band2_img = Image.open(secondBand)
+            output (str, optional): Path of the GeoTIFF to write. Defaults to a
+                temporary file.
 
-        # Ensure both bands have the same size
-        if band1_img.size != band2_img.size:
-            raise ValueError("The provided bands do not have the same dimensions.")
+        Returns:
+            str: The path of the Normalized Difference raster.
+        """
+        from leafagro.raster import normalized_difference
 
-        # Convert bands to NumPy arrays
-        band1_array = np.array(band1_img, dtype=np.float32)
-        band2_array = np.array(band2_img, dtype=np.float32)
+        path = normalized_difference(firstBand, secondBand, output=output)
 
-        # Calculate Normalized Difference
-        normalizedDifference = (band1_array - band2_array) / (band1_array + band2_array + 1e-10)
+        if "vmin" not in kwargs:
+            kwargs["vmin"] = -1
+        if "vmax" not in kwargs:
+            kwargs["vmax"] = 1
 
-        # Clip Normalized Difference values to the range [-1, 1] to avoid potential issues
-        normalizedDifference = np.clip(normalizedDifference, -1, 1)
+        self.add_raster(path, name=layer_name, colormap=colormap, **kwargs)
+        return path
 
-         # Save the NDVI array to a temporary file
-        with tempfile.NamedTemporaryFile(suffix=".tif", delete=False) as tmpfile:
-            ndvi_path = tmpfile.name
-        ndvi_image = Image.fromarray((normalizedDifference * 255).astype(np.uint8))  # Scale to 0-255 for saving
-        ndvi_image.save(ndvi_path)
+    @perf.timed("map.add_spectral_index")
+    def add_spectral_index(
+        self, bands, index, layer_name=None, colormap="RdYlGn", output=None, **kwargs
+    ):
+        """Add a spectral index computed from local band files in map
 
-        # Add the Normalized Difference raster to the map using self.add_raster
-        self.add_raster(normalizedDifference, layer_name=layer_name, colormap=colormap)
+        Args:
+            bands (dict): Band name to file path, e.g. {"N": "nir.tif", "R": "red.tif",
+                "B": "blue.tif"}.
+            index (str): A built-in index ("ndvi", "evi", "savi", ...) or a formula such
+                as "2.5*(N-R)/(N+6*R-7.5*B+1)".
+            layer_name (str, optional): Layer name for the map. Defaults to the index.
+            colormap (str, optional): Colormap for the visualization. Defaults to
+                "RdYlGn".
+            output (str, optional): Path of the GeoTIFF to write. Defaults to a
+                temporary file.
 
-    def add_zoom_slider(self, description= "Zoom level", min=0, max=15, value=7, position="topright", **kwargs):
+        Returns:
+            str: The path of the index raster.
+        """
+        from leafagro.indices import compute_indices
+
+        path = compute_indices(bands, [index], output=output)
+        self.add_raster(path, name=layer_name or index, colormap=colormap, **kwargs)
+        return path
+
+    def add_zoom_slider(
+        self,
+        description="Zoom level",
+        min=0,
+        max=15,
+        value=7,
+        position="topright",
+        **kwargs,
+    ):
 
         """Add Slider-level bar in map
 
         Args:
-            position (str, optional): The position of zoom slider. Default position: topright.
+            position (str, optional): The position of zoom slider. Default position:
+                topright.
         """
         zoom_slider = widgets.IntSlider(description = description, min=min, max=max)
 
@@ -207,15 +627,21 @@ class Map(ipyleaflet.Map):
         self.add(control)
         widgets.jslink((zoom_slider,'value'),(self,'zoom'))
     
-    def add_widget(self, widget, position="topright"):
+    def add_widget(self, widget, position="topright", key=None):
         """Adds a widget to the map.
 
         Args:
             widget (object): The widget to be added.
-            position (str, optional): The position of the widget. Defaults to "topright".
+            position (str, optional): The position of the widget. Defaults to
+                "topright".
+            key (str, optional): Registry key replacing the widget previously added with
+                it (see ``add_managed``). Defaults to None.
         """
         control = ipyleaflet.WidgetControl(widget=widget, position=position)
-        self.add(control)
+        if key is None:
+            self.add(control)
+        else:
+            self.add_managed(control, key)
 
     def add_opacity_slider(
         self, layer_index=-1, description="Opacity", position="topright"
@@ -224,8 +650,10 @@ class Map(ipyleaflet.Map):
 
         Args:
             layer (object): The layer to which the opacity slider is added.
-            description (str, optional): The description of the opacity slider. Defaults to "Opacity".
-            position (str, optional): The position of the opacity slider. Defaults to "topright".
+            description (str, optional): The description of the opacity slider. Defaults
+                to "Opacity".
+            position (str, optional): The position of the opacity slider. Defaults to
+                "topright".
         """
         layer = self.layers[layer_index]
         opacity_slider = widgets.FloatSlider(
@@ -244,11 +672,13 @@ class Map(ipyleaflet.Map):
         control = ipyleaflet.WidgetControl(widget=opacity_slider, position=position)
         self.add(control)
 
+    @perf.timed("map.add_basemap_gui")
     def add_basemap_gui(self, basemaps=None, position="topright"):
         """Adds a basemap GUI to the map.
 
         Args:
-            position (str, optional): The position of the basemap GUI. Defaults to "topright".
+            position (str, optional): The position of the basemap GUI. Defaults to
+                "topright".
         """
 
         basemap_selector = widgets.Dropdown(
@@ -262,18 +692,20 @@ class Map(ipyleaflet.Map):
         )
 
         def update_basemap(change):
-            self.add_basemap(change["new"])
+            self.add_basemap(change["new"], key="basemap")
 
         basemap_selector.observe(update_basemap, "value")
 
         control = ipyleaflet.WidgetControl(widget=basemap_selector, position=position)
-        self.add(control)
+        self.add_managed(control, "basemap_gui")
 
+    @perf.timed("map.add_toolbar")
     def add_toolbar(self, position="topright"):
         """Adds a toolbar to the map.
 
         Args:
-            position (str, optional): The position of the toolbar. Defaults to "topright".
+            position (str, optional): The position of the toolbar. Defaults to
+                "topright".
         """
 
         padding = "0px 0px 0px 5px"  # upper, right, bottom, left
@@ -366,7 +798,93 @@ class Map(ipyleaflet.Map):
         )
         self.add(control)
 
-    def show_agromonitoring_tile(self,API_key, polygonId, startDate, endDate, data,table=False):
+    @perf.timed("map.add_time_slider")
+    def add_time_slider(
+        self,
+        layers,
+        name="time series",
+        position="bottomright",
+        prefetch=True,
+        **kwargs,
+    ):
+        """Adds a time series of tile layers controlled by a date slider.
+
+        Only one tile layer shows the selected date and its URL is switched
+        when the slider moves. With ``prefetch``, two transparent layers load
+        the previous and next dates for the current view so switching is
+        instant. The number of layers stays the same for any number of dates,
+        and calling it again with the same name replaces the layers and the
+        slider instead of adding new ones.
+
+        Args:
+            layers (dict): Label (e.g. date) to tile URL, in display order.
+            name (str, optional): The name of the layer. Defaults to "time series".
+            position (str, optional): The position of the slider. Defaults to
+                "bottomright".
+            prefetch (bool, optional): Preload the neighbouring dates. Defaults to True.
+
+        Returns:
+            ipyleaflet.TileLayer: The layer showing the selected date.
+        """
+        labels = list(layers)
+        urls = list(layers.values())
+        if not urls:
+            print("No layers to display.")
+            return None
+
+        active = ipyleaflet.TileLayer(url=urls[0], name=name, **kwargs)
+        buffers = []
+        if prefetch and len(urls) > 1:
+            buffers = [
+                ipyleaflet.TileLayer(
+                    url=urls[0], name=f"{name} (prefetch)", opacity=0, **kwargs
+                )
+                for _ in range(2)
+            ]
+
+        slider = widgets.SelectionSlider(
+            options=list(zip(labels, range(len(labels)))),
+            value=0,
+            description=name,
+            continuous_update=False,
+            style={"description_width": "initial"},
+            layout=widgets.Layout(width="300px"),
+        )
+
+        def update_layers(change):
+            index = change["new"]
+            with self.hold_sync():
+                active.url = urls[index]
+                for buffer, neighbour in zip(buffers, (index - 1, index + 1)):
+                    if 0 <= neighbour < len(urls):
+                        buffer.url = urls[neighbour]
+
+        slider.observe(update_layers, "value")
+        with self.hold_sync():
+            for i in range(2):
+                if i < len(buffers):
+                    self.add_managed(buffers[i], f"time slider {name} prefetch {i}")
+                else:
+                    self.remove_managed(f"time slider {name} prefetch {i}")
+            self.add_managed(active, f"time slider {name}")
+            update_layers({"new": 0})
+            control = ipyleaflet.WidgetControl(widget=slider, position=position)
+            self.add_managed(control, f"time slider {name} control")
+        active.time_slider = slider
+        return active
+
+    @perf.timed("map.show_agromonitoring_tile")
+    def show_agromonitoring_tile(
+        self,
+        API_key,
+        polygonId,
+        startDate,
+        endDate,
+        data,
+        table=False,
+        time_slider=False,
+        max_cloud=None,
+    ):
 
         """Add the Agromonitoring tile layer in map
 
@@ -375,8 +893,15 @@ class Map(ipyleaflet.Map):
             polygonId (str): Provide the polygon ID (study area) from Agromonitoring.
             startDate (str): Date format "YYYY-MM-DD" (ex. "2018-01-01").
             endDate (str): Date format "YYYY-MM-DD" (ex. "2018-02-01").
-            data (str): Data to retrieve from Agromonitoring. Available Data ['truecolor', 'falsecolor', 'ndvi', 'evi', 'evi2', 'ndwi', 'nri', 'dswi'].
-            table (bool): Display the tables of Data available with data (default: False).
+            data (str): Data to retrieve from Agromonitoring. Available Data
+                ['truecolor', 'falsecolor', 'ndvi', 'evi', 'evi2', 'ndwi', 'nri',
+                'dswi'].
+            table (bool): Display the tables of Data available with data
+                (default: False).
+            time_slider (bool): Show one layer with a date slider instead of one layer
+                per date (default: False).
+            max_cloud (float): Skip scenes with a cloud cover above this percentage
+                (default: None).
         """
         from  leafagro.agromonitoring import Agromonitoring as ag
 
@@ -387,9 +912,24 @@ class Map(ipyleaflet.Map):
             print("No data to display.")
             return
 
+        # Drop cloudy scenes before any layer is created (the search is cached)
+        if max_cloud is not None:
+            scenes = ag.get_agromonitoring_scenes(
+                API_key, polygonId, startDate, endDate
+            )
+            df = df[(scenes['Cloud'].fillna(0) <= max_cloud).to_numpy()]
+
         # Display the table if requested
         if table:
             print(df)
+        elif time_slider:
+            layers = {}
+            for date, tile_url in zip(df['Date'], df['URL']):
+                label = date
+                while label in layers:
+                    label += "'"
+                layers[label] = tile_url
+            self.add_time_slider(layers, name=data)
         else:
         # Add all tiles to the map
             for index, row in df.iterrows():
@@ -397,7 +937,10 @@ class Map(ipyleaflet.Map):
                 date = row['Date']
                 self.add_layer_tile(tile_url, name=f"{date} {data}")
     
-    def show_agromonitoring_stats(self,API_Key, polygonId, startDate, endDate, data, display=False):
+    @perf.timed("map.show_agromonitoring_stats")
+    def show_agromonitoring_stats(
+        self, API_Key, polygonId, startDate, endDate, data, display=False
+    ):
         """Display the Summary Statistics of Table
 
         Args:
@@ -405,12 +948,16 @@ class Map(ipyleaflet.Map):
             polygonId (str): Provide the polygon ID (study area) from Agromonitoring.
             startDate (str): Date format "YYYY-MM-DD" (ex. "2018-01-01").
             endDate (str): Date format "YYYY-MM-DD" (ex. "2018-02-01").
-            data (str): Data to retrieve from Agromonitoring. Available Data ['truecolor', 'falsecolor', 'ndvi', 'evi', 'evi2', 'ndwi', 'nri', 'dswi'].
+            data (str): Data to retrieve from Agromonitoring. Available Data
+                ['truecolor', 'falsecolor', 'ndvi', 'evi', 'evi2', 'ndwi', 'nri',
+                'dswi'].
             display (bool): True to display the stats on map. (default: False)
         """
         from leafagro.agromonitoring import Agromonitoring as ag
         
-        stats_df = ag.get_agromonitoring_stat(API_Key,polygonId, startDate, endDate, data)
+        stats_df = ag.get_agromonitoring_stat(
+            API_Key, polygonId, startDate, endDate, data
+        )
           
         if display:
             for index, stat in stats_df.iterrows():
@@ -419,11 +966,15 @@ class Map(ipyleaflet.Map):
             if stats_df is not None:
                     print(stats_df)
             else:
-                    print(f"The given data or Polygon ID is Wrong is not available in Agromonitoring") 
+                    print(
+                        "The given data or Polygon ID is Wrong is not available in "
+                        "Agromonitoring"
+                    )
 
 
     
     
+    @perf.timed("map.display_stats")
     def display_stats(self, statsUrl, date):
         """Display Summary Statistics of Polygon
 
@@ -432,13 +983,14 @@ class Map(ipyleaflet.Map):
             date (str): Date of the stats.
         """
         import requests
-        import time
         import pandas as pd
         from urllib.parse import urlparse, parse_qs
+        from leafagro.agromonitoring import get_polygon_registry
+        from leafagro.client import get_client
   
         try:
         # Fetch statistics data from the given URL
-            data = requests.get(statsUrl)
+            data = get_client().get(statsUrl)
             data_dict = data.json()
             stats_df = pd.DataFrame([data_dict], index=[date], columns=data_dict.keys())
 
@@ -449,51 +1001,57 @@ class Map(ipyleaflet.Map):
             query_params = parse_qs(parsed_url.query)
             api_key = query_params.get('appid', [None])[0]  # Extract API key
 
-            # Define polygons URL using the API key
-            polygons_url = f"http://api.agromonitoring.com/agro/1.0/polygons?appid={api_key}"
-            response = requests.get(polygons_url)
-
-            if response.status_code == 200:
-                metadata = response.json()
-                coordinates = None
-                if isinstance(metadata, list):
-                    for polygons in metadata:
-                        Id = polygons.get('id')
-                        if Id == polygon_id:
-                            coordinates = polygons['geo_json']  # Extract coordinates
-                            break
-
-                # Add the polygon's geojson to the map
-                if coordinates:
-                    self.add_geojson(coordinates)
-                else:
-                    print(f"No matching polygon found for ID: {polygon_id}")
-
-                # If statistics data is available, display it
-                if stats_df is not None:
-                    # Convert stats_df to HTML with some inline styling
-                    html_content = stats_df.to_html(classes='styled-table')
-                    html_styled = f"""
-                    <style>
-                    .styled-table {{
-                        font-size: 18px;
-                        color: green;
-                    }}
-                    </style>
-                    {html_content}
-                    """
-                    
-                    # Create an output widget and add it to the map
+            # Look the polygon up in the account's registry (loaded once per session)
+            coordinates = get_polygon_registry(api_key).geometry(polygon_id)
+
+            # Add the polygon's geojson to the map
+            if coordinates:
+                key = f"polygon {polygon_id}"
+                if self.get_managed(key) is None:
+                    layer = ipyleaflet.GeoJSON(
+                        data=coordinates,
+                        name=polygon_id,
+                        style={'color':'blue', 'weight': 1, 'fillOpacity':0},
+                        hover_style={'fillColor':'blue','fillOpacity': 0.5},
+                    )
+                    self.add_managed(layer, key)
+            else:
+                print(f"No matching polygon found for ID: {polygon_id}")
+
+            # If statistics data is available, display it
+            if stats_df is not None:
+                # One table per polygon: the new date is added to it instead of a
+                # new widget
+                key = f"stats {polygon_id}"
+                control = self.get_managed(key)
+                if control is None:
                     widget = Output(layout={'border': '1px solid white'})
-                    output_widget = WidgetControl(widget=widget, position='bottomright')
-                    self.add(output_widget)
-                    with widget:
-                        widget.clear_output()
-                        display(HTML(html_styled))
+                    control = self.add_managed(
+                        WidgetControl(widget=widget, position='bottomright'), key
+                    )
                 else:
-                    print("No statistics data available.")
+                    widget = control.widget
+                    stats_df = pd.concat([control.stats, stats_df])
+                    duplicated = stats_df.index.duplicated(keep="last")
+                    stats_df = stats_df[~duplicated].sort_index()
+                control.stats = stats_df
+
+                # Convert stats_df to HTML with some inline styling
+                html_content = stats_df.to_html(classes='styled-table')
+                html_styled = f"""
+                <style>
+                .styled-table {{
+                    font-size: 18px;
+                    color: green;
+                }}
+                </style>
+                {html_content}
+                """
+                with widget:
+                    widget.clear_output()
+                    display(HTML(html_styled))
             else:
-                print(f"Error fetching polygons: {response.status_code}")
+                print("No statistics data available.")
 
         except requests.exceptions.RequestException as e:
             print(f"An error occurred while making the API request: {e}")
\ No newline at end of file
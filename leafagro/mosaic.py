@@ -0,0 +1,437 @@
+"""The mosaic module combines the rasters of several scenes into one virtual raster, warped on the fly.
+"""
+
+import hashlib
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from . import perf
+from .raster import _check_rasterio
+from .store import StoreSource
+
+WEB_MERCATOR = "EPSG:3857"
+
+
+class _MosaicInput:
+    """One raster of a mosaic, with its dataset handles pooled per overview level.
+
+    Args:
+        path (str): Path or URL of the raster.
+        crs (rasterio.crs.CRS): The CRS of the mosaic.
+    """
+
+    def __init__(self, path, crs):
+        import rasterio
+        from rasterio.warp import calculate_default_transform, transform_bounds
+
+        self.path = path
+        with rasterio.open(path) as src:
+            self.crs = src.crs
+            self.transform = src.transform
+            self.width = src.width
+            self.height = src.height
+            self.count = src.count
+            self.nodatavals = src.nodatavals
+            self.overviews = src.overviews(1)
+            self.native_bounds = tuple(src.bounds)
+        self.bounds = transform_bounds(self.crs, crs, *self.native_bounds, densify_pts=21)
+        transform, _, _ = calculate_default_transform(self.crs, crs, self.width, self.height, *self.native_bounds)
+        self.resolution = abs(transform.a)
+        self._idle = {}
+        self._handles = []
+        self._retired = set()
+        self._lock = threading.Lock()
+
+    def intersects(self, bounds):
+        left, bottom, right, top = bounds
+        return not (right <= self.bounds[0] or left >= self.bounds[2] or top <= self.bounds[1] or bottom >= self.bounds[3])
+
+    def _acquire(self, level):
+        import rasterio
+
+        with self._lock:
+            idle = self._idle.get(level)
+            if idle:
+                return idle.pop()
+        options = {} if level is None else {"overview_level": level}
+        dataset = rasterio.open(self.path, **options)
+        with self._lock:
+            self._handles.append(dataset)
+        return dataset
+
+    def _release(self, level, dataset):
+        with self._lock:
+            if id(dataset) not in self._retired:
+                self._idle.setdefault(level, []).append(dataset)
+                return
+            self._retired.discard(id(dataset))
+        dataset.close()
+
+    def close(self):
+        """Closes the idle handles, and the ones in use as soon as they are released."""
+        with self._lock:
+            idle = {id(dataset) for datasets in self._idle.values() for dataset in datasets}
+            handles, self._handles, self._idle = self._handles, [], {}
+            busy = [dataset for dataset in handles if id(dataset) not in idle]
+            self._retired.update(id(dataset) for dataset in busy)
+        for dataset in handles:
+            if id(dataset) in idle:
+                dataset.close()
+
+    def level_for(self, bounds, crs, width):
+        """Returns the overview level (None for full resolution) with pixels about as large as the output's."""
+        from rasterio.warp import transform_bounds
+
+        if not self.overviews:
+            return None
+        left, _, right, _ = transform_bounds(crs, self.crs, *bounds)
+        ratio = (right - left) / abs(self.transform.a) / width
+        levels = [i for i, factor in enumerate(self.overviews) if factor <= ratio]
+        return levels[-1] if levels else None
+
+    def warp(self, indexes, destination, transform, crs, resampling, level):
+        """Warps bands of the raster into a (bands, rows, cols) float32 array filled with NaN."""
+        import rasterio
+        from rasterio.warp import reproject
+
+        dataset = self._acquire(level)
+        try:
+            for i, index in enumerate(indexes):
+                reproject(
+                    rasterio.band(dataset, index),
+                    destination[i],
+                    src_nodata=self.nodatavals[index - 1],
+                    dst_transform=transform,
+                    dst_crs=crs,
+                    dst_nodata=np.nan,
+                    resampling=resampling,
+                    init_dest_nodata=True,
+                )
+        finally:
+            self._release(level, dataset)
+
+
+class Mosaic:
+    """A virtual mosaic of rasters, reprojected on the fly onto one grid.
+
+    Nothing is merged or copied to disk: each window is warped from the
+    rasters it overlaps when it is read, in parallel across the rasters, and
+    where they overlap the first raster in ``sources`` wins. A mosaic reads
+    like one band (band 1) of a raster, so it can be given to
+    ``leafagro.raster.band_math`` and ``leafagro.zonal.zonal_stats``, and
+    ``band(i)`` gives the other bands. Warped windows are kept in an LRU
+    cache of ``cache_bytes``.
+
+    Args:
+        sources (list): Paths or URLs of the rasters, e.g. downloaded Agromonitoring images.
+        crs (str, optional): The CRS of the mosaic. Defaults to "EPSG:3857", the CRS of the map.
+        resolution (float, optional): Pixel size in CRS units. Defaults to the finest resolution of the rasters.
+        bounds (tuple, optional): (left, bottom, right, top) in CRS units. Defaults to the union of the rasters.
+        like (object, optional): A mosaic or band whose grid (crs, transform, width, height) is reused, to align two mosaics. Defaults to None.
+        resampling (str, optional): A rasterio resampling method. Defaults to "bilinear".
+        max_workers (int, optional): Number of rasters warped at once. Defaults to the number of CPUs.
+        cache_bytes (int, optional): Size of the cache of warped windows. Defaults to 256 MiB.
+    """
+
+    nodata = None
+
+    def __init__(
+        self,
+        sources,
+        crs=WEB_MERCATOR,
+        resolution=None,
+        bounds=None,
+        like=None,
+        resampling="bilinear",
+        max_workers=None,
+        cache_bytes=256 * 1024**2,
+    ):
+        _check_rasterio()
+        from affine import Affine
+        from rasterio.crs import CRS
+        from rasterio.enums import Resampling
+
+        if isinstance(sources, (str, os.PathLike)):
+            sources = [sources]
+        sources = [str(source) for source in sources]
+        if not sources:
+            raise ValueError("A mosaic needs at least one raster.")
+        if resampling not in Resampling.__members__:
+            raise ValueError(f"Unknown resampling method {resampling!r}.")
+
+        self.crs = CRS.from_user_input(like.crs if like is not None else crs)
+        self.sources = sources
+        with ThreadPoolExecutor(max_workers=min(len(sources), 16)) as executor:
+            self.inputs = list(executor.map(lambda path: _MosaicInput(path, self.crs), sources))
+        self.count = min(source.count for source in self.inputs)
+
+        if like is not None:
+            self.transform, self.width, self.height = like.transform, like.width, like.height
+        else:
+            resolution = resolution or min(source.resolution for source in self.inputs)
+            if bounds is None:
+                bounds = (
+                    min(source.bounds[0] for source in self.inputs),
+                    min(source.bounds[1] for source in self.inputs),
+                    max(source.bounds[2] for source in self.inputs),
+                    max(source.bounds[3] for source in self.inputs),
+                )
+            # Pixels snapped to multiples of the resolution, so mosaics of the same area align.
+            left = math.floor(bounds[0] / resolution) * resolution
+            top = math.ceil(bounds[3] / resolution) * resolution
+            self.width = max(1, math.ceil((bounds[2] - left) / resolution))
+            self.height = max(1, math.ceil((top - bounds[1]) / resolution))
+            self.transform = Affine(resolution, 0, left, 0, -resolution, top)
+
+        self.resampling = Resampling[resampling]
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.cache_bytes = cache_bytes
+        self._cache = OrderedDict()
+        self._cache_size = 0
+        self._statistics = {}
+        self._executor = None
+        self._lock = threading.Lock()
+
+        identity = [self.crs.to_wkt(), list(self.transform)[:6], self.width, self.height, resampling]
+        for path in sources:
+            stat = os.stat(path) if os.path.exists(path) else None
+            identity.append([path, stat and stat.st_mtime_ns, stat and stat.st_size])
+        self.key = hashlib.sha1(json.dumps(identity).encode("utf-8")).hexdigest()
+
+    def __repr__(self):
+        return f"Mosaic({len(self.sources)} rasters, {self.width}x{self.height}, crs={self.crs.to_string()!r})"
+
+    @property
+    def bounds(self):
+        """Returns the (left, bottom, right, top) bounds of the mosaic in its CRS."""
+        from rasterio.transform import array_bounds
+
+        west, south, east, north = array_bounds(self.height, self.width, self.transform)
+        return (west, south, east, north)
+
+    def band(self, band=1):
+        """Returns one band of the mosaic, readable by window.
+
+        Args:
+            band (int, optional): The band number (1-based). Defaults to 1.
+
+        Returns:
+            MosaicBand: The band.
+        """
+        if not 1 <= band <= self.count:
+            raise ValueError(f"The mosaic has {self.count} bands.")
+        return MosaicBand(self, band)
+
+    def read(self, window, band=1):
+        """Reads a window of the mosaic grid as float32, with nodata pixels set to NaN.
+
+        Args:
+            window (rasterio.windows.Window): The window to read.
+            band (int, optional): The band number (1-based). Defaults to 1.
+
+        Returns:
+            np.ndarray: The pixel values (read-only, as they may be cached).
+        """
+        from rasterio.windows import transform as window_transform
+
+        key = (band, int(window.col_off), int(window.row_off), int(window.width), int(window.height))
+        with self._lock:
+            data = self._cache.get(key)
+            if data is not None:
+                self._cache.move_to_end(key)
+                perf.count("mosaic.hits")
+                return data
+        perf.count("mosaic.misses")
+
+        data = self.warp([band], window_transform(window, self.transform), self.crs, key[3], key[4], level=False)[0]
+        data.flags.writeable = False
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = data
+                self._cache_size += data.nbytes
+            while self._cache_size > self.cache_bytes and self._cache:
+                _, old = self._cache.popitem(last=False)
+                self._cache_size -= old.nbytes
+        return data
+
+    @perf.timed("mosaic.warp")
+    def warp(self, indexes, transform, crs, width, height, level=True):
+        """Warps the rasters overlapping an area onto any grid.
+
+        Args:
+            indexes (list): The band numbers (1-based).
+            transform (affine.Affine): The transform of the output grid.
+            crs (str | rasterio.crs.CRS): The CRS of the output grid.
+            width (int): Output width in pixels.
+            height (int): Output height in pixels.
+            level (bool, optional): Read from the overviews matching the output resolution. Defaults to True.
+
+        Returns:
+            np.ndarray: (bands, height, width) float32 values, NaN where no raster has data.
+        """
+        from rasterio.crs import CRS
+        from rasterio.warp import transform_bounds
+
+        crs = CRS.from_user_input(crs)
+        area = (transform.c, transform.f + transform.e * height, transform.c + transform.a * width, transform.f)
+        bounds = area if crs == self.crs else transform_bounds(crs, self.crs, *area)
+        inputs = [source for source in self.inputs if source.intersects(bounds)]
+
+        out = np.full((len(indexes), height, width), np.nan, dtype="float32")
+
+        def warp(source):
+            data = np.full_like(out, np.nan)
+            source.warp(indexes, data, transform, crs, self.resampling, source.level_for(area, crs, width) if level else None)
+            return data
+
+        if len(inputs) == 1:
+            results = [warp(inputs[0])]
+        else:
+            results = self._pool().map(warp, inputs)
+        for data in results:
+            np.copyto(out, data, where=np.isnan(out))
+        return out
+
+    def statistics(self, band=1):
+        """Returns the approximate range of a band, read from small overviews of the rasters.
+
+        Args:
+            band (int, optional): The band number (1-based). Defaults to 1.
+
+        Returns:
+            tuple: (min, max), or (None, None) if the band has no data.
+        """
+        import rasterio
+
+        if band not in self._statistics:
+            lows, highs = [], []
+            for source in self.inputs:
+                scale = max(1, max(source.width, source.height) / 1024)
+                shape = (max(1, round(source.height / scale)), max(1, round(source.width / scale)))
+                with rasterio.open(source.path) as src:
+                    data = src.read(band, out_shape=shape, masked=True, out_dtype="float32").compressed()
+                data = data[np.isfinite(data)]
+                if data.size:
+                    lows.append(float(data.min()))
+                    highs.append(float(data.max()))
+            self._statistics[band] = (min(lows), max(highs)) if lows else (None, None)
+        return self._statistics[band]
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def close(self):
+        """Closes the dataset handles and the thread pool, and empties the cache."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._cache.clear()
+            self._cache_size = 0
+        if executor is not None:
+            executor.shutdown()
+        for source in self.inputs:
+            source.close()
+
+
+class MosaicBand:
+    """One band of a mosaic, with the band interface of ``leafagro.raster.RasterBand``.
+
+    Args:
+        mosaic (Mosaic): The mosaic.
+        band (int, optional): The band number (1-based). Defaults to 1.
+    """
+
+    nodata = None
+
+    def __init__(self, mosaic, band=1):
+        self.mosaic = mosaic
+        self.band = band
+        self.width = mosaic.width
+        self.height = mosaic.height
+        self.transform = mosaic.transform
+        self.crs = mosaic.crs
+
+    def read(self, window):
+        """Reads a window as float32, with nodata pixels set to NaN.
+
+        Args:
+            window (rasterio.windows.Window): The window to read.
+
+        Returns:
+            np.ndarray: The pixel values (read-only).
+        """
+        return self.mosaic.read(window, self.band)
+
+    def close(self):
+        """Does nothing: the handles belong to the mosaic."""
+
+
+class MosaicSource(StoreSource):
+    """Tiles of a mosaic, warped for each tile from the overviews of the rasters it overlaps.
+
+    Supports the same options as ``leafagro.store.StoreSource``. Rendered
+    tiles are cached by the tile server like those of any raster.
+
+    Args:
+        mosaic (Mosaic): The mosaic.
+        style (dict, optional): Rendering options (indexes, colormap, vmin, vmax). Defaults to None.
+    """
+
+    cacheable = True
+
+    def __init__(self, mosaic, style=None):
+        from .store import _colormap_lut
+
+        style = dict(style or {})
+        if not self.supports(style):
+            raise ValueError(f"MosaicSource only supports the {self.STYLE_KEYS} options.")
+        self.mosaic = mosaic
+        self.indexes = list(style.get("indexes") or ([1, 2, 3] if mosaic.count >= 3 else [1]))
+        if len(self.indexes) not in (1, 3):
+            raise ValueError("Give one band, or three bands for RGB.")
+        statistics = [] if "vmin" in style and "vmax" in style else [mosaic.statistics(i) for i in self.indexes]
+        self.vmin = style.get("vmin", min((low for low, _ in statistics if low is not None), default=0))
+        self.vmax = style.get("vmax", max((high for _, high in statistics if high is not None), default=1))
+        self.lut = _colormap_lut(style["colormap"]) if style.get("colormap") and len(self.indexes) == 1 else None
+        identity = json.dumps([mosaic.key, self.indexes, self.vmin, self.vmax, style.get("colormap")])
+        self.key = hashlib.sha1(identity.encode("utf-8")).hexdigest()
+        self._set_extent(mosaic.crs, mosaic.bounds, mosaic.width)
+
+    def close(self):
+        """Closes the thread pool and the dataset handles of the mosaic.
+
+        The tile server calls it when the source is unregistered. The mosaic
+        reopens what it needs if it is used again.
+        """
+        self.mosaic.close()
+
+    def render_image(self, bounds, width, height):
+        """Renders an area in Web Mercator to RGBA pixels.
+
+        Args:
+            bounds (tuple): (left, bottom, right, top) in EPSG:3857 meters.
+            width (int): Image width in pixels.
+            height (int): Image height in pixels.
+
+        Returns:
+            np.ndarray: (height, width, 4) RGBA bytes, or (height, width) indices in ``lut`` with a colormap. None if the area is empty.
+        """
+        from rasterio.transform import from_bounds
+
+        left, bottom, right, top = bounds
+        mleft, mbottom, mright, mtop = self._mercator
+        if right <= mleft or left >= mright or top <= mbottom or bottom >= mtop:
+            return None
+        bands = self.mosaic.warp(self.indexes, from_bounds(left, bottom, right, top, width, height), WEB_MERCATOR, width, height)
+        valid = np.isfinite(bands).all(axis=0)
+        if not valid.any():
+            return None
+        return self._colorize(bands, valid)
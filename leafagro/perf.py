@@ -0,0 +1,268 @@
+"""The perf module times leafagro operations and counts API requests.
+
+Instrumentation is off by default and then costs one flag check per call.
+Turn it on with ``enable()`` (or the ``LEAFAGRO_PERF=1`` environment
+variable) and read the results with ``report()`` or ``Map.perf_report()``.
+"""
+
+import functools
+import os
+import threading
+import time
+from collections import defaultdict
+
+_enabled = os.environ.get("LEAFAGRO_PERF", "").lower() in ("1", "true", "yes")
+_lock = threading.Lock()
+_local = threading.local()
+_spans = {}
+_counters = defaultdict(float)
+_tracer = None
+_meter = None
+_otel_counters = {}
+
+
+def enable(opentelemetry=False):
+    """Turns instrumentation on.
+
+    Args:
+        opentelemetry (bool, optional): Also export the spans and counters through the OpenTelemetry API, to whatever SDK and exporter the application configured. Defaults to False.
+    """
+    global _enabled, _tracer, _meter
+    if opentelemetry:
+        try:
+            from opentelemetry import metrics, trace
+        except ImportError:
+            raise ImportError("Please install opentelemetry-api package")
+        _tracer = trace.get_tracer("leafagro")
+        _meter = metrics.get_meter("leafagro")
+    _enabled = True
+
+
+def disable():
+    """Turns instrumentation and OpenTelemetry export off."""
+    global _enabled, _tracer, _meter
+    _enabled = False
+    _tracer = None
+    _meter = None
+    _otel_counters.clear()
+
+
+def is_enabled():
+    """Returns True if instrumentation is on."""
+    return _enabled
+
+
+def reset():
+    """Forgets every span and counter recorded so far."""
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+
+
+class _NullSpan:
+    """The span returned while instrumentation is off: every method is a no-op."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+    def response(self, response):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _SpanStats:
+    __slots__ = ("calls", "total", "own", "max", "errors")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.own = 0.0
+        self.max = 0.0
+        self.errors = 0
+
+
+class Span:
+    """Times a block of code, excluding nested spans from its own time.
+
+    Args:
+        name (str): The operation name, e.g. "agromonitoring.image_search".
+        **attributes: Attributes exported with the OpenTelemetry span.
+    """
+
+    __slots__ = ("name", "attributes", "start", "children", "_otel", "_otel_span")
+
+    def __init__(self, name, **attributes):
+        self.name = name
+        self.attributes = attributes
+        self.children = 0.0
+        self._otel = None
+        self._otel_span = None
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        if _tracer is not None:
+            self._otel = _tracer.start_as_current_span(self.name, attributes=self.attributes or None)
+            self._otel_span = self._otel.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        stack = _local.stack
+        stack.pop()
+        if stack:
+            stack[-1].children += elapsed
+        with _lock:
+            stats = _spans.get(self.name)
+            if stats is None:
+                stats = _spans[self.name] = _SpanStats()
+            stats.calls += 1
+            stats.total += elapsed
+            stats.own += elapsed - self.children
+            stats.max = max(stats.max, elapsed)
+            if exc_type is not None:
+                stats.errors += 1
+        if self._otel is not None:
+            self._otel.__exit__(exc_type, exc, tb)
+        return False
+
+    def set(self, **attributes):
+        """Adds attributes to the span."""
+        self.attributes.update(attributes)
+        if self._otel_span is not None:
+            self._otel_span.set_attributes(attributes)
+
+    def response(self, response):
+        """Counts an HTTP response: requests, bytes, status codes and cache hits.
+
+        Args:
+            response (requests.Response): The response.
+        """
+        from .cache import endpoint_of
+
+        endpoint = endpoint_of(response.url) or "other"
+        hit = response.headers.get("X-Leafagro-Cache") == "hit"
+        count("http.requests")
+        count(f"http.status.{response.status_code}")
+        if hit:
+            count("http.cache_hits")
+        else:
+            count("http.bytes", len(response.content or b""))
+        count(f"http.requests.{endpoint}")
+        self.set(**{"http.url": response.url, "http.status_code": response.status_code, "leafagro.cache_hit": hit})
+
+
+def span(name, **attributes):
+    """Returns a context manager timing a block of code.
+
+    Example:
+        >>> with perf.span("stats.parse") as s:
+        ...     s.response(response)
+
+    Args:
+        name (str): The operation name.
+        **attributes: Attributes exported with the OpenTelemetry span.
+
+    Returns:
+        Span: The span, or a no-op span while instrumentation is off.
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return Span(name, **attributes)
+
+
+def timed(name):
+    """Decorates a function so that every call is recorded as a span.
+
+    Args:
+        name (str): The operation name.
+
+    Returns:
+        callable: The decorator.
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with Span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name, value=1):
+    """Adds to a counter.
+
+    Args:
+        name (str): The counter name, e.g. "search_cache.hits".
+        value (float, optional): The amount to add. Defaults to 1.
+    """
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] += value
+    if _meter is not None:
+        counter = _otel_counters.get(name)
+        if counter is None:
+            counter = _otel_counters[name] = _meter.create_counter(f"leafagro.{name}")
+        counter.add(value)
+
+
+def counters():
+    """Returns the counters recorded so far.
+
+    Returns:
+        pd.Series: Counter name to value.
+    """
+    import pandas as pd
+
+    with _lock:
+        return pd.Series(dict(_counters), dtype="float64").sort_index()
+
+
+def report():
+    """Summarizes where the time went.
+
+    ``total_s`` includes nested spans while ``self_s`` does not, so the
+    ``self_s`` column adds up to the instrumented time.
+
+    Returns:
+        pd.DataFrame: calls, total_s, self_s, mean_ms, max_ms, errors and share (of the self time) per span, slowest first.
+    """
+    import pandas as pd
+
+    with _lock:
+        rows = {
+            name: {
+                "calls": stats.calls,
+                "total_s": stats.total,
+                "self_s": stats.own,
+                "mean_ms": stats.total / stats.calls * 1000,
+                "max_ms": stats.max * 1000,
+                "errors": stats.errors,
+            }
+            for name, stats in _spans.items()
+        }
+    columns = ["calls", "total_s", "self_s", "mean_ms", "max_ms", "errors"]
+    df = pd.DataFrame.from_dict(rows, orient="index", columns=columns)
+    df.index.name = "span"
+    total = df["self_s"].sum()
+    df["share"] = df["self_s"] / total if total else 0.0
+    return df.sort_values("self_s", ascending=False)
@@ -0,0 +1,324 @@
+"""The raster module contains a windowed, multi-threaded band math engine for large rasters.
+"""
+
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from . import perf
+
+try:
+    import rasterio
+    import rasterio.shutil
+    from rasterio.enums import Resampling
+    from rasterio.windows import Window
+except ImportError:
+    rasterio = None
+
+DEFAULT_NODATA = -9999.0
+
+# Per-thread scratch blocks of the kernels, reused from one window to the next.
+_scratch = threading.local()
+
+
+def _check_rasterio():
+    if rasterio is None:
+        raise ImportError("Please install rasterio package")
+
+
+class RasterBand:
+    """One band of a raster file that can be read by window from several threads.
+
+    Dataset handles are pooled and never used by two threads at once, since
+    GDAL handles are not thread-safe.
+
+    Args:
+        path (str): Path or URL of the raster.
+        band (int, optional): The band number (1-based). Defaults to 1.
+    """
+
+    def __init__(self, path, band=1):
+        _check_rasterio()
+        self.path = path
+        self.band = band
+        with rasterio.open(path) as src:
+            self.width = src.width
+            self.height = src.height
+            self.transform = src.transform
+            self.crs = src.crs
+            self.nodata = src.nodatavals[band - 1]
+        self._idle = []
+        self._handles = []
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        dataset = rasterio.open(self.path)
+        with self._lock:
+            self._handles.append(dataset)
+        return dataset
+
+    def _release(self, dataset):
+        with self._lock:
+            self._idle.append(dataset)
+
+    def close(self):
+        """Closes every open dataset handle."""
+        with self._lock:
+            for dataset in self._handles:
+                dataset.close()
+            self._handles = []
+            self._idle = []
+
+    def read(self, window):
+        """Reads a window as float32, with nodata pixels set to NaN.
+
+        Args:
+            window (rasterio.windows.Window): The window to read.
+
+        Returns:
+            np.ndarray: The pixel values.
+        """
+        dataset = self._acquire()
+        try:
+            data = dataset.read(self.band, window=window, out_dtype="float32")
+        finally:
+            self._release(dataset)
+        if self.nodata is not None and not np.isnan(self.nodata):
+            data[data == self.nodata] = np.nan
+        return data
+
+
+def as_band(source):
+    """Returns a readable band for a path, a (path, band) tuple, a list of paths or a band object.
+
+    Local files are read from the raster store when one is set (see
+    ``leafagro.store.set_raster_store``). A list of paths is read as a
+    mosaic warped on the fly (see ``leafagro.mosaic.Mosaic``).
+
+    Args:
+        source (str | tuple | list | RasterBand): The band to read.
+
+    Returns:
+        RasterBand: An object with width, height, transform, crs and read(window).
+    """
+    if isinstance(source, list):
+        from .mosaic import Mosaic
+
+        return Mosaic(source)
+    if isinstance(source, (str, os.PathLike)):
+        source = (source, 1)
+    if isinstance(source, tuple):
+        from .store import get_raster_store
+
+        path, band = str(source[0]), source[1]
+        store = get_raster_store()
+        if store is not None and os.path.isfile(path):
+            return store.band(path, band)
+        return RasterBand(path, band)
+    return source
+
+
+def block_windows(width, height, blocksize=512):
+    """Splits a raster into square blocks.
+
+    Args:
+        width (int): Raster width in pixels.
+        height (int): Raster height in pixels.
+        blocksize (int, optional): Block size in pixels. Defaults to 512.
+
+    Returns:
+        list: The rasterio windows covering the raster.
+    """
+    _check_rasterio()
+    return [
+        Window(col, row, min(blocksize, width - col), min(blocksize, height - row))
+        for row in range(0, height, blocksize)
+        for col in range(0, width, blocksize)
+    ]
+
+
+def _check_aligned(bands):
+    first = bands[0]
+    for band in bands[1:]:
+        if (band.width, band.height) != (first.width, first.height):
+            raise ValueError("The provided bands do not have the same dimensions.")
+        if band.transform != first.transform:
+            raise ValueError("The provided bands are not aligned on the same grid.")
+
+
+@perf.timed("raster.write_cog")
+def write_cog(path, output):
+    """Converts a tiled GeoTIFF into a Cloud-Optimized GeoTIFF.
+
+    Args:
+        path (str): The tiled GeoTIFF to convert.
+        output (str): The COG to write.
+    """
+    if _has_cog_driver():
+        rasterio.shutil.copy(path, output, driver="COG", compress="DEFLATE", overview_resampling="average")
+        return
+    # GDAL < 3.1 has no COG driver: a tiled GeoTIFF with internal overviews is equivalent.
+    with rasterio.open(path, "r+") as dst:
+        factors = [2**i for i in range(1, 6) if max(dst.width, dst.height) // 2**i >= 256]
+        if factors:
+            dst.build_overviews(factors, Resampling.average)
+    rasterio.shutil.copy(path, output, driver="GTiff", tiled=True, compress="DEFLATE", copy_src_overviews=True)
+
+
+def _has_cog_driver():
+    with rasterio.Env() as env:
+        return "COG" in env.drivers()
+
+
+def _scratch_block(shape):
+    """Returns a float32 block of this thread, overwritten by the next call."""
+    block = getattr(_scratch, "block", None)
+    if block is None or block.shape != shape:
+        block = _scratch.block = np.empty(shape, dtype="float32")
+    return block
+
+
+@perf.timed("raster.band_math")
+def band_math(
+    inputs,
+    kernel,
+    output=None,
+    count=1,
+    dtype="float32",
+    nodata=DEFAULT_NODATA,
+    blocksize=512,
+    max_workers=None,
+    descriptions=None,
+):
+    """Applies a kernel to aligned bands block by block and writes a georeferenced COG.
+
+    The bands are read in ``blocksize`` windows on a thread pool, so memory
+    stays bounded by the number of workers whatever the raster size. Pixels
+    that are nodata in any input, or NaN after the kernel, are written as
+    ``nodata``.
+
+    Args:
+        inputs (dict): Band name to path, (path, band) tuple or band object.
+        kernel (callable): Called as ``kernel(arrays, out)`` with a dict of float32 blocks (nodata as NaN, possibly read-only) and a (count, rows, cols) float32 array to fill.
+        output (str, optional): The GeoTIFF to write. Defaults to a temporary file.
+        count (int, optional): Number of output bands. Defaults to 1.
+        dtype (str, optional): Output data type. Defaults to "float32".
+        nodata (float, optional): Output nodata value. Defaults to -9999.
+        blocksize (int, optional): Block size in pixels, a multiple of 16. Defaults to 512.
+        max_workers (int, optional): Number of threads. Defaults to the number of CPUs.
+        descriptions (list, optional): Description of each output band. Defaults to None.
+
+    Returns:
+        str: The path of the output raster.
+    """
+    _check_rasterio()
+    names = list(inputs)
+    bands = [as_band(inputs[name]) for name in names]
+    owned = [band for name, band in zip(names, bands) if band is not inputs[name]]
+    try:
+        return _run_band_math(names, bands, kernel, output, count, dtype, nodata, blocksize, max_workers, descriptions)
+    finally:
+        for band in owned:
+            band.close()
+
+
+def _run_band_math(names, bands, kernel, output, count, dtype, nodata, blocksize, max_workers, descriptions):
+    _check_aligned(bands)
+    first = bands[0]
+
+    if output is None:
+        with tempfile.NamedTemporaryFile(suffix=".tif", delete=False) as tmpfile:
+            output = tmpfile.name
+
+    profile = {
+        "driver": "GTiff",
+        "width": first.width,
+        "height": first.height,
+        "count": count,
+        "dtype": dtype,
+        "crs": first.crs,
+        "transform": first.transform,
+        "nodata": nodata,
+        "tiled": True,
+        "blockxsize": blocksize,
+        "blockysize": blocksize,
+        "compress": "DEFLATE",
+        "BIGTIFF": "IF_SAFER",
+    }
+
+    windows = block_windows(first.width, first.height, blocksize)
+    write_lock = threading.Lock()
+    staging = output + ".partial.tif"
+
+    with rasterio.open(staging, "w", **profile) as dst:
+        for i, description in enumerate(descriptions or []):
+            dst.set_band_description(i + 1, description)
+
+        def process(window):
+            arrays = {name: band.read(window) for name, band in zip(names, bands)}
+            out = np.empty((count, window.height, window.width), dtype="float32")
+            with np.errstate(divide="ignore", invalid="ignore"):
+                kernel(arrays, out)
+            out[np.isnan(out)] = nodata
+            with write_lock:
+                dst.write(out.astype(dtype, copy=False), window=window)
+
+        workers = max_workers or os.cpu_count() or 1
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for _ in executor.map(process, windows):
+                pass
+
+    try:
+        write_cog(staging, output)
+    finally:
+        os.remove(staging)
+    return output
+
+
+def normalized_difference_kernel(arrays, out, first="A", second="B"):
+    """Computes (first - second) / (first + second) in place, clipped to [-1, 1].
+
+    Args:
+        arrays (dict): The input blocks.
+        out (np.ndarray): The (1, rows, cols) output block.
+        first (str, optional): Name of the first band. Defaults to "A".
+        second (str, optional): Name of the second band. Defaults to "B".
+    """
+    a = arrays[first]
+    b = arrays[second]
+    result = out[0]
+    np.subtract(a, b, out=result)
+    total = np.add(a, b, out=_scratch_block(result.shape))
+    total[total == 0] = np.nan
+    np.divide(result, total, out=result)
+    np.clip(result, -1, 1, out=result)
+
+
+def normalized_difference(firstBand, secondBand, output=None, nodata=DEFAULT_NODATA, blocksize=512, max_workers=None):
+    """Computes (firstBand - secondBand) / (firstBand + secondBand) into a Cloud-Optimized GeoTIFF.
+
+    Args:
+        firstBand (str | tuple): Path to the first band file (e.g., NIR), or a (path, band) tuple.
+        secondBand (str | tuple): Path to the second band file (e.g., Red), or a (path, band) tuple.
+        output (str, optional): The GeoTIFF to write. Defaults to a temporary file.
+        nodata (float, optional): Output nodata value. Defaults to -9999.
+        blocksize (int, optional): Block size in pixels. Defaults to 512.
+        max_workers (int, optional): Number of threads. Defaults to the number of CPUs.
+
+    Returns:
+        str: The path of the output raster.
+    """
+    return band_math(
+        {"A": firstBand, "B": secondBand},
+        normalized_difference_kernel,
+        output=output,
+        nodata=nodata,
+        blocksize=blocksize,
+        max_workers=max_workers,
+    )
@@ -0,0 +1,191 @@
+"""The stats module builds time series of Agromonitoring statistics and analyses them as arrays.
+"""
+
+import numpy as np
+import pandas as pd
+
+from . import perf
+from .agromonitoring import Agromonitoring
+from .client import get_client
+
+STAT_COLUMNS = ["min", "max", "mean", "median", "std", "p25", "p75", "num"]
+INDEX_NAMES = ["Polygon", "Product", "Date"]
+
+
+@perf.timed("stats.dataframe")
+def _records_to_frame(keys, records):
+    """Builds a typed stats frame from (Polygon, Product, Date) keys and stats dicts."""
+    keys = list(keys)
+    values = np.full((len(records), len(STAT_COLUMNS)), np.nan)
+    for row, record in enumerate(records):
+        if record:
+            values[row] = [record.get(column, np.nan) for column in STAT_COLUMNS]
+
+    polygons, products, dates = zip(*keys) if keys else ((), (), ())
+    index = pd.MultiIndex.from_arrays(
+        [list(polygons), list(products), pd.to_datetime(list(dates))], names=INDEX_NAMES
+    )
+    df = pd.DataFrame(values, index=index, columns=STAT_COLUMNS)
+    df["num"] = df["num"].astype("Int64")
+    return df.sort_index()
+
+
+def _fetch_json(urls, max_workers):
+    """Fetches stats URLs concurrently and returns their JSON, None for failures."""
+    results = []
+    for response in get_client().get_many(urls, max_workers=max_workers):
+        if response.status_code == 200:
+            with perf.span("json.parse"):
+                results.append(response.json())
+        else:
+            print(f"Error: stats request failed with status code {response.status_code}")
+            results.append(None)
+    return results
+
+
+@perf.timed("stats.batch")
+def get_stats_batch(API_Key, PolygonIds, StartDate, EndDate, data="ndvi", max_workers=8):
+    """Get the statistics time series of several polygons and products
+
+    The image searches and every stats URL are fetched concurrently and the
+    result is one typed frame, without a request or DataFrame per row.
+
+    Args:
+        API_Key (str): Agromonitoring API Key.
+        PolygonIds (list): Polygon Ids created in Agromonitoring (Areas of Interest)
+        StartDate (str): Provide the date of starting from (format ex."YYYY-MM-DD")
+        EndDate (str): Provide the date of till last search (format ex."YYYY-MM-DD")
+        data (str | list, optional): One or more index products, e.g. ["ndvi", "evi"]. Defaults to "ndvi".
+        max_workers (int, optional): Maximum number of concurrent requests. Defaults to 8.
+
+    Returns:
+        pd.DataFrame: Stats columns (min, max, mean, median, std, p25, p75, num) indexed by (Polygon, Product, Date).
+    """
+    urls = Agromonitoring.get_agromonitoring_batch(
+        API_Key, PolygonIds, StartDate, EndDate, data, source="stats", max_workers=max_workers
+    )
+    if urls is None:
+        return None
+    urls = urls.dropna(subset=['URL'])
+
+    records = _fetch_json(urls['URL'], max_workers)
+    keys = list(zip(urls['Polygon'], urls['Product'], urls['Date']))
+    return _records_to_frame(keys, records)
+
+
+def get_stats_timeseries(API_Key, PolygonId, StartDate, EndDate, data="ndvi", max_workers=8):
+    """Get the statistics time series of one polygon and product
+
+    Args:
+        API_Key (str): Agromonitoring API Key.
+        PolygonId (str): Polygon Id created in Agromonitoring (Area of Interest)
+        StartDate (str): Provide the date of starting from (format ex."YYYY-MM-DD")
+        EndDate (str): Provide the date of till last search (format ex."YYYY-MM-DD")
+        data (str, optional): The index product, e.g. "ndvi". Defaults to "ndvi".
+        max_workers (int, optional): Maximum number of concurrent requests. Defaults to 8.
+
+    Returns:
+        pd.DataFrame: Stats columns indexed by Date.
+    """
+    df = get_stats_batch(API_Key, [PolygonId], StartDate, EndDate, data, max_workers)
+    if df is None:
+        return None
+    return df.droplevel(["Polygon", "Product"])
+
+
+def _series_keys(df):
+    """Returns the index levels that identify one time series."""
+    return [name for name in df.index.names if name is not None and name != "Date"]
+
+
+def smooth_stats(df, window=3, columns=None, center=True):
+    """Smooths stats time series with a rolling mean
+
+    Each (Polygon, Product) series is smoothed on its own.
+
+    Args:
+        df (pd.DataFrame): A frame from ``get_stats_batch`` or ``get_stats_timeseries``.
+        window (int, optional): Number of scenes in the window. Defaults to 3.
+        columns (list, optional): Columns to smooth. Defaults to every stat but "num".
+        center (bool, optional): Center the window on each scene. Defaults to True.
+
+    Returns:
+        pd.DataFrame: The smoothed columns.
+    """
+    if columns is None:
+        columns = [column for column in STAT_COLUMNS if column != "num" and column in df]
+    values = df[columns].astype(float)
+
+    def rolling(frame):
+        return frame.rolling(window, min_periods=1, center=center).mean()
+
+    keys = _series_keys(df)
+    if keys:
+        return values.groupby(level=keys, group_keys=False).apply(rolling)
+    return rolling(values)
+
+
+def _period_of(dates, period_days):
+    """Returns the day-of-year bin of each date."""
+    return (pd.DatetimeIndex(dates).dayofyear.to_numpy() - 1) // period_days
+
+
+def detect_anomalies(df, baseline, column="mean", threshold=2.0, period_days=16):
+    """Flags scenes that depart from a baseline climatology
+
+    The baseline (e.g. the previous years) is reduced to a mean and standard
+    deviation per series and day-of-year bin, then every scene gets a z-score
+    against its bin.
+
+    Args:
+        df (pd.DataFrame): The stats to check, from ``get_stats_batch`` or ``get_stats_timeseries``.
+        baseline (pd.DataFrame): Reference stats in the same layout.
+        column (str, optional): The statistic to compare. Defaults to "mean".
+        threshold (float, optional): Absolute z-score above which a scene is an anomaly. Defaults to 2.0.
+        period_days (int, optional): Width of the day-of-year bins. Defaults to 16 (the revisit of the API).
+
+    Returns:
+        pd.DataFrame: value, baseline_mean, baseline_std, zscore and anomaly columns, indexed like ``df``.
+    """
+    keys = _series_keys(df)
+
+    reference = baseline[[column]].astype(float).reset_index()
+    reference["period"] = _period_of(reference["Date"], period_days)
+    climatology = (
+        reference.groupby(keys + ["period"])[column]
+        .agg(baseline_mean="mean", baseline_std="std")
+        .reset_index()
+    )
+
+    current = df[[column]].astype(float).reset_index()
+    current["period"] = _period_of(current["Date"], period_days)
+    result = current.merge(climatology, on=keys + ["period"], how="left")
+
+    value = result[column].to_numpy()
+    mean = result["baseline_mean"].to_numpy()
+    std = result["baseline_std"].to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        zscore = np.where(std > 0, (value - mean) / std, np.nan)
+
+    result = result.rename(columns={column: "value"})
+    result["zscore"] = zscore
+    result["anomaly"] = np.abs(zscore) > threshold
+    result = result.drop(columns="period").set_index(keys + ["Date"])
+    return result
+
+
+def aggregate_stats(df, freq="QS-DEC", column="mean", how=("mean", "min", "max")):
+    """Aggregates stats time series per season or any other period
+
+    Args:
+        df (pd.DataFrame): A frame from ``get_stats_batch`` or ``get_stats_timeseries``.
+        freq (str, optional): A pandas frequency. Defaults to "QS-DEC" (meteorological seasons).
+        column (str, optional): The statistic to aggregate. Defaults to "mean".
+        how (tuple, optional): The aggregations to compute. Defaults to ("mean", "min", "max").
+
+    Returns:
+        pd.DataFrame: One row per series and period, one column per aggregation.
+    """
+    keys = _series_keys(df)
+    grouper = keys + [pd.Grouper(level="Date", freq=freq)]
+    return df[column].astype(float).groupby(grouper).agg(list(how))
@@ -0,0 +1,585 @@
+"""The store module keeps local rasters as memory-mapped arrays with overviews for repeated analysis.
+"""
+
+import functools
+import hashlib
+import json
+import math
+import os
+import shutil
+import threading
+import uuid
+
+import numpy as np
+
+from . import perf
+from .cache import default_cache_dir
+from .raster import _check_rasterio, block_windows
+from .tiles import EARTH_HALF_CIRCUMFERENCE, tile_bounds
+from .tileserver import TileSource, _is_remote, _version
+
+# Overviews are built by halving the raster until it fits in this many pixels.
+OVERVIEW_SIZE = 256
+TILE_SIZE = 256
+
+_store = None
+
+
+def _key(path):
+    """Returns the key of a raster file or URL, which changes when the raster does."""
+    identity = json.dumps([path, _version(path)])
+    return hashlib.sha1(identity.encode("utf-8")).hexdigest()
+
+
+def _downsample(block):
+    """Averages 2x2 pixels of a (count, rows, cols) block, ignoring NaN."""
+    count, rows, cols = block.shape
+    if rows % 2 or cols % 2:
+        block = np.pad(block, ((0, 0), (0, rows % 2), (0, cols % 2)), constant_values=np.nan)
+        rows, cols = block.shape[1:]
+    pixels = block.reshape(count, rows // 2, 2, cols // 2, 2)
+    valid = np.isfinite(pixels)
+    total = np.where(valid, pixels, 0).sum(axis=(2, 4))
+    n = valid.sum(axis=(2, 4))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (total / n).astype("float32")
+
+
+class StoredBand:
+    """One band of a stored raster, with the band interface of ``leafagro.raster``.
+
+    ``read`` returns a read-only view of the memory map, so reading a window
+    copies nothing and only faults in the pages it touches.
+
+    Args:
+        raster (StoredRaster): The stored raster.
+        band (int, optional): The band number (1-based). Defaults to 1.
+        level (int, optional): 0 for full resolution, 1 and more for the overviews. Defaults to 0.
+    """
+
+    nodata = None
+
+    def __init__(self, raster, band=1, level=0):
+        if not 1 <= band <= raster.count:
+            raise ValueError(f"Band {band} is out of range, the raster has {raster.count} bands.")
+        self.raster = raster
+        self.band = band
+        self.level = level
+        self.width, self.height = raster.levels[level]
+        self.transform = raster.level_transform(level)
+        self.crs = raster.crs
+
+    def read(self, window):
+        """Reads a window as float32, with nodata pixels as NaN.
+
+        Args:
+            window (rasterio.windows.Window): The window to read.
+
+        Returns:
+            np.ndarray: A read-only view of the pixel values.
+        """
+        return self.raster.read(window, band=self.band, level=self.level)
+
+    def close(self):
+        """Does nothing: the memory map is shared by every band of the raster."""
+
+
+class StoredRaster:
+    """A raster converted to float32 memory maps, at full resolution and as overviews.
+
+    Each level is one raw file holding the bands one after the other, so a
+    band window is a strided view of the file.
+
+    Args:
+        path (str): The directory of the raster in the store.
+    """
+
+    def __init__(self, path):
+        from rasterio.crs import CRS
+        from rasterio.transform import Affine
+
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        self.path = path
+        self.key = os.path.basename(path)
+        self.source = meta["source"]
+        self.count = meta["count"]
+        self.width = meta["width"]
+        self.height = meta["height"]
+        self.crs = CRS.from_wkt(meta["crs"]) if meta["crs"] else None
+        self.transform = Affine(*meta["transform"])
+        self.levels = [tuple(level) for level in meta["levels"]]
+        self.statistics = meta["statistics"]
+        self.descriptions = meta["descriptions"]
+        self._arrays = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"StoredRaster(source={self.source!r}, count={self.count}, width={self.width}, height={self.height})"
+
+    @property
+    def nbytes(self):
+        """Returns the size of the memory maps in bytes."""
+        return sum(4 * self.count * width * height for width, height in self.levels)
+
+    def array(self, level=0):
+        """Returns a level as a read-only (count, rows, cols) float32 memory map.
+
+        Args:
+            level (int, optional): 0 for full resolution, 1 and more for the overviews. Defaults to 0.
+
+        Returns:
+            np.memmap: The pixels, with nodata as NaN.
+        """
+        array = self._arrays.get(level)
+        if array is None:
+            width, height = self.levels[level]
+            with self._lock:
+                array = self._arrays.get(level)
+                if array is None:
+                    array = self._arrays[level] = np.memmap(
+                        os.path.join(self.path, f"level{level}.raw"),
+                        dtype="float32",
+                        mode="r",
+                        shape=(self.count, height, width),
+                    )
+        return array
+
+    def level_transform(self, level=0):
+        """Returns the geotransform of a level.
+
+        Args:
+            level (int, optional): The level. Defaults to 0.
+
+        Returns:
+            affine.Affine: The transform.
+        """
+        from rasterio.transform import Affine
+
+        width, height = self.levels[level]
+        t = self.transform
+        x_scale, y_scale = self.width / width, self.height / height
+        return Affine(t.a * x_scale, t.b * y_scale, t.c, t.d * x_scale, t.e * y_scale, t.f)
+
+    def level_for(self, resolution):
+        """Returns the coarsest level that is at least as fine as a resolution.
+
+        Args:
+            resolution (float): Pixel size in the units of the raster's CRS.
+
+        Returns:
+            int: The level.
+        """
+        pixel = abs(self.transform.a)
+        level = 0
+        while level + 1 < len(self.levels) and pixel * self.width / self.levels[level + 1][0] <= resolution:
+            level += 1
+        return level
+
+    def band(self, band=1, level=0):
+        """Returns one band with the band interface of ``leafagro.raster``.
+
+        Args:
+            band (int, optional): The band number (1-based). Defaults to 1.
+            level (int, optional): The level. Defaults to 0.
+
+        Returns:
+            StoredBand: The band.
+        """
+        return StoredBand(self, band, level)
+
+    def read(self, window=None, band=None, level=0):
+        """Returns a window of the raster without copying it.
+
+        Args:
+            window (rasterio.windows.Window, optional): The window. Defaults to the whole raster.
+            band (int, optional): One band (1-based), or None for all of them. Defaults to None.
+            level (int, optional): The level. Defaults to 0.
+
+        Returns:
+            np.ndarray: A read-only (rows, cols) view for one band, (count, rows, cols) otherwise.
+        """
+        array = self.array(level)
+        if window is not None:
+            (row_start, row_stop), (col_start, col_stop) = window.toranges()
+            array = array[:, row_start:row_stop, col_start:col_stop]
+        return array if band is None else array[band - 1]
+
+    def close(self):
+        """Releases the memory maps."""
+        with self._lock:
+            self._arrays.clear()
+
+
+class RasterStore:
+    """A local store of rasters converted once to memory-mapped arrays.
+
+    The first time a file is opened it is decoded block by block into a
+    float32 memory map (nodata as NaN) plus 2x overviews down to 256 pixels.
+    Opening it again only maps the files, so reading a window costs page
+    faults instead of a decode. A file is converted again when it changes,
+    and the least recently used rasters are deleted when the store grows
+    past ``max_bytes``.
+
+    Args:
+        path (str, optional): Directory of the store. Defaults to "rasters" in ``default_cache_dir()``.
+        max_bytes (int, optional): Disk budget. Defaults to 4 GB.
+    """
+
+    def __init__(self, path=None, max_bytes=4 * 1024**3):
+        self.path = path or os.path.join(default_cache_dir(), "rasters")
+        self.max_bytes = max_bytes
+        self._rasters = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+
+    def __repr__(self):
+        return f"RasterStore(path={self.path!r}, max_bytes={self.max_bytes})"
+
+    def open(self, source):
+        """Returns a stored raster, converting the file on first use.
+
+        Args:
+            source (str): Path or URL of the raster.
+
+        Returns:
+            StoredRaster: The stored raster.
+        """
+        source = str(source)
+        if not _is_remote(source):
+            source = os.path.abspath(source)
+        key = _key(source)
+        path = os.path.join(self.path, key)
+        meta = os.path.join(path, "meta.json")
+        if os.path.exists(meta):
+            perf.count("store.hits")
+            os.utime(meta)
+        else:
+            perf.count("store.misses")
+            self._convert(source, path)
+            self._evict(keep=key)
+        with self._lock:
+            raster = self._rasters.get(key)
+            if raster is None:
+                raster = self._rasters[key] = StoredRaster(path)
+        return raster
+
+    def band(self, source, band=1, level=0):
+        """Returns one band of a raster file from the store.
+
+        Args:
+            source (str): Path to the raster file.
+            band (int, optional): The band number (1-based). Defaults to 1.
+            level (int, optional): 0 for full resolution, 1 and more for the overviews. Defaults to 0.
+
+        Returns:
+            StoredBand: The band.
+        """
+        return self.open(source).band(band, level)
+
+    @perf.timed("store.convert")
+    def _convert(self, source, path, blocksize=1024):
+        _check_rasterio()
+        import rasterio
+
+        partial = f"{path}.partial-{uuid.uuid4().hex}"
+        os.makedirs(partial)
+        try:
+            with rasterio.open(source) as src:
+                count, width, height = src.count, src.width, src.height
+                level0 = np.memmap(os.path.join(partial, "level0.raw"), dtype="float32", mode="w+", shape=(count, height, width))
+                low = np.full(count, np.nan)
+                high = np.full(count, np.nan)
+                for window in block_windows(width, height, blocksize):
+                    data = src.read(window=window, out_dtype="float32", masked=True).filled(np.nan)
+                    (row_start, row_stop), (col_start, col_stop) = window.toranges()
+                    level0[:, row_start:row_stop, col_start:col_stop] = data
+                    low = np.fmin(low, np.fmin.reduce(data.reshape(count, -1), axis=1))
+                    high = np.fmax(high, np.fmax.reduce(data.reshape(count, -1), axis=1))
+                meta = {
+                    "source": source,
+                    "count": count,
+                    "width": width,
+                    "height": height,
+                    "crs": src.crs.to_wkt() if src.crs else None,
+                    "transform": list(src.transform)[:6],
+                    "descriptions": list(src.descriptions),
+                    "statistics": [[None if np.isnan(a) else float(a), None if np.isnan(b) else float(b)] for a, b in zip(low, high)],
+                }
+
+            levels = [(width, height)]
+            previous = level0
+            while max(levels[-1]) > OVERVIEW_SIZE:
+                rows = previous.shape[1]
+                size = ((levels[-1][0] + 1) // 2, (levels[-1][1] + 1) // 2)
+                level = np.memmap(
+                    os.path.join(partial, f"level{len(levels)}.raw"), dtype="float32", mode="w+", shape=(count, size[1], size[0])
+                )
+                for start in range(0, rows, blocksize):
+                    level[:, start // 2:(start + blocksize + 1) // 2] = _downsample(previous[:, start:start + blocksize])
+                level.flush()
+                previous = level
+                levels.append(size)
+            level0.flush()
+            del level0, previous
+            meta["levels"] = levels
+            with open(os.path.join(partial, "meta.json"), "w") as f:
+                json.dump(meta, f)
+            try:
+                os.rename(partial, path)
+            except OSError:
+                # Converted by another process in the meantime.
+                shutil.rmtree(partial, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(partial, ignore_errors=True)
+            raise
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.path):
+            meta = os.path.join(self.path, name, "meta.json")
+            if "." in name or not os.path.exists(meta):
+                continue
+            directory = os.path.join(self.path, name)
+            size = sum(entry.stat().st_size for entry in os.scandir(directory))
+            entries.append((os.stat(meta).st_mtime, name, size))
+        return sorted(entries)
+
+    def _evict(self, keep=None):
+        entries = self._entries()
+        total = sum(size for _, _, size in entries)
+        for _, name, size in entries:
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            with self._lock:
+                raster = self._rasters.pop(name, None)
+            if raster is not None:
+                raster.close()
+            shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+            perf.count("store.evictions")
+            total -= size
+
+    def size(self):
+        """Returns the number of stored rasters and their total size in bytes.
+
+        Returns:
+            tuple: (rasters, bytes)
+        """
+        entries = self._entries()
+        return len(entries), sum(size for _, _, size in entries)
+
+    def clear(self):
+        """Removes every stored raster."""
+        with self._lock:
+            rasters, self._rasters = self._rasters, {}
+        for raster in rasters.values():
+            raster.close()
+        for _, name, _ in self._entries():
+            shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+
+def set_raster_store(store=True):
+    """Reads local rasters through a ``RasterStore`` in band math, zonal stats and ``Map.add_raster``.
+
+    Args:
+        store (RasterStore | str | bool, optional): A store, the directory of one, True for the default directory, or None/False to stop using it. Defaults to True.
+
+    Returns:
+        RasterStore: The store in use, or None.
+    """
+    global _store
+    if store is True or isinstance(store, str):
+        store = RasterStore(None if store is True else store)
+    _store = store or None
+    return _store
+
+
+def get_raster_store():
+    """Returns the raster store set by ``set_raster_store``, or None."""
+    return _store
+
+
+@functools.lru_cache(maxsize=32)
+def _colormap_lut(colormap):
+    """Returns the (256, 4) uint8 RGBA palette of a matplotlib colormap.
+
+    Entries 0-254 sample the colormap and entry 255 is transparent, for nodata.
+    """
+    import matplotlib
+
+    lut = np.zeros((256, 4), dtype="uint8")
+    lut[:255] = (matplotlib.colormaps[colormap](np.linspace(0, 1, 255)) * 255).round()
+    return lut
+
+
+def _scale(values, vmin, vmax, top=255):
+    """Scales values to 0-top bytes between vmin and vmax."""
+    scaled = (values - vmin) * (top / ((vmax - vmin) or 1))
+    np.clip(scaled, 0, top, out=scaled)
+    return np.nan_to_num(scaled).astype("uint8")
+
+
+class StoreSource(TileSource):
+    """Tiles of a stored raster, rendered from the overview matching each zoom.
+
+    Supports one band with a colormap, or three bands as RGB, stretched
+    between ``vmin`` and ``vmax`` (the band range by default).
+
+    Args:
+        raster (StoredRaster): The stored raster.
+        style (dict, optional): Rendering options (indexes, colormap, vmin, vmax). Defaults to None.
+    """
+
+    STYLE_KEYS = ("indexes", "colormap", "vmin", "vmax")
+    cacheable = False
+
+    def __init__(self, raster, style=None):
+        style = dict(style or {})
+        if not self.supports(style):
+            raise ValueError(f"StoreSource only supports the {self.STYLE_KEYS} options.")
+        self.raster = raster
+        self.path = raster.path
+        self.indexes = list(style.get("indexes") or ([1, 2, 3] if raster.count >= 3 else [1]))
+        if len(self.indexes) not in (1, 3):
+            raise ValueError("Give one band, or three bands for RGB.")
+        statistics = [raster.statistics[i - 1] for i in self.indexes]
+        self.vmin = style.get("vmin", min((low for low, _ in statistics if low is not None), default=0))
+        self.vmax = style.get("vmax", max((high for _, high in statistics if high is not None), default=1))
+        self.lut = _colormap_lut(style["colormap"]) if style.get("colormap") and len(self.indexes) == 1 else None
+        identity = json.dumps([raster.key, self.indexes, self.vmin, self.vmax, style.get("colormap")])
+        self.key = hashlib.sha1(identity.encode("utf-8")).hexdigest()
+        self._set_extent(raster.crs, _bounds(raster), raster.width)
+
+    def _set_extent(self, crs, bounds, width):
+        """Sets the bounds and the zoom range of a raster of ``width`` pixels covering ``bounds`` in ``crs``."""
+        from rasterio.warp import transform_bounds
+
+        west, south, east, north = transform_bounds(crs, "EPSG:4326", *bounds)
+        self.bounds = (west, south, east, north)
+        left, bottom, right, top = transform_bounds(crs, "EPSG:3857", *bounds)
+        world = 2 * EARTH_HALF_CIRCUMFERENCE
+        resolution = (right - left) / width
+        self.max_zoom = max(0, min(24, math.ceil(math.log2(world / (TILE_SIZE * resolution)))))
+        self.min_zoom = max(0, min(self.max_zoom, math.floor(math.log2(world / max(right - left, top - bottom)))))
+        self._mercator = (left, bottom, right, top)
+
+    @classmethod
+    def supports(cls, style):
+        """Tells whether a style can be rendered from the store."""
+        return all(key in cls.STYLE_KEYS for key in style)
+
+    def render(self, server, z, x, y):
+        pixels = self.render_image(tile_bounds(z, x, y), TILE_SIZE, TILE_SIZE)
+        return None if pixels is None else _encode_png(pixels, self.lut)
+
+    def render_image(self, bounds, width, height):
+        """Renders an area in Web Mercator to RGBA pixels.
+
+        Args:
+            bounds (tuple): (left, bottom, right, top) in EPSG:3857 meters.
+            width (int): Image width in pixels.
+            height (int): Image height in pixels.
+
+        Returns:
+            np.ndarray: (height, width, 4) RGBA bytes, or (height, width) indices in ``lut`` with a colormap. None if the area is empty.
+        """
+        from rasterio.enums import Resampling
+        from rasterio.transform import from_bounds
+        from rasterio.warp import reproject, transform_bounds
+        from rasterio.windows import Window
+        from rasterio.windows import from_bounds as window_from_bounds
+        from rasterio.windows import transform as window_transform
+
+        left, bottom, right, top = bounds
+        mleft, mbottom, mright, mtop = self._mercator
+        if right <= mleft or left >= mright or top <= mbottom or bottom >= mtop:
+            return None
+
+        raster = self.raster
+        # Pick the overview whose pixels are about as large as the image's.
+        scale = (right - left) / width / ((mright - mleft) / raster.width)
+        level = raster.level_for(abs(raster.transform.a) * scale)
+        level_width, level_height = raster.levels[level]
+        transform = raster.level_transform(level)
+
+        window = window_from_bounds(*transform_bounds("EPSG:3857", raster.crs, left, bottom, right, top), transform)
+        col_start = max(0, math.floor(window.col_off) - 1)
+        row_start = max(0, math.floor(window.row_off) - 1)
+        col_stop = min(level_width, math.ceil(window.col_off + window.width) + 1)
+        row_stop = min(level_height, math.ceil(window.row_off + window.height) + 1)
+        if col_stop <= col_start or row_stop <= row_start:
+            return None
+        window = Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
+
+        bands = np.full((len(self.indexes), height, width), np.nan, dtype="float32")
+        for i, index in enumerate(self.indexes):
+            reproject(
+                np.ascontiguousarray(raster.read(window, band=index, level=level)),
+                bands[i],
+                src_transform=window_transform(window, transform),
+                src_crs=raster.crs,
+                src_nodata=np.nan,
+                dst_transform=from_bounds(left, bottom, right, top, width, height),
+                dst_crs="EPSG:3857",
+                dst_nodata=np.nan,
+                resampling=Resampling.nearest,
+            )
+        valid = np.isfinite(bands).all(axis=0)
+        if not valid.any():
+            return None
+        return self._colorize(bands, valid)
+
+    def overview(self, max_size=2048):
+        """Renders the whole raster to one image in Web Mercator.
+
+        Args:
+            max_size (int, optional): Size of the longest side in pixels. Defaults to 2048.
+
+        Returns:
+            tuple: (png bytes, [[south, west], [north, east]] bounds in degrees)
+        """
+        left, bottom, right, top = self._mercator
+        ratio = (right - left) / (top - bottom)
+        width = max(1, round(max_size * min(1, ratio)))
+        height = max(1, round(max_size * min(1, 1 / ratio)))
+        pixels = self.render_image(self._mercator, width, height)
+        if pixels is None:
+            pixels = np.full((height, width), 255, dtype="uint8") if self.lut is not None else np.zeros((height, width, 4), dtype="uint8")
+        west, south, east, north = self.bounds
+        return _encode_png(pixels, self.lut), [[south, west], [north, east]]
+
+    def _colorize(self, bands, valid):
+        if self.lut is not None:
+            indices = _scale(bands[0], self.vmin, self.vmax, 254)
+            indices[~valid] = 255
+            return indices
+        scaled = _scale(bands, self.vmin, self.vmax)
+        rgba = np.empty(scaled.shape[1:] + (4,), dtype="uint8")
+        rgba[..., :3] = np.moveaxis(scaled, 0, -1) if len(scaled) == 3 else scaled[0][..., None]
+        rgba[..., 3] = np.where(valid, 255, 0)
+        return rgba
+
+
+def _bounds(raster):
+    """Returns the (left, bottom, right, top) bounds of a stored raster in its CRS."""
+    from rasterio.transform import array_bounds
+
+    return array_bounds(raster.height, raster.width, raster.transform)
+
+
+def _encode_png(pixels, lut=None):
+    """Encodes RGBA pixels, or palette indices with their (256, 4) palette, as PNG."""
+    import io
+
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    if lut is None:
+        Image.fromarray(pixels, "RGBA").save(buffer, format="PNG")
+    else:
+        image = Image.fromarray(pixels)
+        image.putpalette(lut[:, :3].tobytes())
+        image.save(buffer, format="PNG", transparency=lut[:, 3].tobytes())
+    return buffer.getvalue()
@@ -0,0 +1,536 @@
+"""The tiles module downloads XYZ map tiles for offline use and stores them as MBTiles.
+"""
+
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
+from .client import get_client
+from .tileserver import TileSource
+
+EARTH_HALF_CIRCUMFERENCE = 20037508.342789244
+
+
+def lonlat_to_tile(lon, lat, z):
+    """Returns the XYZ tile containing a point.
+
+    Args:
+        lon (float): Longitude in degrees.
+        lat (float): Latitude in degrees.
+        z (int): Zoom level.
+
+    Returns:
+        tuple: (x, y)
+    """
+    n = 2**z
+    lat = max(min(lat, 85.0511287798), -85.0511287798)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_bounds(z, x, y):
+    """Returns the Web Mercator bounds of a tile in meters.
+
+    Args:
+        z (int): Zoom level.
+        x (int): Tile column.
+        y (int): Tile row.
+
+    Returns:
+        tuple: (left, bottom, right, top)
+    """
+    size = 2 * EARTH_HALF_CIRCUMFERENCE / 2**z
+    left = -EARTH_HALF_CIRCUMFERENCE + x * size
+    top = EARTH_HALF_CIRCUMFERENCE - y * size
+    return (left, top - size, left + size, top)
+
+
+def tiles_for_bounds(bounds, zooms):
+    """Lists the tiles covering a bounding box.
+
+    Args:
+        bounds (tuple): (west, south, east, north) in degrees.
+        zooms (int | range | list): The zoom levels.
+
+    Returns:
+        list: (z, x, y) tuples.
+    """
+    if isinstance(zooms, int):
+        zooms = [zooms]
+    west, south, east, north = bounds
+    tiles = []
+    for z in zooms:
+        x0, y0 = lonlat_to_tile(west, north, z)
+        x1, y1 = lonlat_to_tile(east, south, z)
+        tiles.extend((z, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+    return tiles
+
+
+def geojson_bounds(geojson):
+    """Returns the bounding box of a GeoJSON geometry, Feature or FeatureCollection.
+
+    Args:
+        geojson (dict): The GeoJSON.
+
+    Returns:
+        tuple: (west, south, east, north)
+    """
+    xs, ys = [], []
+
+    def walk(coordinates):
+        if coordinates and isinstance(coordinates[0], (int, float)):
+            xs.append(coordinates[0])
+            ys.append(coordinates[1])
+        else:
+            for item in coordinates:
+                walk(item)
+
+    if geojson.get("type") == "FeatureCollection":
+        for feature in geojson["features"]:
+            walk(feature["geometry"]["coordinates"])
+    elif geojson.get("type") == "Feature":
+        walk(geojson["geometry"]["coordinates"])
+    else:
+        walk(geojson["coordinates"])
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+class TilePlan:
+    """The tiles to download for a set of tile URLs and an area.
+
+    Args:
+        urls (dict): Name (e.g. date) to XYZ URL template.
+        tiles (list): The (z, x, y) tiles covering the area.
+        tile_bytes (int): Estimated size of one tile in bytes.
+    """
+
+    def __init__(self, urls, tiles, tile_bytes):
+        self.urls = urls
+        self.tiles = tiles
+        self.tile_bytes = tile_bytes
+
+    @property
+    def count(self):
+        """Returns the total number of tiles to download."""
+        return len(self.tiles) * len(self.urls)
+
+    @property
+    def bytes(self):
+        """Returns the estimated download size in bytes."""
+        return self.count * self.tile_bytes
+
+    def __repr__(self):
+        return f"TilePlan(layers={len(self.urls)}, tiles={self.count}, estimated_mb={self.bytes / 1024**2:.1f})"
+
+
+def plan_download(urls, bounds, zooms, tile_bytes=None, sample=3):
+    """Counts the tiles and bytes needed to cover an area before downloading.
+
+    Args:
+        urls (dict): Name (e.g. date) to XYZ URL template.
+        bounds (tuple): (west, south, east, north) in degrees.
+        zooms (int | range | list): The zoom levels.
+        tile_bytes (int, optional): Size of one tile. Defaults to the mean of ``sample`` downloaded tiles.
+        sample (int, optional): Number of tiles downloaded to estimate the size. Defaults to 3.
+
+    Returns:
+        TilePlan: The download plan.
+    """
+    tiles = tiles_for_bounds(bounds, zooms)
+    if tile_bytes is None:
+        sizes = []
+        template = next(iter(urls.values()), None)
+        if template is not None:
+            responses = get_client().get_many([template.format(z=z, x=x, y=y) for z, x, y in tiles[-sample:]])
+            sizes = [len(response.content) for response in responses if response.status_code == 200]
+        tile_bytes = int(sum(sizes) / len(sizes)) if sizes else 20 * 1024
+    return TilePlan(urls, tiles, tile_bytes)
+
+
+class MBTiles:
+    """A deduplicated MBTiles file.
+
+    Identical tiles (e.g. the empty tiles around a field) are stored once,
+    using the ``map``/``images`` layout of the MBTiles specification.
+
+    Args:
+        path (str): Path to the .mbtiles file, created if missing.
+        metadata (dict, optional): Metadata written when the file is created. Defaults to None.
+    """
+
+    def __init__(self, path, metadata=None):
+        self.path = path
+        self._lock = threading.Lock()
+        exists = os.path.exists(path)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        if not exists:
+            self._conn.executescript(
+                """
+                CREATE TABLE metadata (name TEXT, value TEXT);
+                CREATE TABLE images (tile_id TEXT PRIMARY KEY, tile_data BLOB);
+                CREATE TABLE map (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_id TEXT);
+                CREATE UNIQUE INDEX map_index ON map (zoom_level, tile_column, tile_row);
+                CREATE VIEW tiles AS SELECT map.zoom_level, map.tile_column, map.tile_row, images.tile_data
+                    FROM map JOIN images ON images.tile_id = map.tile_id;
+                """
+            )
+            metadata = dict({"format": "png", "type": "overlay"}, **(metadata or {}))
+            self._conn.executemany("INSERT INTO metadata VALUES (?, ?)", list(metadata.items()))
+            self._conn.commit()
+
+    def metadata(self):
+        """Returns the metadata of the file.
+
+        Returns:
+            dict: The metadata.
+        """
+        return dict(self._conn.execute("SELECT name, value FROM metadata").fetchall())
+
+    def stored_tiles(self):
+        """Returns the stored tiles.
+
+        Returns:
+            set: (z, x, y) tuples in XYZ scheme.
+        """
+        rows = self._conn.execute("SELECT zoom_level, tile_column, tile_row FROM map").fetchall()
+        return {(z, x, 2**z - 1 - row) for z, x, row in rows}
+
+    def put(self, z, x, y, data):
+        """Stores a tile.
+
+        Args:
+            z (int): Zoom level.
+            x (int): Tile column.
+            y (int): Tile row (XYZ scheme).
+            data (bytes): The encoded tile.
+        """
+        tile_id = hashlib.sha1(data).hexdigest()
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO images VALUES (?, ?)", (tile_id, data))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO map VALUES (?, ?, ?, ?)", (z, x, 2**z - 1 - y, tile_id)
+            )
+
+    def get(self, z, x, y):
+        """Returns a tile.
+
+        Args:
+            z (int): Zoom level.
+            x (int): Tile column.
+            y (int): Tile row (XYZ scheme).
+
+        Returns:
+            bytes: The encoded tile, or None if it is missing.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (z, x, 2**z - 1 - y),
+            ).fetchone()
+        return row[0] if row else None
+
+    def zoom_range(self):
+        """Returns the lowest and highest zoom levels stored.
+
+        Returns:
+            tuple: (min_zoom, max_zoom), (None, None) if the file is empty.
+        """
+        with self._lock:
+            return self._conn.execute("SELECT MIN(zoom_level), MAX(zoom_level) FROM map").fetchone()
+
+    def commit(self):
+        """Commits the stored tiles."""
+        with self._lock:
+            self._conn.commit()
+
+    def close(self):
+        """Closes the file."""
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+
+def harvest(urls, bounds, zooms, directory, max_workers=8, max_tiles=10000, progress=True):
+    """Downloads the tiles of several layers into one MBTiles file per layer.
+
+    Tiles already in the files are skipped, so an interrupted download
+    resumes where it stopped, and layers with the same URL template are
+    only downloaded once. Tiles are written to the files as they arrive,
+    and downloads go through the shared client, so its rate limiter keeps
+    a large harvest within the API quota.
+
+    Args:
+        urls (dict): Name (e.g. date) to XYZ URL template.
+        bounds (tuple): (west, south, east, north) in degrees.
+        zooms (int | range | list): The zoom levels.
+        directory (str): Directory of the MBTiles files.
+        max_workers (int, optional): Number of concurrent downloads. Defaults to 8.
+        max_tiles (int, optional): Refuse plans with more tiles than this. Defaults to 10000.
+        progress (bool, optional): Print the progress of each layer. Defaults to True.
+
+    Returns:
+        dict: Name to MBTiles path.
+    """
+    plan = plan_download(urls, bounds, zooms, tile_bytes=0)
+    if plan.count > max_tiles:
+        raise ValueError(f"{plan.count} tiles requested, more than max_tiles={max_tiles}.")
+    os.makedirs(directory, exist_ok=True)
+
+    client = get_client()
+    downloaded_by = {}
+    paths = {}
+    for name, template in urls.items():
+        path = os.path.join(directory, f"{_safe_name(name)}.mbtiles")
+        west, south, east, north = bounds
+        store = MBTiles(path, {"name": str(name), "bounds": f"{west},{south},{east},{north}"})
+        stored = store.stored_tiles()
+        todo = [tile for tile in plan.tiles if tile not in stored]
+        done = failed = 0
+        source_path = downloaded_by.get(template)
+        if source_path is not None:
+            # Same URLs as an earlier layer: its tiles are copied instead of downloaded again.
+            source = MBTiles(source_path)
+            try:
+                for z, x, y in todo:
+                    data = source.get(z, x, y)
+                    if data is None:
+                        failed += 1
+                    else:
+                        store.put(z, x, y, data)
+            finally:
+                source.close()
+        else:
+            downloaded_by[template] = path
+            # Tiles are written as they arrive, so memory does not grow with the harvest.
+            for (z, x, y), data in _download(client, template, todo, max_workers):
+                if data is None:
+                    failed += 1
+                    continue
+                store.put(z, x, y, data)
+                done += 1
+                if done % 100 == 0:
+                    store.commit()
+        store.close()
+        if progress:
+            print(
+                f"{name}: {done} tiles downloaded, {len(todo) - done - failed} copied, "
+                f"{failed} failed, {len(plan.tiles) - len(todo)} already stored"
+            )
+        paths[name] = path
+    return paths
+
+
+def _download(client, template, tiles, max_workers):
+    """Yields ((z, x, y), data) for each tile, data being None if the download failed.
+
+    At most ``2 * max_workers`` downloads are in flight.
+    """
+
+    def fetch(tile):
+        z, x, y = tile
+        response = client.get(template.format(z=z, x=x, y=y))
+        return tile, response.content if response.status_code == 200 else None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = set()
+        for tile in tiles:
+            pending.add(executor.submit(fetch, tile))
+            if len(pending) >= 2 * max_workers:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    yield future.result()
+        for future in as_completed(pending):
+            yield future.result()
+
+
+def harvest_agromonitoring(API_Key, PolygonId, StartDate, EndDate, data, zooms, directory, max_cloud=None, **kwargs):
+    """Downloads the Agromonitoring tiles of a polygon for offline use.
+
+    Args:
+        API_Key (str): Agromonitoring API Key.
+        PolygonId (str): Polygon Id created in Agromonitoring (Area of Interest)
+        StartDate (str): Provide the date of starting from (format ex."YYYY-MM-DD")
+        EndDate (str): Provide the date of till last search (format ex."YYYY-MM-DD")
+        data (str): The product, e.g. "ndvi" or "truecolor".
+        zooms (int | range | list): The zoom levels.
+        directory (str): Directory of the MBTiles files.
+        max_cloud (float, optional): Skip scenes with a cloud cover above this percentage. Defaults to None.
+        **kwargs: Passed to ``harvest``.
+
+    Returns:
+        dict: "<date> <data>" to MBTiles path.
+    """
+    from .agromonitoring import ALLOWED_DATA, get_polygon_registry, search_images
+
+    if data not in ALLOWED_DATA:
+        print("The given data is not available in Agromonitoring")
+        return {}
+
+    geometry = get_polygon_registry(API_Key).geometry(PolygonId)
+    search = search_images(API_Key, PolygonId, StartDate, EndDate)
+    if geometry is None or search is None:
+        print("No data to download.")
+        return {}
+
+    scenes = search.dataframe
+    column = f"tile_{data}"
+    if len(scenes) == 0 or column not in scenes:
+        print(f"No {data} tiles found for polygon {PolygonId} between {StartDate} and {EndDate}.")
+        return {}
+    if max_cloud is not None:
+        scenes = scenes[scenes['Cloud'].fillna(0) <= max_cloud]
+    urls = {}
+    for date, url in zip(scenes['Date'], scenes[column]):
+        if url is None:
+            continue
+        name = f"{date} {data}"
+        while name in urls:
+            name += "'"
+        urls[name] = url
+    return harvest(urls, geojson_bounds(geometry), zooms, directory, **kwargs)
+
+
+def render_tiles(source, directory, zooms=None, max_workers=8, max_tiles=100000):
+    """Renders the tiles of a tile source into a static ``{z}/{x}/{y}.png`` tree.
+
+    The tiles can then be served by any static web server or opened next to
+    an exported HTML map, without a running tile server. Empty tiles are not
+    written.
+
+    Args:
+        source (TileSource): The source, e.g. a ``leafagro.store.StoreSource``.
+        directory (str): The output directory.
+        zooms (int | range | list, optional): The zoom levels. Defaults to the source's zoom range.
+        max_workers (int, optional): Number of rendering threads. Defaults to 8.
+        max_tiles (int, optional): Refuse to render more tiles than this. Defaults to 100000.
+
+    Returns:
+        int: The number of tiles written.
+    """
+    from .tileserver import get_tile_server
+
+    if zooms is None:
+        zooms = range(source.min_zoom, source.max_zoom + 1)
+    tiles = tiles_for_bounds(source.bounds, zooms)
+    if len(tiles) > max_tiles:
+        raise ValueError(f"{len(tiles)} tiles requested, more than max_tiles={max_tiles}.")
+    server = get_tile_server()
+    extension = "pbf" if source.media_type == "application/x-protobuf" else "png"
+
+    def render(tile):
+        z, x, y = tile
+        data = source.render(server, z, x, y)
+        if data is None:
+            return 0
+        path = os.path.join(directory, str(z), str(x), f"{y}.{extension}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        return 1
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return sum(executor.map(render, tiles))
+
+
+def _safe_name(name):
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in str(name))
+
+
+def mbtiles_to_cog(path, output, zoom=None):
+    """Mosaics the tiles of one zoom level of an MBTiles file into a Cloud-Optimized GeoTIFF.
+
+    Args:
+        path (str): The MBTiles file.
+        output (str): The GeoTIFF to write (EPSG:3857, RGBA).
+        zoom (int, optional): The zoom level. Defaults to the highest one.
+
+    Returns:
+        str: The path of the output raster.
+    """
+    import io
+
+    import numpy as np
+    import rasterio
+    from PIL import Image
+    from rasterio.transform import from_bounds
+
+    from .raster import write_cog
+
+    store = MBTiles(path)
+    try:
+        if zoom is None:
+            zoom = store.zoom_range()[1]
+        tiles = [tile for tile in store.stored_tiles() if tile[0] == zoom]
+        if not tiles:
+            raise ValueError(f"No tiles at zoom {zoom} in {path}.")
+        xs = [x for _, x, _ in tiles]
+        ys = [y for _, _, y in tiles]
+        x0, y0 = min(xs), min(ys)
+        width, height = (max(xs) - x0 + 1) * 256, (max(ys) - y0 + 1) * 256
+
+        mosaic = np.zeros((4, height, width), dtype="uint8")
+        for z, x, y in tiles:
+            image = Image.open(io.BytesIO(store.get(z, x, y))).convert("RGBA").resize((256, 256))
+            row, col = (y - y0) * 256, (x - x0) * 256
+            mosaic[:, row:row + 256, col:col + 256] = np.moveaxis(np.asarray(image), -1, 0)
+    finally:
+        store.close()
+
+    left, _, _, top = tile_bounds(zoom, x0, y0)
+    _, bottom, right, _ = tile_bounds(zoom, max(xs), max(ys))
+    profile = {
+        "driver": "GTiff",
+        "width": width,
+        "height": height,
+        "count": 4,
+        "dtype": "uint8",
+        "crs": "EPSG:3857",
+        "transform": from_bounds(left, bottom, right, top, width, height),
+        "tiled": True,
+        "blockxsize": 256,
+        "blockysize": 256,
+        "photometric": "RGB",
+    }
+    staging = output + ".partial.tif"
+    with rasterio.open(staging, "w", **profile) as dst:
+        dst.write(mosaic)
+    try:
+        write_cog(staging, output)
+    finally:
+        os.remove(staging)
+    return output
+
+
+class MBTilesSource(TileSource):
+    """Serves the tiles of an MBTiles file through ``TileServer``.
+
+    Args:
+        path (str): The MBTiles file.
+    """
+
+    cacheable = False
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.store = MBTiles(self.path)
+        stat = os.stat(self.path)
+        self.key = hashlib.sha1(f"{self.path}:{stat.st_mtime_ns}".encode("utf-8")).hexdigest()
+        metadata = self.store.metadata()
+        if metadata.get("format") in ("jpg", "jpeg"):
+            self.media_type = "image/jpeg"
+        if "bounds" in metadata:
+            self.bounds = tuple(float(value) for value in metadata["bounds"].split(","))
+        zooms = self.store.zoom_range()
+        if zooms[0] is not None:
+            self.min_zoom, self.max_zoom = zooms
+
+    def render(self, server, z, x, y):
+        return self.store.get(z, x, y)
+
+    def close(self):
+        """Closes the MBTiles file."""
+        self.store.close()
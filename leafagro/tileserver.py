@@ -0,0 +1,536 @@
+"""The tileserver module serves map tiles of many local rasters from one shared in-process server.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from . import perf
+from .cache import default_cache_dir
+
+# Keyword arguments of add_raster that change how tiles are rendered.
+STYLE_KEYS = ("indexes", "colormap", "vmin", "vmax", "nodata", "stretch", "expression")
+
+
+def split_style(kwargs):
+    """Separates the rendering options from the layer options of add_raster.
+
+    The deprecated ``band``, ``bands`` and ``cmap`` names of localtileserver
+    are accepted as well.
+
+    Args:
+        kwargs (dict): The keyword arguments given to add_raster.
+
+    Returns:
+        tuple: (style, layer_kwargs)
+    """
+    kwargs = dict(kwargs)
+    if "band" in kwargs:
+        kwargs["indexes"] = kwargs.pop("band")
+    if "bands" in kwargs:
+        kwargs["indexes"] = kwargs.pop("bands")
+    if "cmap" in kwargs:
+        kwargs["colormap"] = kwargs.pop("cmap")
+    style = {key: kwargs.pop(key) for key in STYLE_KEYS if kwargs.get(key) is not None}
+    if isinstance(style.get("indexes"), int):
+        style["indexes"] = [style["indexes"]]
+    return style, kwargs
+
+
+def _is_remote(path):
+    """Tells whether a raster path is a URL or a GDAL virtual file system path."""
+    return "://" in path or path.startswith("/vsi")
+
+
+def _version(path):
+    """Identifies the version of a raster, to tell when its cached tiles are stale.
+
+    Local files are identified by their modification time and size, HTTP
+    URLs by their ETag and Last-Modified headers when the server gives them.
+    """
+    if not _is_remote(path):
+        stat = os.stat(path)
+        return [stat.st_mtime_ns, stat.st_size]
+    if not path.startswith(("http://", "https://")):
+        return None
+    import requests
+
+    try:
+        response = requests.head(path, allow_redirects=True, timeout=10)
+    except requests.exceptions.RequestException:
+        return None
+    if response.status_code != 200:
+        return None
+    return [response.headers.get("ETag"), response.headers.get("Last-Modified")]
+
+
+class TileSource:
+    """Base class of the tile sources served by ``TileServer``.
+
+    Subclasses set ``key`` (unique per content and style, used for caching),
+    ``bounds`` as (west, south, east, north), ``min_zoom`` and ``max_zoom``,
+    and implement ``render``. Sources that are already local tile stores set
+    ``cacheable`` to False to skip the on-disk tile cache.
+    """
+
+    key = None
+    cacheable = True
+    bounds = None
+    min_zoom = 0
+    max_zoom = 22
+    media_type = "image/png"
+    path = None
+
+    def render(self, server, z, x, y):
+        """Renders one tile.
+
+        Args:
+            server (TileServer): The server, giving access to shared dataset handles.
+            z (int): Zoom level.
+            x (int): Tile column.
+            y (int): Tile row.
+
+        Returns:
+            bytes: The encoded tile, or None if the tile is empty.
+        """
+        raise NotImplementedError
+
+    @property
+    def center(self):
+        """Returns the (lat, lon) center of the source."""
+        west, south, east, north = self.bounds
+        return ((south + north) / 2, (west + east) / 2)
+
+
+class RasterSource(TileSource):
+    """A local raster rendered with the same options as localtileserver.
+
+    Args:
+        path (str): Path to the raster file.
+        style (dict, optional): Rendering options (indexes, colormap, vmin, vmax, nodata, stretch, expression). Defaults to None.
+    """
+
+    def __init__(self, path, style=None):
+        path = str(path)
+        self.path = path if _is_remote(path) else os.path.abspath(path)
+        self.style = style or {}
+        identity = json.dumps([self.path, _version(self.path), self.style], sort_keys=True, default=str)
+        self.key = hashlib.sha1(identity.encode("utf-8")).hexdigest()
+
+    def load_metadata(self, server):
+        """Reads the bounds and zoom range of the raster.
+
+        Args:
+            server (TileServer): The server holding the dataset handles.
+        """
+        with server.reader(self.path) as reader:
+            self.bounds = tuple(reader.get_geographic_bounds(reader.tms.rasterio_geographic_crs))
+            self.min_zoom = reader.minzoom
+            self.max_zoom = reader.maxzoom
+
+    def render(self, server, z, x, y):
+        from localtileserver.tiler import get_tile
+        from rio_tiler.errors import TileOutsideBounds
+
+        with server.reader(self.path) as reader:
+            try:
+                return bytes(get_tile(reader, z, x, y, **self.style))
+            except TileOutsideBounds:
+                return None
+
+
+class _ReaderPool:
+    """The open rio-tiler readers of one raster.
+
+    A reader is used by one thread at a time, so tiles of the same raster
+    are rendered concurrently on separate readers. The lock only guards
+    checking readers in and out, never the rendering.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._idle = []
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def checkout(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        from localtileserver.tiler import get_reader
+
+        return get_reader(self.path)
+
+    def release(self, reader):
+        with self._lock:
+            if not self._closed:
+                self._idle.append(reader)
+                return
+        reader.close()
+
+    def close(self):
+        """Closes the idle readers, and the others as soon as they are released."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for reader in idle:
+            reader.close()
+
+
+class _ReaderHandle:
+    """Context manager lending a reader of a pool to the current thread."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.reader = None
+
+    def __enter__(self):
+        self.reader = self.pool.checkout()
+        return self.reader
+
+    def __exit__(self, *args):
+        reader, self.reader = self.reader, None
+        self.pool.release(reader)
+
+
+class TileServer:
+    """A tile server shared by every map layer of the session.
+
+    One HTTP server thread serves any number of registered sources. Open
+    dataset handles are reused through an LRU, and rendered tiles are cached
+    in memory and on disk per (source, style, z, x, y). When the disk cache
+    grows past ``disk_bytes`` the least recently used tiles are deleted.
+
+    Args:
+        host (str, optional): The interface to listen on. Defaults to "127.0.0.1".
+        port (int, optional): The port to listen on, 0 for any free port. Defaults to 0.
+        max_open (int, optional): Maximum number of open datasets. Defaults to 32.
+        memory_bytes (int, optional): Budget of the in-memory tile cache. Defaults to 64 MB.
+        cache_dir (str | bool, optional): Directory of the on-disk tile cache, False to disable. Defaults to "tiles" in ``default_cache_dir()``.
+        disk_bytes (int, optional): Budget of the on-disk tile cache. Defaults to 1 GB.
+    """
+
+    def __init__(
+        self, host="127.0.0.1", port=0, max_open=32, memory_bytes=64 * 1024**2, cache_dir=None, disk_bytes=1024**3
+    ):
+        if cache_dir is None:
+            cache_dir = os.path.join(default_cache_dir(), "tiles")
+        self.host = host
+        self.port = port
+        self.max_open = max_open
+        self.memory_bytes = memory_bytes
+        self.cache_dir = cache_dir or None
+        self.disk_bytes = disk_bytes
+
+        self._sources = {}
+        self._readers = OrderedDict()
+        self._tiles = OrderedDict()
+        self._tiles_size = 0
+        self._disk_size = None
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._httpd = None
+
+    # Server ---------------------------------------------------------------
+
+    @perf.timed("tileserver.start")
+    def start(self):
+        """Starts the HTTP server thread if it is not running yet."""
+        with self._lock:
+            if self._httpd is not None:
+                return
+            perf.count("tileserver.starts")
+            self._httpd = ThreadingHTTPServer((self.host, self.port), _make_handler(self))
+            self._httpd.daemon_threads = True
+            self.port = self._httpd.server_port
+            thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+            thread.start()
+
+    def shutdown(self):
+        """Stops the server and closes every open dataset."""
+        with self._lock:
+            httpd, self._httpd = self._httpd, None
+            readers, self._readers = self._readers, OrderedDict()
+        if httpd is not None:
+            httpd.shutdown()
+            httpd.server_close()
+        for pool in readers.values():
+            pool.close()
+
+    @property
+    def base_url(self):
+        """Returns the URL prefix of the tiles.
+
+        Set the ``LEAFAGRO_TILE_PREFIX`` environment variable, e.g. to
+        "/proxy/{port}" with jupyter-server-proxy, when the browser cannot
+        reach the kernel's localhost.
+        """
+        prefix = os.environ.get("LEAFAGRO_TILE_PREFIX")
+        if prefix:
+            return prefix.format(port=self.port).rstrip("/")
+        return f"http://{self.host}:{self.port}"
+
+    # Sources --------------------------------------------------------------
+
+    @perf.timed("tileserver.register")
+    def register(self, source):
+        """Registers a tile source and returns its URL template.
+
+        Args:
+            source (TileSource): The source to serve.
+
+        Returns:
+            tuple: (source_id, url template with {z}/{x}/{y})
+        """
+        self.start()
+        if isinstance(source, RasterSource) and source.bounds is None:
+            source.load_metadata(self)
+        source_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._sources[source_id] = source
+        return source_id, self.url(source_id)
+
+    def url(self, source_id):
+        """Returns the URL template of a registered source.
+
+        Args:
+            source_id (str): The source id.
+
+        Returns:
+            str: The URL template.
+        """
+        return f"{self.base_url}/tiles/{source_id}/{{z}}/{{x}}/{{y}}"
+
+    def source(self, source_id):
+        """Returns a registered source, or None.
+
+        Args:
+            source_id (str): The source id.
+
+        Returns:
+            TileSource: The source.
+        """
+        return self._sources.get(source_id)
+
+    def unregister(self, source_id):
+        """Stops serving a source and releases what only it used.
+
+        Args:
+            source_id (str): The source id.
+        """
+        with self._lock:
+            source = self._sources.pop(source_id, None)
+            if source is None:
+                return
+            still_used = {other.key for other in self._sources.values()}
+            if source.key not in still_used:
+                for key in [key for key in self._tiles if key[0] == source.key]:
+                    self._tiles_size -= len(self._tiles.pop(key) or b"")
+            paths = {other.path for other in self._sources.values()}
+            pool = None
+            if source.path is not None and source.path not in paths:
+                pool = self._readers.pop(source.path, None)
+        if pool is not None:
+            pool.close()
+        close = getattr(source, "close", None)
+        if close is not None:
+            close()
+
+    def reader(self, path):
+        """Returns a reader of a raster for the current thread.
+
+        Readers are kept open and reused, and threads rendering the same
+        raster at the same time each get their own reader.
+
+        Args:
+            path (str): Path to the raster.
+
+        Returns:
+            _ReaderHandle: A context manager yielding a rio-tiler reader.
+        """
+        evicted = []
+        with self._lock:
+            pool = self._readers.get(path)
+            if pool is None:
+                pool = self._readers[path] = _ReaderPool(path)
+                while len(self._readers) > self.max_open:
+                    evicted.append(self._readers.popitem(last=False)[1])
+            self._readers.move_to_end(path)
+        for old in evicted:
+            old.close()
+        return _ReaderHandle(pool)
+
+    # Tiles ----------------------------------------------------------------
+
+    def _disk_path(self, key, z, x, y):
+        return os.path.join(self.cache_dir, key[:2], key, str(z), str(x), f"{y}.tile")
+
+    def _disk_entries(self):
+        entries = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if name.endswith(".tile"):
+                    stat = os.stat(os.path.join(root, name))
+                    entries.append((stat.st_mtime, os.path.join(root, name), stat.st_size))
+        return sorted(entries)
+
+    def _store_on_disk(self, disk_path, data):
+        os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+        partial = f"{disk_path}.{threading.get_ident()}"
+        with open(partial, "wb") as f:
+            f.write(data or b"")
+        os.replace(partial, disk_path)
+
+        with self._lock:
+            if self._disk_size is not None:
+                self._disk_size += len(data or b"")
+                if self._disk_size <= self.disk_bytes:
+                    return
+        self._evict_disk()
+
+    def _evict_disk(self):
+        """Deletes the least recently used tiles until the disk cache is back to 90% of its budget."""
+        with self._disk_lock:
+            entries = self._disk_entries()
+            total = sum(size for _, _, size in entries)
+            if total > self.disk_bytes:
+                for _, path, size in entries:
+                    if total <= 0.9 * self.disk_bytes:
+                        break
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        continue
+                    perf.count("tiles.disk_evictions")
+                    total -= size
+            with self._lock:
+                self._disk_size = total
+
+    def _remember(self, cache_key, data):
+        with self._lock:
+            if cache_key in self._tiles:
+                return
+            self._tiles[cache_key] = data
+            self._tiles_size += len(data or b"")
+            while self._tiles_size > self.memory_bytes and self._tiles:
+                _, old = self._tiles.popitem(last=False)
+                self._tiles_size -= len(old or b"")
+
+    def get_tile(self, source_id, z, x, y):
+        """Returns one tile, rendering it only if it is not cached.
+
+        Args:
+            source_id (str): The source id.
+            z (int): Zoom level.
+            x (int): Tile column.
+            y (int): Tile row.
+
+        Returns:
+            bytes: The encoded tile, or None if the tile is empty or the source is unknown.
+        """
+        source = self._sources.get(source_id)
+        if source is None:
+            return None
+        cache_key = (source.key, z, x, y)
+        with self._lock:
+            if cache_key in self._tiles:
+                self._tiles.move_to_end(cache_key)
+                perf.count("tiles.memory_hits")
+                return self._tiles[cache_key]
+
+        disk_path = None
+        if self.cache_dir and source.cacheable:
+            disk_path = self._disk_path(source.key, z, x, y)
+        hit = False
+        if disk_path is not None:
+            try:
+                with open(disk_path, "rb") as f:
+                    data = f.read() or None
+                # The modification time orders the tiles for eviction.
+                os.utime(disk_path)
+                hit = True
+                perf.count("tiles.disk_hits")
+            except FileNotFoundError:
+                pass
+        if not hit:
+            with perf.span("tileserver.render"):
+                data = source.render(self, z, x, y)
+            perf.count("tiles.rendered")
+            if disk_path is not None:
+                self._store_on_disk(disk_path, data)
+
+        self._remember(cache_key, data)
+        return data
+
+    def info(self):
+        """Returns the number of sources, open datasets and cached tiles.
+
+        Returns:
+            dict: Counters of the server.
+        """
+        with self._lock:
+            return {
+                "sources": len(self._sources),
+                "open_datasets": len(self._readers),
+                "cached_tiles": len(self._tiles),
+                "cached_bytes": self._tiles_size,
+            }
+
+
+def _make_handler(server):
+    class TileHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = self.path.split("?", 1)[0].strip("/").split("/")
+            if len(parts) != 5 or parts[0] != "tiles":
+                self.send_error(404)
+                return
+            try:
+                z, x, y = int(parts[2]), int(parts[3]), int(parts[4].split(".")[0])
+            except ValueError:
+                self.send_error(400)
+                return
+            source = server.source(parts[1])
+            try:
+                data = server.get_tile(parts[1], z, x, y)
+            except Exception as e:
+                self.send_error(500, str(e))
+                return
+            if data is None:
+                self.send_response(204)
+                self.send_header("Access-Control-Allow-Origin", "*")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", source.media_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.send_header("Cache-Control", "max-age=3600")
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return TileHandler
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def get_tile_server():
+    """Returns the shared tile server, creating it on first use.
+
+    Returns:
+        TileServer: The shared server.
+    """
+    global _server
+    if _server is None:
+        with _server_lock:
+            if _server is None:
+                _server = TileServer()
+    return _server
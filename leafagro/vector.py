@@ -0,0 +1,652 @@
+"""The vector module loads large vector layers (shapefiles, GeoJSON, GeoPackage) in chunks.
+"""
+
+import hashlib
+import json
+import math
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from . import perf
+from .tileserver import TileSource
+
+WGS84 = "EPSG:4326"
+WEB_MERCATOR = "EPSG:3857"
+
+# Property added to every vector tile feature to identify it across tiles.
+FEATURE_ID = "leafagro_id"
+
+# Features read per chunk by iter_vector.
+CHUNK_SIZE = 10000
+
+# Decimals of a degree kept by quantize_geojson, about 10 cm.
+GEOJSON_PRECISION = 6
+
+
+def _pyogrio():
+    try:
+        import pyogrio
+    except ImportError:
+        raise ImportError("Please install pyogrio package")
+    return pyogrio
+
+
+def _mapbox_vector_tile():
+    try:
+        import mapbox_vector_tile
+    except ImportError:
+        raise ImportError("Please install mapbox-vector-tile package")
+    return mapbox_vector_tile
+
+
+def vector_info(path, layer=None):
+    """Returns the number of features, CRS, bounds and fields of a vector file.
+
+    Args:
+        path (str): The vector file.
+        layer (str | int, optional): The layer to read. Defaults to the first layer.
+
+    Returns:
+        dict: The "features", "crs", "total_bounds" and "fields" of the layer.
+    """
+    info = _pyogrio().read_info(path, layer=layer, force_total_bounds=True)
+    return {
+        "features": info["features"],
+        "crs": info["crs"],
+        "total_bounds": info.get("total_bounds"),
+        "fields": list(info["fields"]),
+    }
+
+
+def _bbox_in_crs(bbox, crs):
+    """Converts a (west, south, east, north) lon/lat box to the CRS of a file."""
+    if bbox is None or crs is None:
+        return bbox
+    from pyproj import CRS, Transformer
+
+    if CRS.from_user_input(crs) == CRS.from_user_input(WGS84):
+        return tuple(bbox)
+    transformer = Transformer.from_crs(WGS84, crs, always_xy=True)
+    return transformer.transform_bounds(*bbox)
+
+
+def simplify_tolerance(zoom, pixels=0.5):
+    """Returns the simplification tolerance, in degrees, for a zoom level.
+
+    Args:
+        zoom (int): The web map zoom level.
+        pixels (float, optional): The tolerance in screen pixels. Defaults to 0.5.
+
+    Returns:
+        float: The tolerance in degrees.
+    """
+    return 360.0 / (256 * 2**zoom) * pixels
+
+
+def simplify_for_zoom(gdf, zoom, pixels=0.5):
+    """Simplifies geometries for display so that no detail smaller than a pixel is kept at a zoom level.
+
+    Topology is preserved, so polygons stay valid, and no feature is ever
+    dropped: a feature too small to simplify keeps its original geometry.
+
+    Args:
+        gdf (GeoDataFrame): Features in EPSG:4326.
+        zoom (int): The web map zoom level.
+        pixels (float, optional): The tolerance in screen pixels. Defaults to 0.5.
+
+    Returns:
+        GeoDataFrame: The simplified features, one per input feature.
+    """
+    import shapely
+
+    tolerance = simplify_tolerance(zoom, pixels)
+    original = gdf.geometry.values
+    geometries = shapely.simplify(original, tolerance, preserve_topology=True)
+    # Rounding coordinates to the tolerance shrinks the payload sent to the browser.
+    grid = 10 ** math.floor(math.log10(tolerance))
+    geometries = shapely.set_precision(geometries, grid)
+    collapsed = shapely.is_missing(geometries) | shapely.is_empty(geometries)
+    geometries[collapsed] = original[collapsed]
+    return gdf.set_geometry(geometries)
+
+
+def fit_zoom(bounds, pixels=1024):
+    """Returns the zoom level at which bounds fit in a map of a given width.
+
+    Args:
+        bounds (tuple): (west, south, east, north) in lon/lat.
+        pixels (int, optional): The map width in pixels. Defaults to 1024.
+
+    Returns:
+        int: The zoom level, between 0 and 22.
+    """
+    west, south, east, north = bounds
+    span = max(east - west, north - south, 1e-9)
+    return max(0, min(22, int(math.log2(360.0 * pixels / 256 / span))))
+
+
+def layer_bounds(path, layer=None):
+    """Returns the lon/lat bounds of a vector file without reading its features.
+
+    Args:
+        path (str): The vector file.
+        layer (str | int, optional): The layer to read. Defaults to the first layer.
+
+    Returns:
+        tuple: (west, south, east, north), or None if the file does not report them.
+    """
+    info = vector_info(path, layer)
+    bounds = info["total_bounds"]
+    if bounds is None or info["crs"] is None:
+        return bounds
+    from pyproj import Transformer
+
+    transformer = Transformer.from_crs(info["crs"], WGS84, always_xy=True)
+    return transformer.transform_bounds(*bounds)
+
+
+def iter_vector(path, bbox=None, columns=None, where=None, layer=None, chunk_size=CHUNK_SIZE, zoom=None):
+    """Reads a vector file chunk by chunk, in EPSG:4326.
+
+    The file is read in a single pass through a pyogrio Arrow stream, so
+    only ``chunk_size`` features are held in memory at once whatever the
+    format. Without pyarrow, each chunk is read with an offset, which
+    re-scans formats without random access (e.g. GeoJSON) from the start.
+    With ``zoom`` each chunk is simplified as soon as it is read, with the
+    tolerance of that one zoom level.
+
+    Args:
+        path (str): The vector file.
+        bbox (tuple, optional): Only read features intersecting (west, south, east, north) in lon/lat. Defaults to None.
+        columns (list, optional): Attribute columns to read. Defaults to all of them.
+        where (str, optional): An SQL WHERE clause on the attributes, e.g. "area > 1". Defaults to None.
+        layer (str | int, optional): The layer to read. Defaults to the first layer.
+        chunk_size (int, optional): Features per chunk. Defaults to 10000.
+        zoom (int, optional): Simplify the geometries for this zoom level. Defaults to None.
+
+    Yields:
+        GeoDataFrame: The features of each chunk.
+    """
+    pyogrio = _pyogrio()
+    info = pyogrio.read_info(path, layer=layer)
+    file_bbox = _bbox_in_crs(bbox, info["crs"])
+    options = {"layer": layer, "columns": columns, "where": where, "bbox": file_bbox}
+    if _has_arrow():
+        chunks = _arrow_chunks(pyogrio, path, chunk_size, options)
+    else:
+        chunks = _paged_chunks(pyogrio, path, chunk_size, info["features"], options)
+    for chunk in chunks:
+        if chunk.crs is not None and chunk.crs != WGS84:
+            chunk = chunk.to_crs(WGS84)
+        if zoom is not None:
+            chunk = simplify_for_zoom(chunk, zoom)
+        yield chunk
+
+
+def _arrow_chunks(pyogrio, path, chunk_size, options):
+    """Yields the features of a file as GeoDataFrames, reading it once as an Arrow stream."""
+    import geopandas as gpd
+    import pyarrow as pa
+    import shapely
+
+    stream = pyogrio.open_arrow(path, batch_size=chunk_size, use_pyarrow=True, **options)
+    with stream as (meta, reader):
+        name = meta["geometry_name"] or "wkb_geometry"
+        for batch in reader:
+            if batch.num_rows == 0:
+                continue
+            table = pa.Table.from_batches([batch])
+            geometries = shapely.from_wkb(table.column(name).to_numpy(zero_copy_only=False))
+            attributes = table.drop([name]).to_pandas()
+            yield gpd.GeoDataFrame(attributes, geometry=geometries, crs=meta["crs"])
+
+
+def _paged_chunks(pyogrio, path, chunk_size, total, options):
+    """Yields the features of a file as GeoDataFrames, reading each chunk at an offset."""
+    skip = 0
+    while total < 0 or skip < total:  # read_info gives -1 when counting is slow
+        chunk = pyogrio.read_dataframe(path, skip_features=skip, max_features=chunk_size, **options)
+        count = len(chunk)
+        if count == 0:
+            break
+        skip += count
+        yield chunk
+        if count < chunk_size:
+            break
+
+
+@perf.timed("vector.read")
+def read_vector(path, bbox=None, columns=None, where=None, layer=None, chunk_size=CHUNK_SIZE, zoom=None):
+    """Reads a vector file into one GeoDataFrame in EPSG:4326.
+
+    The whole layer is held in memory: use ``iter_vector`` to process the
+    chunks one at a time.
+
+    Args:
+        path (str): The vector file.
+        bbox (tuple, optional): Only read features intersecting (west, south, east, north) in lon/lat. Defaults to None.
+        columns (list, optional): Attribute columns to read. Defaults to all of them.
+        where (str, optional): An SQL WHERE clause on the attributes. Defaults to None.
+        layer (str | int, optional): The layer to read. Defaults to the first layer.
+        chunk_size (int, optional): Features per chunk. Defaults to 10000.
+        zoom (int, optional): Simplify the geometries for this zoom level. Defaults to None.
+
+    Returns:
+        GeoDataFrame: The features.
+    """
+    import geopandas as gpd
+
+    chunks = list(iter_vector(path, bbox, columns, where, layer, chunk_size, zoom))
+    if not chunks:
+        return gpd.GeoDataFrame(geometry=[], crs=WGS84)
+    return gpd.GeoDataFrame(pd.concat(chunks, ignore_index=True), crs=WGS84)
+
+
+@perf.timed("vector.to_geojson")
+def to_geojson(gdf):
+    """Converts a GeoDataFrame to a GeoJSON dict for the map widgets.
+
+    Args:
+        gdf (GeoDataFrame): The features.
+
+    Returns:
+        dict: A GeoJSON FeatureCollection.
+    """
+    import shapely
+
+    # Encoding the geometries in C and parsing them in one go is several
+    # times faster than GeoDataFrame.to_json.
+    geometries = shapely.to_geojson(gdf.geometry.values)
+    geometries = json.loads("[" + ",".join(g if g is not None else "null" for g in geometries) + "]")
+    attributes = gdf.drop(columns=gdf.geometry.name)
+    properties = json.loads(attributes.to_json(orient="records")) if len(attributes.columns) else [{}] * len(gdf)
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature", "properties": props, "geometry": geometry}
+            for props, geometry in zip(properties, geometries)
+        ],
+    }
+
+
+def _quantize_positions(positions, precision, minimum):
+    """Rounds positions and drops the ones equal to the previous position."""
+    points = np.asarray(positions, dtype="float64").reshape(len(positions), -1)[:, :2].round(precision)
+    if len(points) > 1:
+        kept = points[np.r_[True, np.any(points[1:] != points[:-1], axis=1)]]
+        if len(kept) >= minimum:
+            points = kept
+    return points.tolist()
+
+
+def quantize_geojson(data, precision=GEOJSON_PRECISION):
+    """Rounds GeoJSON coordinates and drops the vertices that become duplicates.
+
+    Six decimals of a degree are about 10 cm, far below what a map shows, and
+    halve the size of the JSON sent to the browser compared to full doubles.
+
+    Args:
+        data (dict): A GeoJSON geometry, Feature or FeatureCollection.
+        precision (int, optional): Decimals kept. Defaults to 6.
+
+    Returns:
+        dict: The quantized GeoJSON (the input is not modified).
+    """
+    kind = data.get("type") if data else None
+    if kind == "FeatureCollection":
+        return dict(data, features=[quantize_geojson(feature, precision) for feature in data["features"]])
+    if kind == "Feature":
+        return dict(data, geometry=quantize_geojson(data["geometry"], precision) if data.get("geometry") else None)
+    if kind == "GeometryCollection":
+        return dict(data, geometries=[quantize_geojson(geometry, precision) for geometry in data["geometries"]])
+    coordinates = data["coordinates"]
+    if kind == "Point":
+        coordinates = [round(coordinates[0], precision), round(coordinates[1], precision)]
+    elif kind == "MultiPoint":
+        coordinates = [[round(x, precision), round(y, precision)] for x, y, *_ in coordinates]
+    elif kind == "LineString":
+        coordinates = _quantize_positions(coordinates, precision, 2)
+    elif kind == "MultiLineString":
+        coordinates = [_quantize_positions(line, precision, 2) for line in coordinates]
+    elif kind == "Polygon":
+        coordinates = [_quantize_positions(ring, precision, 4) for ring in coordinates]
+    elif kind == "MultiPolygon":
+        coordinates = [[_quantize_positions(ring, precision, 4) for ring in polygon] for polygon in coordinates]
+    return dict(data, coordinates=coordinates)
+
+
+def geojson_digest(data):
+    """Returns a hash identifying GeoJSON data, to detect layers added twice.
+
+    Args:
+        data (dict): The GeoJSON.
+
+    Returns:
+        str: The hex digest.
+    """
+    text = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _features(data):
+    kind = data.get("type")
+    if kind == "FeatureCollection":
+        return data["features"]
+    if kind == "Feature":
+        return [data]
+    return [{"type": "Feature", "properties": {}, "geometry": data}]
+
+
+def _geometry_arrays(geometry):
+    """Splits a GeoJSON geometry into (type, coordinate arrays) parts."""
+    if not geometry:
+        return []
+    kind = geometry["type"]
+    if kind == "GeometryCollection":
+        return [part for child in geometry["geometries"] for part in _geometry_arrays(child)]
+    coordinates = geometry["coordinates"]
+
+    def array(positions):
+        return np.asarray(positions, dtype="float64").reshape(len(positions), -1)[:, :2]
+
+    if kind == "Point":
+        return [(kind, array([coordinates]))]
+    if kind in ("MultiPoint", "LineString"):
+        return [(kind, array(coordinates))]
+    if kind in ("MultiLineString", "Polygon"):
+        return [(kind, [array(line) for line in coordinates])]
+    return [(kind, [[array(ring) for ring in polygon] for polygon in coordinates])]
+
+
+def _part_arrays(kind, items):
+    if kind in ("Point", "MultiPoint", "LineString"):
+        return [items]
+    if kind == "MultiPolygon":
+        return [ring for polygon in items for ring in polygon]
+    return items
+
+
+class _Topology:
+    """Builds the shared arcs of a TopoJSON topology from quantized lines and rings."""
+
+    def __init__(self):
+        self.neighbors = {}
+        self.junctions = set()
+        self.arcs = []
+        self.index = {}
+
+    def visit(self, points, closed):
+        n = len(points)
+        if not closed:
+            self.junctions.add(points[0])
+            self.junctions.add(points[-1])
+        for i, point in enumerate(points):
+            if not closed and (i == 0 or i == n - 1):
+                continue
+            previous, following = points[i - 1], points[(i + 1) % n]
+            pair = (previous, following) if previous < following else (following, previous)
+            seen = self.neighbors.setdefault(point, pair)
+            if seen != pair:
+                self.junctions.add(point)
+
+    def _arc(self, points):
+        key = tuple(points)
+        index = self.index.get(key)
+        if index is None:
+            index = self.index.get(key[::-1])
+            if index is not None:
+                return ~index
+            index = self.index[key] = len(self.arcs)
+            self.arcs.append(points)
+        return index
+
+    def line(self, points):
+        arcs = []
+        start = 0
+        for i in range(1, len(points)):
+            if i == len(points) - 1 or points[i] in self.junctions:
+                arcs.append(self._arc(points[start:i + 1]))
+                start = i
+        return arcs
+
+    def ring(self, points):
+        cuts = [i for i, point in enumerate(points) if point in self.junctions]
+        if not cuts:
+            # A ring shared by nobody, or identical to another one: start it at its lowest point.
+            first = points.index(min(points))
+            points = points[first:] + points[:first]
+            forward = tuple(points + points[:1])
+            backward = forward[::-1]
+            lowest = backward.index(min(backward[:-1]))
+            backward = backward[lowest:-1] + backward[:lowest] + backward[lowest:lowest + 1]
+            index = self.index.get(backward)
+            return [~index] if index is not None else [self._arc(list(forward))]
+        points = points[cuts[0]:] + points[:cuts[0]]
+        return self.line(points + points[:1])
+
+
+def to_topojson(data, quantization=1e5, name="features"):
+    """Encodes GeoJSON as TopoJSON, sharing the borders of adjacent features.
+
+    Coordinates are quantized to a ``quantization`` x ``quantization`` grid
+    over the bounding box and each border between two fields is stored once,
+    as a delta-encoded arc, so dense field maps take a fraction of the size
+    of their GeoJSON.
+
+    Args:
+        data (dict): A GeoJSON geometry, Feature or FeatureCollection in lon/lat.
+        quantization (float, optional): Number of grid steps across the data. Defaults to 1e5.
+        name (str, optional): Name of the TopoJSON object holding the features. Defaults to "features".
+
+    Returns:
+        dict: The TopoJSON topology.
+    """
+    features = _features(data)
+    arrays = [_geometry_arrays(feature.get("geometry")) for feature in features]
+    flat = [a for parts in arrays for kind, items in parts for a in _part_arrays(kind, items) if len(a)]
+    if not flat:
+        raise ValueError("The GeoJSON has no coordinates.")
+    stacked = np.concatenate(flat)
+    x0, y0 = stacked.min(axis=0).tolist()
+    x1, y1 = stacked.max(axis=0).tolist()
+    kx = (x1 - x0) / (quantization - 1) or 1
+    ky = (y1 - y0) / (quantization - 1) or 1
+    origin, scale = np.array([x0, y0]), np.array([kx, ky])
+
+    def grid(array):
+        return np.rint((array - origin) / scale).astype("int64")
+
+    def quantize(array, closed):
+        points = grid(array)
+        if len(points) > 1:
+            points = points[np.r_[True, np.any(points[1:] != points[:-1], axis=1)]]
+        points = list(map(tuple, points.tolist()))
+        if closed:
+            if len(points) > 1 and points[0] == points[-1]:
+                points.pop()
+            return points if len(points) >= 3 else None
+        return points if len(points) >= 2 else None
+
+    def parts(kind, items):
+        """Quantizes a geometry part into its points, lines or rings."""
+        if kind in ("Point", "MultiPoint"):
+            return kind, grid(items).tolist()
+        if kind == "LineString":
+            return kind, [line for line in [quantize(items, False)] if line]
+        if kind == "MultiLineString":
+            return kind, [line for line in (quantize(a, False) for a in items) if line]
+        polygons = [items] if kind == "Polygon" else items
+        quantized = []
+        for polygon in polygons:
+            rings = [quantize(ring, True) for ring in polygon]
+            if rings and rings[0]:
+                quantized.append([ring for ring in rings if ring])
+        return kind, quantized
+
+    topology = _Topology()
+    quantized = [[parts(kind, items) for kind, items in geometry] for geometry in arrays]
+    for geometries in quantized:
+        for kind, items in geometries:
+            if kind in ("LineString", "MultiLineString"):
+                for line in items:
+                    topology.visit(line, False)
+            elif kind in ("Polygon", "MultiPolygon"):
+                for polygon in items:
+                    for ring in polygon:
+                        topology.visit(ring, True)
+
+    def encode(kind, items):
+        if kind == "Point":
+            return {"type": "Point", "coordinates": items[0]}
+        if kind == "MultiPoint":
+            return {"type": "MultiPoint", "coordinates": items}
+        if kind in ("LineString", "MultiLineString"):
+            if not items:
+                return {"type": None}
+            lines = [topology.line(line) for line in items]
+            return {"type": "LineString", "arcs": lines[0]} if kind == "LineString" else {"type": kind, "arcs": lines}
+        if not items:
+            return {"type": None}
+        polygons = [[topology.ring(ring) for ring in polygon] for polygon in items]
+        return {"type": "Polygon", "arcs": polygons[0]} if kind == "Polygon" else {"type": kind, "arcs": polygons}
+
+    geometries = []
+    for feature, parts_ in zip(features, quantized):
+        encoded = [encode(kind, items) for kind, items in parts_]
+        if not encoded:
+            geometry = {"type": None}
+        elif len(encoded) == 1 and feature.get("geometry", {}).get("type") != "GeometryCollection":
+            geometry = encoded[0]
+        else:
+            geometry = {"type": "GeometryCollection", "geometries": encoded}
+        if feature.get("properties"):
+            geometry["properties"] = feature["properties"]
+        if "id" in feature:
+            geometry["id"] = feature["id"]
+        geometries.append(geometry)
+
+    arcs = []
+    for arc in topology.arcs:
+        arc = np.asarray(arc)
+        arc[1:] = np.diff(arc, axis=0)
+        arcs.append(arc.tolist())
+
+    return {
+        "type": "Topology",
+        "bbox": [x0, y0, x1, y1],
+        "transform": {"scale": [kx, ky], "translate": [x0, y0]},
+        "objects": {name: {"type": "GeometryCollection", "geometries": geometries}},
+        "arcs": arcs,
+    }
+
+
+def _has_arrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class VectorTileSource(TileSource):
+    """Serves a vector layer as Mapbox Vector Tiles through ``TileServer``.
+
+    The features are loaded once and indexed with an STRtree. Each tile only
+    holds the features it intersects, clipped to the tile and simplified to
+    its resolution, so the browser never receives more than what is visible.
+
+    Args:
+        data (str | GeoDataFrame): The path of a vector file, or a GeoDataFrame.
+        layer_name (str, optional): Name of the layer inside the tiles. Defaults to "features".
+        columns (list, optional): Attribute columns to include. Defaults to all of them.
+        bbox (tuple, optional): Only serve features intersecting (west, south, east, north) in lon/lat. Defaults to None.
+        where (str, optional): An SQL WHERE clause on the attributes of a file. Defaults to None.
+        extent (int, optional): Tile resolution in integer units. Defaults to 4096.
+        buffer (int, optional): Margin around each tile, in tile units. Defaults to 64.
+        max_zoom (int, optional): Highest zoom level served. Defaults to 22.
+    """
+
+    media_type = "application/x-protobuf"
+
+    def __init__(self, data, layer_name="features", columns=None, bbox=None, where=None, extent=4096, buffer=64, max_zoom=22):
+        import shapely
+
+        # Checked here, since inside the tile server it would only show as failing tiles.
+        _mapbox_vector_tile()
+        if isinstance(data, (str, os.PathLike)):
+            path = os.path.abspath(str(data))
+            stat = os.stat(path)
+            identity = json.dumps([path, stat.st_mtime_ns, stat.st_size, layer_name, columns, bbox, where, extent, buffer])
+            self.key = hashlib.sha1(identity.encode("utf-8")).hexdigest()
+            gdf = read_vector(path, bbox=bbox, columns=columns, where=where)
+        else:
+            # An in-memory frame has no stable identity to reuse tiles across sessions.
+            self.key = uuid.uuid4().hex
+            self.cacheable = False
+            gdf = data.to_crs(WGS84) if data.crs is not None and data.crs != WGS84 else data
+            if columns is not None:
+                gdf = gdf[list(columns) + [gdf.geometry.name]]
+            if bbox is not None:
+                gdf = gdf.cx[bbox[0]:bbox[2], bbox[1]:bbox[3]]
+
+        gdf = gdf[~(gdf.geometry.isna() | gdf.geometry.is_empty)].reset_index(drop=True)
+        self.layer_name = layer_name
+        self.extent = extent
+        self.buffer = buffer
+        self.max_zoom = max_zoom
+        self.bounds = tuple(map(float, gdf.total_bounds)) if len(gdf) else (-180.0, -85.0, 180.0, 85.0)
+
+        attributes = gdf.drop(columns=gdf.geometry.name)
+        records = json.loads(attributes.to_json(orient="records")) if len(attributes.columns) else [{} for _ in range(len(gdf))]
+        for i, record in enumerate(records):
+            for name in [name for name, value in record.items() if value is None]:
+                del record[name]
+            record[FEATURE_ID] = i
+        self.properties = records
+        self.geometries = gdf.geometry.to_crs(WEB_MERCATOR).values
+        self.tree = shapely.STRtree(self.geometries)
+        xmin, ymin, xmax, ymax = shapely.bounds(self.geometries).T
+        sizes = np.maximum(xmax - xmin, ymax - ymin)
+        # Points are always drawn, whatever the zoom.
+        sizes[np.isin(shapely.get_type_id(self.geometries), (0, 4))] = np.inf
+        self.sizes = sizes
+
+    def __len__(self):
+        return len(self.geometries)
+
+    def render(self, server, z, x, y):
+        import shapely
+
+        from .tiles import tile_bounds
+
+        mapbox_vector_tile = _mapbox_vector_tile()
+
+        left, bottom, right, top = tile_bounds(z, x, y)
+        unit = (right - left) / self.extent
+        pixel = (right - left) / 256
+        pad = unit * self.buffer
+        candidates = self.tree.query(shapely.box(left - pad, bottom - pad, right + pad, top + pad))
+        # Features smaller than half a screen pixel are not visible at this zoom.
+        candidates = candidates[self.sizes[candidates] >= pixel / 2]
+        if len(candidates) == 0:
+            return None
+
+        geometries = shapely.clip_by_rect(self.geometries[candidates], left - pad, bottom - pad, right + pad, top + pad)
+        geometries = shapely.simplify(geometries, pixel / 2, preserve_topology=False)
+        visible = ~shapely.is_empty(geometries)
+        if not visible.any():
+            return None
+        candidates = candidates[visible]
+        geometries = shapely.transform(geometries[visible], lambda xy: (xy - (left, bottom)) / unit)
+
+        features = [
+            {"geometry": geometry, "properties": self.properties[i]}
+            for i, geometry in zip(candidates, geometries)
+        ]
+        return mapbox_vector_tile.encode(
+            [{"name": self.layer_name, "features": features}],
+            default_options={"extents": self.extent},
+        )
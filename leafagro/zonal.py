@@ -0,0 +1,292 @@
+"""The zonal module computes per-field statistics of a raster from polygon layers.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from . import perf
+from .raster import as_band, block_windows
+
+DEFAULT_PERCENTILES = (25, 50, 75)
+
+
+def read_zones(zones, crs=None):
+    """Reads a polygon layer as a GeoDataFrame.
+
+    Args:
+        zones (str | dict | GeoDataFrame): A vector file (GeoJSON, shapefile, ...), a GeoJSON dict or a GeoDataFrame.
+        crs (optional): Reproject the polygons to this CRS. Defaults to None.
+
+    Returns:
+        GeoDataFrame: The polygons.
+    """
+    import geopandas as gpd
+
+    if isinstance(zones, (str, os.PathLike)):
+        gdf = gpd.read_file(zones)
+    elif isinstance(zones, dict):
+        features = zones["features"] if zones.get("type") == "FeatureCollection" else [zones]
+        gdf = gpd.GeoDataFrame.from_features(features, crs="EPSG:4326")
+    else:
+        gdf = zones
+    if crs is not None and gdf.crs is not None and gdf.crs != crs:
+        gdf = gdf.to_crs(crs)
+    return gdf
+
+
+def _percentiles_from_histogram(hist, counts, percentiles, value_range):
+    """Interpolates percentiles of every zone from their histograms."""
+    bins = hist.shape[1]
+    low, high = value_range
+    width = (high - low) / bins
+    cumulative = np.cumsum(hist, axis=1)
+    result = np.full((hist.shape[0], len(percentiles)), np.nan)
+    has_values = counts > 0
+    for i, q in enumerate(percentiles):
+        target = q / 100.0 * counts
+        index = np.argmax(cumulative >= target[:, None], axis=1)
+        before = np.where(index > 0, cumulative[np.arange(len(index)), index - 1], 0)
+        in_bin = hist[np.arange(len(index)), index]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fraction = np.where(in_bin > 0, (target - before) / in_bin, 0.5)
+        result[:, i] = np.where(has_values, low + (index + fraction) * width, np.nan)
+    return result
+
+
+@perf.timed("zonal.stats")
+def zonal_stats(
+    raster,
+    zones,
+    id_field=None,
+    percentiles=DEFAULT_PERCENTILES,
+    value_range=None,
+    bins=256,
+    all_touched=False,
+    blocksize=1024,
+    max_workers=None,
+):
+    """Computes per-polygon statistics of a raster in one streaming pass.
+
+    The raster is read block by block. In each block the polygons that
+    intersect it (found through a spatial index) are rasterized into a label
+    array, one array per layer of polygons that do not overlap, so a pixel
+    shared by overlapping polygons counts for each of them. Count, sum,
+    sum of squares, min, max and a value histogram are
+    accumulated for all polygons at once with ``np.bincount``-style
+    reductions. Percentiles (and the median) are interpolated from the
+    histograms, so their precision is ``(high - low) / bins``. At most
+    ``2 * max_workers`` blocks are in flight, and their results are added
+    to a single set of arrays as they arrive, so memory does not grow with
+    the size of the raster. Without ``value_range`` the histograms need the
+    raster min/max first, so the raster is read (and the polygons
+    rasterized) a second time.
+
+    Args:
+        raster (str | tuple | RasterBand): The raster, e.g. an index from ``normalizedDifference``, a (path, band) tuple or a band object.
+        zones (str | dict | GeoDataFrame): The polygons, as loaded by ``add_geojson``/``add_shp``.
+        id_field (str, optional): Column identifying the polygons. Defaults to the row index.
+        percentiles (tuple, optional): Percentiles to compute. Defaults to (25, 50, 75).
+        value_range (tuple, optional): (low, high) of the histograms, e.g. (-1, 1) for indices. Defaults to the
+            min/max of the pixels in the polygons, found in a first pass over the raster.
+        bins (int, optional): Number of histogram bins. Defaults to 256.
+        all_touched (bool, optional): Count every pixel touched by a polygon. Defaults to False.
+        blocksize (int, optional): Block size in pixels. Defaults to 1024.
+        max_workers (int, optional): Number of threads. Defaults to the number of CPUs.
+
+    Returns:
+        pd.DataFrame: count, mean, std, min, max, median and p<q> columns, one row per polygon.
+    """
+    from rasterio.features import rasterize
+    from rasterio.windows import bounds as window_bounds
+    from rasterio.windows import transform as window_transform
+
+    band = as_band(raster)
+    owned = band is not raster
+    gdf = read_zones(zones, crs=band.crs)
+    n = len(gdf)
+    geometries = list(gdf.geometry)
+    sindex = gdf.sindex
+    layers = _overlap_layers(gdf, all_touched)
+    windows = block_windows(band.width, band.height, blocksize)
+    workers = max_workers or os.cpu_count() or 1
+
+    def read_block(window):
+        box = window_bounds(window, band.transform)
+        candidates = sindex.query(_box(box))
+        if len(candidates) == 0:
+            return None
+        values = band.read(window)
+        finite = np.isfinite(values)
+        found_labels, found_values = [], []
+        for layer in np.unique(layers[candidates]):
+            shapes = [
+                (geometries[i], i + 1)
+                for i in candidates
+                if layers[i] == layer and geometries[i] is not None
+            ]
+            if not shapes:
+                continue
+            labels = rasterize(
+                shapes,
+                out_shape=(window.height, window.width),
+                transform=window_transform(window, band.transform),
+                fill=0,
+                all_touched=all_touched,
+                dtype="int32",
+            )
+            valid = (labels > 0) & finite
+            found_labels.append(labels[valid])
+            found_values.append(values[valid])
+        if not found_labels:
+            return None
+        return np.concatenate(found_labels), np.concatenate(found_values).astype("float64")
+
+    def run(reduce):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for window in windows:
+                pending.append(executor.submit(lambda window=window: reduce(read_block(window))))
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    try:
+        count = np.zeros(n + 1)
+        total = np.zeros(n + 1)
+        squares = np.zeros(n + 1)
+        minimum = np.full(n + 1, np.inf)
+        maximum = np.full(n + 1, -np.inf)
+        hist = None
+        if percentiles and value_range is not None:
+            hist = np.zeros((n + 1) * bins)
+
+        def moments(block):
+            if block is None:
+                return None
+            labels, values = block
+            part = {
+                "count": np.bincount(labels, minlength=n + 1),
+                "total": np.bincount(labels, weights=values, minlength=n + 1),
+                "squares": np.bincount(labels, weights=values * values, minlength=n + 1),
+                "minimum": np.full(n + 1, np.inf),
+                "maximum": np.full(n + 1, -np.inf),
+            }
+            np.minimum.at(part["minimum"], labels, values)
+            np.maximum.at(part["maximum"], labels, values)
+            if hist is not None:
+                part["hist"] = _histogram(labels, values, value_range, bins)
+            return part
+
+        for part in run(moments):
+            if part is None:
+                continue
+            count += part["count"]
+            total += part["total"]
+            squares += part["squares"]
+            np.minimum(minimum, part["minimum"], out=minimum)
+            np.maximum(maximum, part["maximum"], out=maximum)
+            if hist is not None:
+                keys, counts = part["hist"]
+                hist[keys] += counts
+
+        if percentiles and hist is None:
+            finite = count > 0
+            value_range = (
+                (float(minimum[finite].min()), float(maximum[finite].max()))
+                if finite.any()
+                else (0.0, 1.0)
+            )
+            if value_range[0] == value_range[1]:
+                value_range = (value_range[0], value_range[0] + 1.0)
+            hist = np.zeros((n + 1) * bins)
+
+            def histograms(block):
+                if block is None:
+                    return None
+                return _histogram(block[0], block[1], value_range, bins)
+
+            for part in run(histograms):
+                if part is not None:
+                    keys, counts = part
+                    hist[keys] += counts
+    finally:
+        if owned:
+            band.close()
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = total / count
+        std = np.sqrt(np.maximum(squares / count - mean * mean, 0))
+    empty = count == 0
+    minimum[empty] = np.nan
+    maximum[empty] = np.nan
+
+    df = pd.DataFrame(
+        {
+            "count": count[1:].astype("int64"),
+            "mean": mean[1:],
+            "std": std[1:],
+            "min": minimum[1:],
+            "max": maximum[1:],
+        },
+        index=gdf[id_field] if id_field else gdf.index,
+    )
+    if percentiles:
+        values = _percentiles_from_histogram(
+            hist.reshape(n + 1, bins)[1:], count[1:], percentiles, value_range
+        )
+        for i, q in enumerate(percentiles):
+            df["median" if q == 50 else f"p{q:g}"] = values[:, i]
+    return df
+
+
+def _overlap_layers(gdf, all_touched):
+    """Splits the polygons into layers in which no two polygons share a pixel.
+
+    Rasterizing puts one label in each pixel, so polygons that overlap are
+    rasterized in separate layers. Polygons that only touch share pixels
+    only with ``all_touched``. Most field layers do not overlap and give a
+    single layer.
+
+    Returns:
+        np.ndarray: The layer of each polygon.
+    """
+    geometries = gdf.geometry
+    left, right = gdf.sindex.query(geometries, predicate="intersects")
+    pairs = left < right
+    left, right = left[pairs], right[pairs]
+    if not all_touched and len(left):
+        touching = geometries.iloc[left].touches(geometries.iloc[right], align=False)
+        left, right = left[~touching.values], right[~touching.values]
+
+    earlier = [[] for _ in range(len(gdf))]
+    for i, j in zip(left, right):
+        earlier[j].append(i)
+    layers = np.zeros(len(gdf), dtype="int64")
+    for j, neighbours in enumerate(earlier):
+        taken = {layers[i] for i in neighbours}
+        while layers[j] in taken:
+            layers[j] += 1
+    return layers
+
+
+def _histogram(labels, values, value_range, bins):
+    """Counts the values of a block per (label, bin).
+
+    Returns:
+        tuple: The flat ``label * bins + bin`` indexes present in the block and their counts.
+    """
+    low, high = value_range
+    index = ((values - low) * (bins / (high - low))).astype("int64")
+    np.clip(index, 0, bins - 1, out=index)
+    return np.unique(labels * bins + index, return_counts=True)
+
+
+def _box(bounds):
+    from shapely.geometry import box
+
+    return box(*bounds)
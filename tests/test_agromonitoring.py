@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+
+"""Tests for `leafagro.agromonitoring` module."""
+
+
+import datetime
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+from leafagro import agromonitoring
+from leafagro.agromonitoring import Agromonitoring
+
+
+def scene(day, polygon):
+    url = f"https://example.com/{polygon}/{day}"
+    return {
+        "dt": 1609459200 + day * 86400,
+        "type": "s2",
+        "cl": 0,
+        "dc": 100,
+        "tile": {"ndvi": url + "/ndvi/{z}/{x}/{y}.png", "evi": url + "/evi/{z}/{x}/{y}.png"},
+        "stats": {"ndvi": url + "/stats/ndvi", "evi": url + "/stats/evi"},
+    }
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self.content = b""
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+class FakeClient:
+    """Answers image searches and polygon lookups from dicts keyed by polygon Id."""
+
+    def __init__(self, scenes, polygons=None):
+        self.scenes = scenes
+        self.polygons = polygons or {}
+        self.urls = []
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        with self._lock:
+            self.urls.append(url)
+        path = urlparse(url).path
+        if path.endswith("/polygons"):
+            return FakeResponse(200, list(self.polygons.values()))
+        if "/polygons/" in path:
+            polygon = self.polygons.get(path.rsplit("/", 1)[1])
+            return FakeResponse(200, polygon) if polygon is not None else FakeResponse(404)
+        polygon = parse_qs(urlparse(url).query)["polyid"][0]
+        if polygon not in self.scenes:
+            return FakeResponse(500)
+        return FakeResponse(200, self.scenes[polygon])
+
+
+class TestAgromonitoring(unittest.TestCase):
+    """Tests for `leafagro.agromonitoring` module."""
+
+    def setUp(self):
+        agromonitoring.clear_search_cache()
+        self.catalog = agromonitoring.get_scene_catalog()
+        agromonitoring.set_scene_catalog(None)
+        # Scenes are listed out of date order, as the API does not sort them.
+        self.client = FakeClient({
+            "p1": [scene(5, "p1"), scene(0, "p1")],
+            "p2": [scene(3, "p2")],
+        })
+        patcher = mock.patch.object(agromonitoring, "get_client", return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        agromonitoring.clear_search_cache()
+        agromonitoring.set_scene_catalog(self.catalog)
+
+    def test_search_dates_are_utc(self):
+        self.addCleanup(time.tzset)
+        with mock.patch.dict(os.environ, {"TZ": "America/New_York"}):
+            time.tzset()
+            agromonitoring.search_images("key", "p1", "2021-01-01", "2021-01-31")
+        query = parse_qs(urlparse(self.client.urls[-1]).query)
+        self.assertEqual(query["start"], ["1609459200"])
+        # The end date is included up to its last second.
+        self.assertEqual(query["end"], [str(1609459200 + 31 * 86400 - 1)])
+        self.assertEqual(agromonitoring._to_timestamp(datetime.date(2021, 1, 1)), 1609459200)
+        self.assertEqual(agromonitoring._to_timestamp(1609459200), 1609459200)
+
+    def test_search_cache(self):
+        first = agromonitoring.search_images("key", "p1", "2021-01-01", "2021-01-31")
+        self.assertIs(agromonitoring.search_images("key", "p1", "2021-01-01", "2021-01-31"), first)
+        self.assertEqual(len(self.client.urls), 1)
+
+        # The tiles and stats of every product are answered by the same search.
+        tiles = Agromonitoring.get_agromonitoring_tile("key", "p1", "2021-01-01", "2021-01-31", "ndvi")
+        stats = Agromonitoring.get_agromonitoring_stat("key", "p1", "2021-01-01", "2021-01-31", "evi")
+        self.assertEqual(len(tiles), 2)
+        self.assertEqual(len(stats), 2)
+        self.assertEqual(len(self.client.urls), 1)
+
+        # Other dates, polygons or keys are misses.
+        agromonitoring.search_images("key", "p1", "2021-01-01", "2021-01-15")
+        agromonitoring.search_images("key", "p2", "2021-01-01", "2021-01-31")
+        agromonitoring.search_images("other", "p1", "2021-01-01", "2021-01-31")
+        self.assertEqual(len(self.client.urls), 4)
+
+        # Failed searches are not cached.
+        self.assertIsNone(agromonitoring.search_images("key", "missing", "2021-01-01", "2021-01-31"))
+        self.assertIsNone(agromonitoring.search_images("key", "missing", "2021-01-01", "2021-01-31"))
+        self.assertEqual(len(self.client.urls), 6)
+
+    def test_search_cache_eviction(self):
+        with mock.patch.object(agromonitoring, "SEARCH_CACHE_SIZE", 2):
+            first = agromonitoring.search_images("key", "p1", "2021-01-01", "2021-01-31")
+            agromonitoring.search_images("key", "p2", "2021-01-01", "2021-01-31")
+            # Using the first search makes the second one the least recently used.
+            self.assertIs(agromonitoring.search_images("key", "p1", "2021-01-01", "2021-01-31"), first)
+            agromonitoring.search_images("key", "p1", "2021-02-01", "2021-02-28")
+            self.assertEqual(len(self.client.urls), 3)
+
+            self.assertIs(agromonitoring.search_images("key", "p1", "2021-01-01", "2021-01-31"), first)
+            self.assertEqual(len(self.client.urls), 3)
+            agromonitoring.search_images("key", "p2", "2021-01-01", "2021-01-31")
+            self.assertEqual(len(self.client.urls), 4)
+
+    def test_batch_order(self):
+        df = Agromonitoring.get_agromonitoring_batch("key", ["p2", "p1", "p2"], "2021-01-01", "2021-01-31", ["ndvi", "evi"], max_workers=4)
+        self.assertEqual(len(self.client.urls), 2)
+        self.assertEqual(list(df.columns), ["Polygon", "Date", "Product", "URL"])
+        self.assertEqual(
+            list(zip(df["Polygon"], df["Date"], df["Product"])),
+            [
+                ("p1", "2021-01-01", "evi"),
+                ("p1", "2021-01-01", "ndvi"),
+                ("p1", "2021-01-06", "evi"),
+                ("p1", "2021-01-06", "ndvi"),
+                ("p2", "2021-01-04", "evi"),
+                ("p2", "2021-01-04", "ndvi"),
+            ],
+        )
+        self.assertEqual(df["URL"].iloc[1], "https://example.com/p1/0/ndvi/{z}/{x}/{y}.png")
+
+        stats = Agromonitoring.get_agromonitoring_batch("key", ["p1", "p2"], "2021-01-01", "2021-01-31", "ndvi", source="stats")
+        self.assertEqual(list(stats["URL"]), ["https://example.com/p1/0/stats/ndvi", "https://example.com/p1/5/stats/ndvi", "https://example.com/p2/3/stats/ndvi"])
+
+    def test_batch_errors(self):
+        # A failed search skips its polygon, the others are still returned.
+        df = Agromonitoring.get_agromonitoring_batch("key", ["p1", "missing"], "2021-01-01", "2021-01-31", "ndvi")
+        self.assertEqual(set(df["Polygon"]), {"p1"})
+        self.assertEqual(len(df), 2)
+
+        df = Agromonitoring.get_agromonitoring_batch("key", ["missing"], "2021-01-01", "2021-01-31", "ndvi")
+        self.assertTrue(df.empty)
+        self.assertEqual(list(df.columns), ["Polygon", "Date", "Product", "URL"])
+
+        # A product without URLs in the scenes gives empty URLs.
+        df = Agromonitoring.get_agromonitoring_batch("key", ["p2"], "2021-01-01", "2021-01-31", "nri")
+        self.assertEqual(df["URL"].tolist(), [None])
+
+        requests = len(self.client.urls)
+        self.assertIsNone(Agromonitoring.get_agromonitoring_batch("key", ["p1"], "2021-01-01", "2021-01-31", ["ndvi", "lai"]))
+        with self.assertRaises(ValueError):
+            Agromonitoring.get_agromonitoring_batch("key", ["p1"], "2021-01-01", "2021-01-31", "ndvi", source="image")
+        self.assertEqual(len(self.client.urls), requests)
+
+    def test_polygon_registry(self):
+        square = {"type": "Feature", "geometry": {"type": "Polygon", "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 0]]]}}
+        self.client.polygons = {"p1": {"id": "p1", "name": "field", "geo_json": square}}
+        registry = agromonitoring.PolygonRegistry("key")
+        self.assertEqual(registry.ids(), ["p1"])
+        self.assertEqual(registry.geometry("p1"), square)
+        self.assertIn("p1", registry)
+        self.assertEqual(len(self.client.urls), 1)
+
+        # A polygon created after the list was loaded is fetched on its own and kept.
+        self.client.polygons["p2"] = {"id": "p2", "name": "new field", "geo_json": square}
+        self.assertEqual(registry.get("p2")["name"], "new field")
+        self.assertTrue(self.client.urls[-1].split("?")[0].endswith("/polygons/p2"))
+        self.assertEqual(len(self.client.urls), 2)
+        self.assertEqual(registry.get("p2")["name"], "new field")
+        self.assertEqual(len(self.client.urls), 2)
+        self.assertEqual(len(registry), 2)
+
+        self.assertIsNone(registry.get("missing"))
+        self.assertIsNone(registry.geometry("missing"))
+        self.assertNotIn("missing", registry)
+
+        # An expired list is reloaded and drops deleted polygons.
+        del self.client.polygons["p1"]
+        registry.max_age = 0
+        self.assertEqual(registry.ids(), ["p2"])
+
+    def test_shared_registry(self):
+        registry = agromonitoring.get_polygon_registry("key")
+        self.assertIs(agromonitoring.get_polygon_registry("key"), registry)
+        self.assertIsNot(agromonitoring.get_polygon_registry("other"), registry)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+"""Tests for `leafagro.catalog` module."""
+
+
+import tempfile
+import unittest
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+from leafagro import agromonitoring
+from leafagro.agromonitoring import ImageSearch
+from leafagro.catalog import SceneCatalog
+
+
+class FakeResponse:
+    def __init__(self, scenes):
+        self.status_code = 200
+        self.scenes = scenes
+
+    def json(self):
+        return self.scenes
+
+
+class FakeClient:
+    """Answers image searches with the scenes between start and end, both included, like the API."""
+
+    def __init__(self, scenes):
+        self.scenes = scenes
+        self.urls = []
+
+    def get(self, url):
+        self.urls.append(url)
+        query = parse_qs(urlparse(url).query)
+        start, end = int(query["start"][0]), int(query["end"][0])
+        return FakeResponse([scene for scene in self.scenes if start <= scene["dt"] <= end])
+
+
+def make_search(polygon_id, start_date, end_date, timestamps):
+    """Builds an image search result like the API returns."""
+    scenes = [
+        {
+            "dt": dt,
+            "type": "Sentinel-2",
+            "cl": float(i * 20),
+            "dc": 100,
+            "tile": {"ndvi": f"http://x/tile/ndvi/{polygon_id}/{dt}/{{z}}/{{x}}/{{y}}.png"},
+            "stats": {"ndvi": f"http://x/stats/ndvi/{polygon_id}/{dt}"},
+        }
+        for i, dt in enumerate(timestamps)
+    ]
+    return ImageSearch(polygon_id, start_date, end_date, scenes)
+
+
+class TestCatalog(unittest.TestCase):
+    """Tests for `leafagro.catalog` module."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.catalog = SceneCatalog(self.tmpdir.name)
+        # 2020-12-30, 2021-01-04 and 2021-01-09.
+        self.search = make_search("a", "2020-12-01", "2021-01-31", [1609286400, 1609718400, 1610150400])
+        self.catalog.add(self.search)
+        self.catalog.add(make_search("b", "2021-01-01", "2021-01-31", [1609718400]))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_query_filters(self):
+        df = self.catalog.query(polygons="a", start="2021-01-01", max_cloud=30)
+        self.assertEqual(list(df["Date"]), ["2021-01-04"])
+        urls = self.catalog.urls("ndvi", start="2021-01-04", end="2021-01-04")
+        self.assertEqual(list(urls["Polygon"]), ["a", "b"])
+        self.assertEqual(list(urls.columns), ["Polygon", "Date", "URL"])
+
+    def test_add_skips_known_scenes(self):
+        self.assertEqual(self.catalog.add(self.search), 0)
+        self.assertEqual(len(self.catalog.query()), 4)
+
+    def test_search_from_catalog(self):
+        self.assertTrue(self.catalog.covers("a", "2020-12-15", "2021-01-10"))
+        self.assertFalse(self.catalog.covers("a", "2020-11-15", "2021-01-10"))
+        search = self.catalog.search("a", "2021-01-01", "2021-01-31")
+        self.assertEqual(list(search.dataframe["dt"]), [1609718400, 1610150400])
+        self.assertEqual(list(search.urls("ndvi", "stats")["URL"]), list(self.search.urls("ndvi", "stats")["URL"][1:]))
+
+    def test_adjacent_searches(self):
+        # Scenes at noon on 2021-02-04 and 2021-02-05, the last and first days of two searches.
+        scenes = make_search("c", "2021-02-01", "2021-02-09", [1612440000, 1612526400]).scenes
+        client = FakeClient(scenes)
+        agromonitoring.clear_search_cache()
+        self.addCleanup(agromonitoring.clear_search_cache)
+        self.addCleanup(agromonitoring.set_scene_catalog, agromonitoring.get_scene_catalog())
+        agromonitoring.set_scene_catalog(self.catalog)
+        with mock.patch.object(agromonitoring, "get_client", return_value=client):
+            first = agromonitoring.search_images("key", "c", "2021-02-01", "2021-02-04")
+            second = agromonitoring.search_images("key", "c", "2021-02-05", "2021-02-09")
+            self.assertEqual(list(first.dataframe["Date"]), ["2021-02-04"])
+            self.assertEqual(list(second.dataframe["Date"]), ["2021-02-05"])
+
+            # The boundary days are covered once, and answered without the API.
+            self.assertTrue(self.catalog.covers("c", "2021-02-04", "2021-02-05"))
+            across = agromonitoring.search_images("key", "c", "2021-02-04", "2021-02-05")
+            self.assertEqual(len(client.urls), 2)
+        self.assertEqual(list(across.dataframe["Date"]), ["2021-02-04", "2021-02-05"])
+        self.assertEqual(list(self.catalog.query(polygons="c", end="2021-02-04")["Date"]), ["2021-02-04"])
+
+    def test_coverage_of_timestamps(self):
+        # A search ending at noon does not cover the rest of its last day.
+        self.catalog.add(make_search("d", 1612137600, 1612526400, []))
+        self.assertTrue(self.catalog.covers("d", "2021-02-01", "2021-02-04"))
+        self.assertFalse(self.catalog.covers("d", "2021-02-01", "2021-02-05"))
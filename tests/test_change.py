@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+"""Tests for `leafagro.change` module."""
+
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+from leafagro import change
+from leafagro.agromonitoring import ImageSearch
+
+
+class FakeResponse:
+    def __init__(self, path):
+        self.status_code = 200
+        with open(path, "rb") as f:
+            self.content = f.read()
+
+
+class FakeClient:
+    def get(self, url):
+        return FakeResponse(url)
+
+
+class SearchClient(FakeClient):
+    """Answers image searches with the scenes between start and end, both included, and downloads local files."""
+
+    def __init__(self, scenes):
+        self.scenes = scenes
+
+    def get(self, url):
+        if "/image/search" not in url:
+            return FakeResponse(url)
+        query = parse_qs(urlparse(url).query)
+        start, end = int(query["start"][0]), int(query["end"][0])
+        return mock.Mock(status_code=200, json=lambda: [scene for scene in self.scenes if start <= scene["dt"] <= end])
+
+
+class TestChange(unittest.TestCase):
+    """Tests for `leafagro.change` module."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.scenes = []
+        for i, value in enumerate([0.2, 0.5, 0.3]):
+            # The last scene has a coarser grid, as from another satellite.
+            size, resolution = (40, 10) if i < 2 else (20, 20)
+            path = os.path.join(self.tmpdir.name, f"ndvi_{i}.tif")
+            profile = {
+                "driver": "GTiff", "width": size, "height": size, "count": 1, "dtype": "float32",
+                "crs": "EPSG:32633", "transform": from_origin(500000, 5000000, resolution, resolution), "nodata": -1,
+            }
+            data = np.full((size, size), value, dtype="float32")
+            data[0, 0] = -1
+            with rasterio.open(path, "w", **profile) as dst:
+                dst.write(data, 1)
+            self.scenes.append({"dt": 1609459200 + i * 5 * 86400, "type": "s2", "cl": 0, "dc": 100, "data": {"ndvi": path}})
+        self.detector = change.ChangeDetector(os.path.join(self.tmpdir.name, "changes"), threshold=0.15)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def update(self, scenes, end):
+        search = ImageSearch("p1", "2021-01-01", end, scenes)
+        with mock.patch.object(change, "search_images", return_value=search), \
+                mock.patch.object(change, "get_client", return_value=FakeClient()):
+            return self.detector.update("key", "p1", end, "2021-01-01")
+
+    def test_incremental_updates(self):
+        first = self.update(self.scenes[:2], "2021-01-07")
+        self.assertEqual(len(first), 1)
+        row = first.iloc[0]
+        self.assertAlmostEqual(row["mean_change"], 0.3, places=5)
+        self.assertEqual(row["gain_pct"], 100)
+        self.assertEqual(row["pixels"], 40 * 40 - 1)
+
+        # Only the new scene is processed, against the kept latest one.
+        second = self.update(self.scenes, "2021-01-12")
+        self.assertEqual(len(second), 1)
+        self.assertAlmostEqual(second.iloc[0]["mean_change"], -0.2, places=4)
+        self.assertEqual(second.iloc[0]["loss_pct"], 100)
+        self.assertEqual(self.detector.state("p1")["Date"], "2021-01-11")
+        self.assertEqual(len(self.detector.summaries()), 2)
+        self.assertEqual(len(os.listdir(os.path.join(self.detector.directory, "p1", "changes"))), 2)
+
+    def test_scene_on_end_date(self):
+        from leafagro import agromonitoring
+
+        # The second scene is taken at noon on the end date of the first run.
+        scenes = [dict(self.scenes[0]), dict(self.scenes[1], dt=self.scenes[1]["dt"] + 12 * 3600)]
+        client = SearchClient(scenes)
+        agromonitoring.clear_search_cache()
+        self.addCleanup(agromonitoring.clear_search_cache)
+        with mock.patch.object(agromonitoring, "get_client", return_value=client), \
+                mock.patch.object(agromonitoring, "_catalog", None), \
+                mock.patch.object(change, "get_client", return_value=client):
+            first = self.detector.update("key", "p1", "2021-01-06", "2021-01-01")
+            self.assertEqual(len(first), 1)
+            self.assertEqual(self.detector.state("p1")["Date"], "2021-01-06")
+            # The next run starts from that date without processing the scene again.
+            self.assertEqual(len(self.detector.update("key", "p1", "2021-01-10")), 0)
+
+    def test_parquet_engine_checked_first(self):
+        missing = ImportError("Please install pyarrow package")
+        with mock.patch.object(change, "_pyarrow", side_effect=missing):
+            with self.assertRaises(ImportError):
+                change.ChangeDetector(os.path.join(self.tmpdir.name, "other"))
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir.name, "other")))
+
+
+if __name__ == "__main__":
+    unittest.main()
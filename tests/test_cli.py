@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+"""Tests for `leafagro.cli` module."""
+
+
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from leafagro import cli
+
+
+class TestCli(unittest.TestCase):
+    """Tests for `leafagro.cli` module."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_read_polygons(self):
+        path = os.path.join(self.tmpdir.name, "polygons.txt")
+        with open(path, "w") as f:
+            f.write("# farm A\nabc\n\ndef  # north field\nabc\n")
+        self.assertEqual(cli.read_polygons([path, "ghi", "def"]), ["abc", "def", "ghi"])
+
+    def test_parse_indices(self):
+        indices = cli.parse_indices(["diff=ndvi - evi"])
+        self.assertEqual(indices["diff"].bands, ["evi", "ndvi"])
+        with self.assertRaises(ValueError):
+            cli.parse_indices(["ndvi - evi"])
+        with self.assertRaises(ValueError):
+            cli.parse_indices(["bad=N - R"])
+
+    def test_checkpoint_resume(self):
+        path = os.path.join(self.tmpdir.name, cli.CHECKPOINT)
+        checkpoint = cli.Checkpoint(path, {"start": "2023-01-01"})
+        checkpoint.record("a", {"scenes": 1})
+        checkpoint.record("b", error="RuntimeError: image search failed")
+
+        resumed = cli.Checkpoint(path, {"start": "2023-01-01"})
+        self.assertIn("a", resumed)
+        self.assertNotIn("b", resumed)
+        with contextlib.redirect_stderr(io.StringIO()):
+            changed = cli.Checkpoint(path, {"start": "2024-01-01"})
+        self.assertNotIn("a", changed)
+
+    def test_invalid_arguments(self):
+        argv = ["extract", "--api-key", "k", "--polygons", "a", "--start", "2023-01-01", "--end", "2023-02-01"]
+        with contextlib.redirect_stderr(io.StringIO()):
+            with self.assertRaises(SystemExit):
+                cli.main(argv + ["--index", "diff=ndvi - evi"])
+            with self.assertRaises(SystemExit):
+                cli.main(argv + ["--workers", "0"])
+
+    def test_parquet_engine_checked_first(self):
+        argv = ["extract", "--api-key", "k", "--polygons", "a", "--start", "2023-01-01", "--end", "2023-02-01"]
+        argv += ["--output", os.path.join(self.tmpdir.name, "out")]
+        missing = ImportError("Please install pyarrow package")
+        with mock.patch("leafagro.catalog._pyarrow", side_effect=missing), mock.patch.object(cli, "process_polygon") as process:
+            with contextlib.redirect_stderr(io.StringIO()) as stderr:
+                with self.assertRaises(SystemExit):
+                    cli.main(argv)
+        self.assertIn("Please install pyarrow package", stderr.getvalue())
+        process.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
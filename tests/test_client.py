@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+"""Tests for `leafagro.client` module."""
+
+
+import threading
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from leafagro.cache import DiskCache, endpoint_of
+from leafagro.client import AgroClient, RateLimiter
+
+
+class _FlakyHandler(BaseHTTPRequestHandler):
+    """Answers 503 to the first request and 200 afterwards."""
+
+    calls = 0
+
+    def do_GET(self):
+        type(self).calls += 1
+        status = 503 if type(self).calls == 1 else 200
+        body = b"[]"
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestClient(unittest.TestCase):
+    """Tests for `leafagro.client` module."""
+
+    def setUp(self):
+        _FlakyHandler.calls = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _FlakyHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_retry_on_server_error(self):
+        client = AgroClient(backoff_factor=0, calls_per_minute=None)
+        response = client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(_FlakyHandler.calls, 2)
+
+    def test_get_many_keeps_order(self):
+        client = AgroClient(backoff_factor=0, calls_per_minute=None)
+        urls = [f"{self.url}?i={i}" for i in range(5)]
+        responses = client.get_many(urls, max_workers=3)
+        self.assertEqual([r.url for r in responses], urls)
+
+    def test_rate_limiter_burst(self):
+        limiter = RateLimiter(calls=5, period=60)
+        for _ in range(5):
+            limiter.acquire()
+        self.assertLess(limiter._tokens, 1)
+
+
+class TestDiskCache(unittest.TestCase):
+    """Tests for the on-disk response cache of the client."""
+
+    def setUp(self):
+        import tempfile
+
+        _FlakyHandler.calls = 1
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _FlakyHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/agro/1.0/polygons"
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = f"{self.tmpdir.name}/responses.sqlite"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmpdir.cleanup()
+
+    def test_fresh_responses_are_served_from_cache(self):
+        client = AgroClient(calls_per_minute=None, cache=DiskCache(self.path))
+        client.get(self.url)
+        response = client.get(self.url)
+        self.assertEqual(response.json(), [])
+        self.assertEqual(response.headers["X-Leafagro-Cache"], "hit")
+        self.assertEqual(_FlakyHandler.calls, 2)
+        client.close()
+
+    def test_stats_urls_are_cached(self):
+        stats = self.url.replace("/agro/1.0/polygons", "/stats/1.0/02ab1e2b4c8d/5f1a2b3c4d5e6f7a8b9c0d1e?appid=key")
+        cache = DiskCache(self.path)
+        self.assertEqual(endpoint_of(stats), "stats")
+        self.assertTrue(cache.accepts(stats))
+        self.assertEqual(cache.ttl_for(stats), 30 * 24 * 3600)
+        self.assertFalse(cache.accepts("https://api.agromonitoring.com/tile/1.0/10/500/300/02ab1e2b4c8d/5f1a2b?appid=key"))
+        client = AgroClient(calls_per_minute=None, cache=cache)
+        client.get(stats)
+        self.assertEqual(client.get(stats).headers["X-Leafagro-Cache"], "hit")
+        self.assertEqual(_FlakyHandler.calls, 2)
+        client.close()
+
+    def test_offline_mode(self):
+        cache = DiskCache(self.path, ttl={"polygons": 0})
+        AgroClient(calls_per_minute=None, cache=cache).get(self.url)
+        offline = AgroClient(cache=cache, offline=True)
+        self.assertEqual(offline.get(self.url).status_code, 200)
+        self.assertEqual(offline.get(self.url + "/other").status_code, 504)
+        self.assertEqual(_FlakyHandler.calls, 2)
+        # Tiles and images are never cached: offline, they fail without a request.
+        root = self.url.split("/agro/")[0]
+        with mock.patch.object(offline.session, "send") as send:
+            for url in [f"{root}/tile/1.0/10/500/300/abc?appid=key", f"{root}/data/1.0/abc?appid=key"]:
+                response = offline.get(url)
+                self.assertEqual(response.status_code, 504)
+                self.assertEqual(response.headers["X-Leafagro-Cache"], "miss")
+        send.assert_not_called()
+        self.assertEqual(_FlakyHandler.calls, 2)
+        cache.close()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+"""Tests for `leafagro.foliumap` module."""
+
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from leafagro import foliumap, store
+from tests.test_raster import write_band
+
+
+class TestFoliumap(unittest.TestCase):
+    """Tests for `leafagro.foliumap` module."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        data = np.random.default_rng(0).integers(1, 10000, (600, 500), dtype="uint16")
+        self.path = os.path.join(self.tmpdir.name, "band.tif")
+        write_band(self.path, data)
+        store.set_raster_store(os.path.join(self.tmpdir.name, "store"))
+
+    def tearDown(self):
+        store.set_raster_store(None)
+        self.tmpdir.cleanup()
+
+    def test_static_image(self):
+        m = foliumap.Map()
+        m.add_raster(self.path, static="image", colormap="viridis", max_size=256)
+        html = m.get_root().render()
+        self.assertIn("data:image/png;base64,", html)
+        self.assertNotIn("127.0.0.1", html)
+
+    def test_static_tiles(self):
+        tiles_dir = os.path.join(self.tmpdir.name, "tiles")
+        m = foliumap.Map()
+        m.add_raster(self.path, static="tiles", tiles_dir=tiles_dir, zooms=[12, 13], colormap="viridis")
+        self.assertEqual(sorted(os.listdir(tiles_dir)), [foliumap.TILES_MARKER, "12", "13"])
+        self.assertIn(tiles_dir.replace(os.sep, "/") + "/{z}/{x}/{y}.png", m.get_root().render())
+        # Tiles written by add_raster are replaced, other directories are left alone.
+        m.add_raster(self.path, static="tiles", tiles_dir=tiles_dir, zooms=12, colormap="viridis")
+        self.assertEqual(sorted(os.listdir(tiles_dir)), [foliumap.TILES_MARKER, "12"])
+        with self.assertRaises(ValueError):
+            m.add_raster(self.path, static="tiles", tiles_dir=self.tmpdir.name, zooms=12)
+        self.assertTrue(os.path.exists(self.path))
+        with self.assertRaises(ValueError):
+            m.add_raster(self.path, static="image", stretch="minmax")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+"""Tests for the import time of the `leafagro` package."""
+
+
+import json
+import subprocess
+import sys
+import unittest
+
+# Modules that the data functions must not load: the widget stack and pandas.
+HEAVY_MODULES = ["ipyleaflet", "ipywidgets", "IPython", "folium", "branca", "pandas", "geopandas"]
+
+
+def imported_modules(code):
+    """Runs some code in a fresh interpreter and returns the modules it imported."""
+    script = f"import json, sys\n{code}\nprint(json.dumps(sorted(sys.modules)))"
+    output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+    return set(json.loads(output.splitlines()[-1]))
+
+
+class TestImport(unittest.TestCase):
+    """Tests for the import time of the `leafagro` package."""
+
+    def test_import_is_light(self):
+        modules = imported_modules("import leafagro")
+        self.assertEqual([name for name in HEAVY_MODULES if name in modules], [])
+        self.assertNotIn("leafagro.leafagro", modules)
+
+    def test_data_functions_without_widgets(self):
+        modules = imported_modules(
+            "import leafagro\n"
+            "from leafagro.agromonitoring import Agromonitoring, search_images\n"
+            "from leafagro.client import AgroClient\n"
+            "leafagro.perf"
+        )
+        self.assertEqual([name for name in HEAVY_MODULES if name in modules], [])
+
+    def test_lazy_attributes(self):
+        import leafagro
+
+        from leafagro.leafagro import Map
+        from leafagro.stats import get_stats_batch
+
+        self.assertIs(leafagro.Map, Map)
+        self.assertIs(leafagro.get_stats_batch, get_stats_batch)
+        self.assertIn("Map", dir(leafagro))
+        with self.assertRaises(AttributeError):
+            leafagro.missing
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,6 +4,7 @@
 
 
 import unittest
+from unittest import mock
 
 from leafagro import leafagro
 
@@ -19,3 +20,87 @@ class TestLeafagro(unittest.TestCase):
 
     def test_000_something(self):
         """Test something."""
+
+    def test_basemaps_are_replaced(self):
+        m = leafagro.Map()
+        layers = len(m.layers)
+        m.add_basemap("OpenTopoMap")
+        self.assertEqual(len(m.layers), layers + 1)
+        for name in ["OpenTopoMap", "Esri.WorldImagery", "OpenTopoMap"]:
+            m.add_basemap(name, key="basemap")
+        self.assertEqual(len(m.layers), layers + 2)
+        self.assertEqual(m.layers[-1].name, "OpenTopoMap")
+        controls = len(m.controls)
+        m.add_basemap_gui()
+        widgets = m.widget_report()["widgets"]
+        for _ in range(3):
+            m.add_basemap_gui()
+        self.assertEqual(len(m.controls), controls + 1)
+        self.assertEqual(m.widget_report()["widgets"], widgets)
+        # The dropdown of the GUI switches the managed basemap.
+        dropdown = m.get_managed("basemap_gui").widget
+        for value in dropdown.options[:3]:
+            dropdown.value = value
+        self.assertEqual(len(m.layers), layers + 2)
+
+    def test_display_stats_reuses_its_table(self):
+        m = leafagro.Map()
+        polygon = {"type": "Polygon", "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 0]]]}
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {"mean": 0.5}
+        registry = mock.Mock()
+        registry.geometry.return_value = polygon
+        with mock.patch("leafagro.client.get_client") as get_client, \
+                mock.patch("leafagro.agromonitoring.get_polygon_registry", return_value=registry):
+            get_client.return_value.get.return_value = response
+            m.display_stats("http://x/agro/1.0/stats/p1?appid=k", "2024-01-01")
+            before = m.widget_report()
+            for date in ["2024-01-02", "2024-01-03", "2024-01-02"]:
+                m.display_stats("http://x/agro/1.0/stats/p1?appid=k", date)
+            after = m.widget_report()
+        self.assertEqual(
+            (before["layers"], before["controls"], before["widgets"]),
+            (after["layers"], after["controls"], after["widgets"]),
+        )
+        self.assertEqual(list(m.get_managed("stats p1").stats.index), ["2024-01-01", "2024-01-02", "2024-01-03"])
+
+    def test_time_slider(self):
+        m = leafagro.Map()
+        layers, controls = len(m.layers), len(m.controls)
+        urls = {date: f"https://example.com/{date}/{{z}}/{{x}}/{{y}}.png" for date in ["d1", "d2", "d3"]}
+        active = m.add_time_slider(urls)
+        self.assertEqual((len(m.layers), len(m.controls)), (layers + 3, controls + 1))
+        prefetch = [layer for layer in m.layers if layer.name == "time series (prefetch)"]
+        self.assertEqual([layer.url for layer in prefetch], [urls["d1"], urls["d2"]])
+
+        active.time_slider.value = 1
+        self.assertIs(m.get_managed("time slider time series"), active)
+        self.assertEqual(active.url, urls["d2"])
+        self.assertEqual([layer.url for layer in prefetch], [urls["d1"], urls["d3"]])
+        active.time_slider.value = 2
+        self.assertEqual(active.url, urls["d3"])
+
+        widgets = m.widget_report()["widgets"]
+        for _ in range(3):
+            m.add_time_slider(urls)
+        self.assertEqual((len(m.layers), len(m.controls)), (layers + 3, controls + 1))
+        self.assertEqual(m.widget_report()["widgets"], widgets)
+        m.add_time_slider(urls, prefetch=False)
+        self.assertEqual(len(m.layers), layers + 1)
+
+    def test_add_geojson_deduplicate(self):
+        m = leafagro.Map()
+        polygon = {"type": "Polygon", "coordinates": [[[0.1234567891, 0], [1, 0], [1, 1], [0.1234567891, 0]]]}
+        layers = len(m.layers)
+        first = m.add_geojson(polygon)
+        self.assertEqual(first.data["coordinates"][0][0], [0.1234567891, 0])
+        self.assertIsNot(m.add_geojson(polygon), first)
+        self.assertEqual(len(m.layers), layers + 2)
+
+        kept = m.add_geojson(polygon, name="field", precision=6, deduplicate=True)
+        self.assertEqual(kept.data["coordinates"][0][0], [0.123457, 0])
+        self.assertIs(m.add_geojson(polygon, name="field", precision=6, deduplicate=True), kept)
+        renamed = m.add_geojson(polygon, name="other", precision=6, deduplicate=True)
+        restyled = m.add_geojson(polygon, name="field", precision=6, deduplicate=True, style={"color": "red"})
+        self.assertEqual(len({id(kept), id(renamed), id(restyled)}), 3)
+        self.assertEqual(len(m.layers), layers + 5)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+"""Tests for `leafagro.mosaic` module."""
+
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+
+from leafagro import mosaic, raster
+from leafagro.tiles import tiles_for_bounds
+from tests.test_raster import write_band
+
+
+class TestMosaic(unittest.TestCase):
+    """Tests for `leafagro.mosaic` module."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        self.nir = rng.integers(1, 10000, (300, 400), dtype="uint16")
+        self.red = rng.integers(1, 10000, (300, 400), dtype="uint16")
+        self.paths = {}
+        for name, data in [("nir", self.nir), ("red", self.red)]:
+            for half, columns in [("west", slice(0, 220)), ("east", slice(180, 400))]:
+                path = os.path.join(self.tmpdir.name, f"{name}_{half}.tif")
+                write_band(path, data[:, columns])
+                if half == "east":
+                    with rasterio.open(path, "r+") as dst:
+                        dst.transform = from_origin(500000 + 180 * 10, 5000000, 10, 10)
+                self.paths.setdefault(name, []).append(path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_read_windows(self):
+        nir = mosaic.Mosaic(self.paths["nir"], crs="EPSG:32633", resampling="nearest")
+        try:
+            self.assertEqual((nir.width, nir.height), (400, 300))
+            self.assertEqual(nir.transform, from_origin(500000, 5000000, 10, 10))
+            window = Window(150, 100, 100, 50)
+            block = nir.read(window)
+            np.testing.assert_array_equal(block, self.nir[100:150, 150:250])
+            self.assertIs(nir.read(window), block)
+            self.assertFalse(block.flags.writeable)
+            np.testing.assert_array_equal(nir.band(1).read(window), block)
+        finally:
+            nir.close()
+
+    def test_band_math_on_mosaics(self):
+        nir = mosaic.Mosaic(self.paths["nir"], crs="EPSG:32633", resampling="nearest")
+        red = mosaic.Mosaic(self.paths["red"], like=nir, resampling="nearest")
+        try:
+            output = raster.normalized_difference(nir, red, os.path.join(self.tmpdir.name, "ndvi.tif"), blocksize=64)
+        finally:
+            nir.close()
+            red.close()
+        nir, red = self.nir.astype("float32"), self.red.astype("float32")
+        with rasterio.open(output) as src:
+            np.testing.assert_allclose(src.read(1), (nir - red) / (nir + red), atol=1e-6)
+
+    def test_tiles(self):
+        nir = mosaic.Mosaic(self.paths["nir"])
+        try:
+            self.assertEqual(nir.crs.to_string(), "EPSG:3857")
+            source = mosaic.MosaicSource(nir, {"colormap": "viridis"})
+            self.assertEqual((source.vmin, source.vmax), (float(self.nir.min()), float(self.nir.max())))
+            z = source.max_zoom
+            tiles = list(tiles_for_bounds(source.bounds, [z]))
+            rendered = [source.render(None, *tile) for tile in tiles]
+            self.assertTrue(all(png.startswith(b"\x89PNG") for png in rendered if png is not None))
+            self.assertGreater(sum(png is not None for png in rendered), len(tiles) // 2)
+        finally:
+            nir.close()
+
+    def test_unregister_closes_the_mosaic(self):
+        from leafagro.tileserver import TileServer
+
+        nir = mosaic.Mosaic(self.paths["nir"])
+        server = TileServer(cache_dir=False)
+        try:
+            source_id, _ = server.register(mosaic.MosaicSource(nir))
+            source = server.source(source_id)
+            tiles = list(tiles_for_bounds(source.bounds, [source.max_zoom]))
+            rendered = [server.get_tile(source_id, *tile) for tile in tiles]
+            self.assertTrue(any(rendered))
+            self.assertIsNotNone(nir._executor)
+            self.assertTrue(any(item._handles for item in nir.inputs))
+
+            server.unregister(source_id)
+            self.assertIsNone(nir._executor)
+            self.assertFalse(any(item._handles for item in nir.inputs))
+            # The mosaic reopens its rasters if it is used again.
+            self.assertTrue(any(mosaic.MosaicSource(nir).render(server, *tile) for tile in tiles))
+        finally:
+            server.shutdown()
+            nir.close()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+
+"""Tests for `leafagro.perf` module."""
+
+
+import time
+import unittest
+
+from leafagro import perf
+
+
+class TestPerf(unittest.TestCase):
+    """Tests for `leafagro.perf` module."""
+
+    def setUp(self):
+        perf.reset()
+
+    def tearDown(self):
+        perf.disable()
+        perf.reset()
+
+    def test_disabled_records_nothing(self):
+        perf.disable()
+        with perf.span("outer"):
+            perf.count("requests")
+        self.assertEqual(len(perf.report()), 0)
+        self.assertEqual(len(perf.counters()), 0)
+
+    def test_nested_spans(self):
+        perf.enable()
+
+        @perf.timed("inner")
+        def inner():
+            time.sleep(0.02)
+
+        with perf.span("outer"):
+            inner()
+            inner()
+        perf.count("requests", 3)
+
+        report = perf.report()
+        self.assertEqual(report.loc["inner", "calls"], 2)
+        self.assertGreaterEqual(report.loc["outer", "total_s"], 0.04)
+        self.assertLess(report.loc["outer", "self_s"], 0.02)
+        self.assertAlmostEqual(report["share"].sum(), 1.0)
+        self.assertEqual(perf.counters()["requests"], 3)
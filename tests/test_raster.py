@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+"""Tests for `leafagro.raster` module."""
+
+
+import math
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+from leafagro import raster
+
+
+def write_band(path, data, nodata=0):
+    """Writes a single band GeoTIFF for the tests."""
+    profile = {
+        "driver": "GTiff",
+        "width": data.shape[1],
+        "height": data.shape[0],
+        "count": 1,
+        "dtype": data.dtype.name,
+        "crs": "EPSG:32633",
+        "transform": from_origin(500000, 5000000, 10, 10),
+        "nodata": nodata,
+    }
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(data, 1)
+
+
+class TestRaster(unittest.TestCase):
+    """Tests for `leafagro.raster` module."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        self.nir = rng.integers(1, 10000, (300, 200), dtype="uint16")
+        self.red = rng.integers(1, 10000, (300, 200), dtype="uint16")
+        self.nir[0, 0] = 0
+        self.nir_path = os.path.join(self.tmpdir.name, "nir.tif")
+        self.red_path = os.path.join(self.tmpdir.name, "red.tif")
+        write_band(self.nir_path, self.nir)
+        write_band(self.red_path, self.red)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_normalized_difference(self):
+        output = os.path.join(self.tmpdir.name, "nd.tif")
+        raster.normalized_difference(self.nir_path, self.red_path, output, blocksize=64)
+        nir = self.nir.astype("float32")
+        red = self.red.astype("float32")
+        with rasterio.open(output) as src:
+            self.assertEqual(src.transform, from_origin(500000, 5000000, 10, 10))
+            self.assertEqual(src.nodata, raster.DEFAULT_NODATA)
+            result = src.read(1)
+        self.assertEqual(result[0, 0], raster.DEFAULT_NODATA)
+        expected = (nir - red) / (nir + red)
+        np.testing.assert_allclose(result[1:, 1:], expected[1:, 1:], atol=1e-6)
+
+    def test_compute_indices_in_one_pass(self):
+        from leafagro import indices
+
+        output = os.path.join(self.tmpdir.name, "indices.tif")
+        bands = {"N": self.nir_path, "R": self.red_path}
+        indices.compute_indices(bands, {"ndvi": "ndvi", "ratio": "N / R"}, output, blocksize=64)
+        nir = self.nir.astype("float32")
+        red = self.red.astype("float32")
+        with rasterio.open(output) as src:
+            self.assertEqual(src.descriptions, ("ndvi", "ratio"))
+            result = src.read()
+        np.testing.assert_allclose(result[0, 1:, 1:], ((nir - red) / (nir + red))[1:, 1:], atol=1e-6)
+        np.testing.assert_allclose(result[1, 1:, 1:], (nir / red)[1:, 1:], rtol=1e-6)
+
+    def test_write_cog(self):
+        output = os.path.join(self.tmpdir.name, "nir_cog.tif")
+        raster.write_cog(self.nir_path, output)
+        with rasterio.open(output) as src:
+            np.testing.assert_array_equal(src.read(1), self.nir)
+        # Errors are raised instead of triggering the fallback for old GDAL versions.
+        with self.assertRaises(Exception), mock.patch("rasterio.open") as fallback:
+            raster.write_cog(os.path.join(self.tmpdir.name, "missing.tif"), output)
+        fallback.assert_not_called()
+
+        with mock.patch.object(raster, "_has_cog_driver", return_value=False):
+            raster.write_cog(self.nir_path, os.path.join(self.tmpdir.name, "nir_gtiff.tif"))
+        with rasterio.open(os.path.join(self.tmpdir.name, "nir_gtiff.tif")) as src:
+            self.assertEqual(src.profile["tiled"], True)
+            np.testing.assert_array_equal(src.read(1), self.nir)
+
+    def test_expression_rejects_code(self):
+        from leafagro.indices import Expression
+
+        with self.assertRaises(ValueError):
+            Expression("__import__('os').getcwd()")
+
+    def test_tile_server_shares_datasets(self):
+        from leafagro.tileserver import RasterSource, TileServer
+
+        server = TileServer(cache_dir=False)
+        try:
+            first, _ = server.register(RasterSource(self.nir_path, {"colormap": "viridis"}))
+            second, url = server.register(RasterSource(self.nir_path))
+            self.assertTrue(url.endswith(f"/tiles/{second}/{{z}}/{{x}}/{{y}}"))
+            self.assertEqual(server.info()["open_datasets"], 1)
+            lat, lon = server.source(first).center
+            z = 12
+            x = int((lon + 180) / 360 * 2**z)
+            y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * 2**z)
+            tile = server.get_tile(first, z, x, y)
+            self.assertTrue(tile.startswith(b"\x89PNG"))
+            self.assertEqual(server.info()["cached_tiles"], 1)
+            server.unregister(first)
+            self.assertEqual(server.info()["open_datasets"], 1)
+            server.unregister(second)
+            self.assertEqual(server.info()["open_datasets"], 0)
+        finally:
+            server.shutdown()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+
+"""Tests for `leafagro.stats` module."""
+
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from leafagro import stats
+
+
+class TestStats(unittest.TestCase):
+    """Tests for `leafagro.stats` module."""
+
+    def setUp(self):
+        dates = pd.date_range("2020-01-01", periods=8, freq="16D").strftime("%Y-%m-%d")
+        keys = [(polygon, "ndvi", date) for polygon in ("a", "b") for date in dates]
+        records = [{"mean": float(i), "num": 10} for i in range(len(keys))]
+        self.df = stats._records_to_frame(keys, records)
+
+    def test_frame_layout(self):
+        self.assertEqual(list(self.df.index.names), stats.INDEX_NAMES)
+        self.assertEqual(list(self.df.columns), stats.STAT_COLUMNS)
+        self.assertEqual(str(self.df["num"].dtype), "Int64")
+
+    def test_smooth_does_not_mix_series(self):
+        smoothed = stats.smooth_stats(self.df, window=3, columns=["mean"])
+        self.assertEqual(smoothed.loc[("b", "ndvi")]["mean"].iloc[0], 8.5)
+
+    def test_anomalies(self):
+        current = self.df.copy()
+        current["mean"] = current["mean"] + 100
+        result = stats.detect_anomalies(current, self.df, period_days=64)
+        self.assertTrue(result["anomaly"].all())
+        self.assertTrue(np.isfinite(result["zscore"]).all())
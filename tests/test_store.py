@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+"""Tests for `leafagro.store` module."""
+
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+from leafagro import raster, store
+from tests.test_raster import write_band
+
+
+class TestStore(unittest.TestCase):
+    """Tests for `leafagro.store` module."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        self.nir = rng.integers(1, 10000, (600, 500), dtype="uint16")
+        self.red = rng.integers(1, 10000, (600, 500), dtype="uint16")
+        self.nir[0, 0] = 0
+        self.nir_path = os.path.join(self.tmpdir.name, "nir.tif")
+        self.red_path = os.path.join(self.tmpdir.name, "red.tif")
+        write_band(self.nir_path, self.nir)
+        write_band(self.red_path, self.red)
+        self.store = store.RasterStore(os.path.join(self.tmpdir.name, "store"))
+
+    def tearDown(self):
+        store.set_raster_store(None)
+        self.tmpdir.cleanup()
+
+    def test_zero_copy_views(self):
+        stored = self.store.open(self.nir_path)
+        self.assertIs(self.store.open(self.nir_path), stored)
+        self.assertEqual(stored.levels, [(500, 600), (250, 300), (125, 150)])
+
+        view = stored.read(Window(10, 20, 30, 40), band=1)
+        self.assertIsInstance(view.base, np.memmap)
+        self.assertFalse(view.flags.writeable)
+        np.testing.assert_array_equal(view, self.nir[20:60, 10:40])
+        self.assertTrue(np.isnan(stored.read(band=1)[0, 0]))
+        self.assertEqual(stored.statistics[0][1], self.nir.max())
+
+        overview = stored.read(band=1, level=1)
+        expected = self.nir[:2, :2].astype("float64")
+        self.assertAlmostEqual(overview[0, 0], expected[expected > 0].mean(), places=3)
+
+    def test_band_math_reads_the_store(self):
+        direct = raster.normalized_difference(self.nir_path, self.red_path, os.path.join(self.tmpdir.name, "a.tif"))
+        store.set_raster_store(self.store)
+        self.assertIsInstance(raster.as_band(self.nir_path), store.StoredBand)
+        stored = raster.normalized_difference(self.nir_path, self.red_path, os.path.join(self.tmpdir.name, "b.tif"))
+        with rasterio.open(direct) as a, rasterio.open(stored) as b:
+            np.testing.assert_array_equal(a.read(1), b.read(1))
+
+    def test_eviction(self):
+        first = self.store.open(self.nir_path)
+        self.store.open(self.red_path)
+        os.utime(os.path.join(first.path, "meta.json"), (0, 0))
+        self.store.max_bytes = self.store.size()[1] - 1
+        self.store._evict()
+        self.assertEqual(self.store.size()[0], 1)
+        self.assertFalse(os.path.exists(first.path))
+
+    def test_tiles(self):
+        source = store.StoreSource(self.store.open(self.nir_path), {"colormap": "viridis"})
+        west, south, east, north = source.bounds
+        from leafagro.tiles import lonlat_to_tile
+
+        x, y = lonlat_to_tile((west + east) / 2, (south + north) / 2, source.max_zoom)
+        tile = source.render(None, source.max_zoom, x, y)
+        self.assertTrue(tile.startswith(b"\x89PNG"))
+        self.assertIsNone(source.render(None, source.max_zoom, 0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
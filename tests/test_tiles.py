@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+"""Tests for `leafagro.tiles` module."""
+
+
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import rasterio
+from PIL import Image
+
+from leafagro import tiles
+
+
+def png(color):
+    buffer = io.BytesIO()
+    Image.new("RGBA", (256, 256), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.status_code = 200 if content is not None else 404
+        self.content = content
+
+
+class FakeClient:
+    """Answers tile URLs with one PNG, or 404 for the missing ones, and records the requests."""
+
+    def __init__(self, missing=()):
+        self.urls = []
+        self.missing = set(missing)
+
+    def get(self, url):
+        self.urls.append(url)
+        return FakeResponse(None if url in self.missing else png((0, 128, 0, 255)))
+
+    def get_many(self, urls, max_workers=8):
+        return [self.get(url) for url in urls]
+
+
+class TestTiles(unittest.TestCase):
+    """Tests for `leafagro.tiles` module."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.bounds = (12.0, 45.0, 12.05, 45.05)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_lonlat_to_tile(self):
+        self.assertEqual(tiles.lonlat_to_tile(0, 0, 0), (0, 0))
+        self.assertEqual(tiles.lonlat_to_tile(0.1, 0.1, 1), (1, 0))
+        self.assertEqual(tiles.lonlat_to_tile(-0.1, -0.1, 1), (0, 1))
+        # Points outside of Web Mercator are clamped to the edge tiles.
+        self.assertEqual(tiles.lonlat_to_tile(180, -90, 3), (7, 7))
+        self.assertEqual(tiles.lonlat_to_tile(-180, 90, 3), (0, 0))
+
+    def test_tiles_for_bounds(self):
+        self.assertEqual(tiles.tiles_for_bounds((-10, -10, 10, 10), 1), [(1, 0, 0), (1, 0, 1), (1, 1, 0), (1, 1, 1)])
+        found = tiles.tiles_for_bounds(self.bounds, range(10, 13))
+        self.assertEqual(len(found), len(set(found)))
+        self.assertEqual({z for z, _, _ in found}, {10, 11, 12})
+        for z, x, y in found:
+            left, bottom, right, top = tiles.tile_bounds(z, x, y)
+            self.assertLess(left, right)
+            self.assertLess(bottom, top)
+
+    def test_plan_download(self):
+        urls = {"a": "https://example.com/a/{z}/{x}/{y}.png", "b": "https://example.com/b/{z}/{x}/{y}.png"}
+        client = FakeClient()
+        with mock.patch.object(tiles, "get_client", return_value=client):
+            plan = tiles.plan_download(urls, self.bounds, [12, 13], sample=2)
+        count = len(tiles.tiles_for_bounds(self.bounds, [12, 13]))
+        self.assertEqual(plan.count, 2 * count)
+        self.assertEqual(plan.tile_bytes, len(png((0, 128, 0, 255))))
+        self.assertEqual(plan.bytes, plan.count * plan.tile_bytes)
+        self.assertEqual(len(client.urls), 2)
+
+        with mock.patch.object(tiles, "get_client", return_value=client):
+            fixed = tiles.plan_download(urls, self.bounds, 12, tile_bytes=100)
+        self.assertEqual(fixed.bytes, fixed.count * 100)
+        self.assertEqual(len(client.urls), 2)
+
+    def test_mbtiles_deduplication(self):
+        path = os.path.join(self.tmpdir.name, "tiles.mbtiles")
+        store = tiles.MBTiles(path, {"name": "test"})
+        empty, field = png((0, 0, 0, 0)), png((0, 128, 0, 255))
+        store.put(2, 0, 0, empty)
+        store.put(2, 1, 0, empty)
+        store.put(2, 1, 1, field)
+        store.close()
+
+        store = tiles.MBTiles(path)
+        try:
+            self.assertEqual(store.metadata()["name"], "test")
+            self.assertEqual(store.stored_tiles(), {(2, 0, 0), (2, 1, 0), (2, 1, 1)})
+            self.assertEqual(store.get(2, 1, 0), empty)
+            self.assertEqual(store.get(2, 1, 1), field)
+            self.assertIsNone(store.get(2, 3, 3))
+            self.assertEqual(store._conn.execute("SELECT COUNT(*) FROM images").fetchone()[0], 2)
+            self.assertEqual(tuple(store.zoom_range()), (2, 2))
+        finally:
+            store.close()
+
+    def test_harvest(self):
+        urls = {"2021-01-01": "https://example.com/{z}/{x}/{y}.png", "2021-01-06": "https://example.com/{z}/{x}/{y}.png"}
+        client = FakeClient()
+        with mock.patch.object(tiles, "get_client", return_value=client):
+            paths = tiles.harvest(urls, self.bounds, 12, self.tmpdir.name, progress=False)
+            count = len(tiles.tiles_for_bounds(self.bounds, 12))
+            # Layers with the same URLs share the downloads, and a second run resumes.
+            self.assertEqual(len(client.urls), count)
+            tiles.harvest(urls, self.bounds, 12, self.tmpdir.name, progress=False)
+            self.assertEqual(len(client.urls), count)
+        for path in paths.values():
+            store = tiles.MBTiles(path)
+            try:
+                self.assertEqual(len(store.stored_tiles()), count)
+            finally:
+                store.close()
+
+        with self.assertRaises(ValueError):
+            tiles.harvest(urls, self.bounds, 12, self.tmpdir.name, max_tiles=1)
+
+    def test_harvest_counts_failures(self):
+        template = "https://example.com/{z}/{x}/{y}.png"
+        found = tiles.tiles_for_bounds(self.bounds, 12)
+        client = FakeClient(missing=[template.format(z=z, x=x, y=y) for z, x, y in found[:1]])
+        output = io.StringIO()
+        with mock.patch.object(tiles, "get_client", return_value=client), contextlib.redirect_stdout(output):
+            paths = tiles.harvest({"a": template, "b": template}, self.bounds, 12, self.tmpdir.name, max_workers=1)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[0], f"a: {len(found) - 1} tiles downloaded, 0 copied, 1 failed, 0 already stored")
+        self.assertEqual(lines[1], f"b: 0 tiles downloaded, {len(found) - 1} copied, 1 failed, 0 already stored")
+        store = tiles.MBTiles(paths["b"])
+        try:
+            self.assertEqual(store.stored_tiles(), set(found[1:]))
+        finally:
+            store.close()
+
+    def test_harvest_agromonitoring(self):
+        from leafagro.agromonitoring import ImageSearch
+
+        registry = mock.Mock()
+        registry.geometry.return_value = {"type": "Polygon", "coordinates": [[[12.0, 45.0], [12.05, 45.0], [12.05, 45.05], [12.0, 45.0]]]}
+        scene = {"dt": 1609459200, "type": "s2", "cl": 0, "dc": 100, "tile": {"ndvi": "https://example.com/{z}/{x}/{y}.png"}}
+        args = ("key", "p1", "2021-01-01", "2021-01-31")
+        with mock.patch("leafagro.agromonitoring.get_polygon_registry", return_value=registry), \
+                mock.patch.object(tiles, "get_client", return_value=FakeClient()):
+            with mock.patch("leafagro.agromonitoring.search_images") as search_images:
+                self.assertEqual(tiles.harvest_agromonitoring(*args, "lai", 12, self.tmpdir.name), {})
+                search_images.assert_not_called()
+            # No scenes, or no URL of the product, give nothing to download.
+            for scenes in ([], [dict(scene, tile={"evi": "https://example.com/evi"})]):
+                with mock.patch("leafagro.agromonitoring.search_images", return_value=ImageSearch("p1", *args[2:], scenes)):
+                    self.assertEqual(tiles.harvest_agromonitoring(*args, "ndvi", 12, self.tmpdir.name), {})
+            with mock.patch("leafagro.agromonitoring.search_images", return_value=ImageSearch("p1", *args[2:], [scene])):
+                paths = tiles.harvest_agromonitoring(*args, "ndvi", 12, self.tmpdir.name, progress=False)
+        self.assertEqual(list(paths), ["2021-01-01 ndvi"])
+
+    def test_mbtiles_to_cog(self):
+        path = os.path.join(self.tmpdir.name, "tiles.mbtiles")
+        store = tiles.MBTiles(path)
+        store.put(3, 4, 2, png((255, 0, 0, 255)))
+        store.put(3, 5, 2, png((0, 0, 255, 255)))
+        store.put(2, 2, 1, png((0, 255, 0, 255)))
+        store.close()
+
+        output = tiles.mbtiles_to_cog(path, os.path.join(self.tmpdir.name, "tiles.tif"))
+        with rasterio.open(output) as src:
+            self.assertEqual((src.count, src.width, src.height), (4, 512, 256))
+            self.assertEqual(src.crs.to_string(), "EPSG:3857")
+            np.testing.assert_allclose(src.bounds.left, tiles.tile_bounds(3, 4, 2)[0])
+            np.testing.assert_allclose(src.bounds.right, tiles.tile_bounds(3, 5, 2)[2])
+            data = src.read()
+        np.testing.assert_array_equal(data[:, 0, 0], [255, 0, 0, 255])
+        np.testing.assert_array_equal(data[:, 0, 511], [0, 0, 255, 255])
+        self.assertFalse(os.path.exists(output + ".partial.tif"))
+
+        with self.assertRaises(ValueError):
+            tiles.mbtiles_to_cog(path, os.path.join(self.tmpdir.name, "empty.tif"), zoom=5)
+
+
+if __name__ == "__main__":
+    unittest.main()
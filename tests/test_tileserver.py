@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+"""Tests for `leafagro.tileserver` module."""
+
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from leafagro import tileserver
+from tests.test_raster import write_band
+
+
+class TestTileServer(unittest.TestCase):
+    """Tests for `leafagro.tileserver` module."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "band.tif")
+        write_band(self.path, np.arange(1, 257, dtype="uint16").reshape(16, 16))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_local_source_key(self):
+        source = tileserver.RasterSource(os.path.relpath(self.path))
+        self.assertEqual(source.path, os.path.abspath(self.path))
+        self.assertNotEqual(source.key, tileserver.RasterSource(self.path, {"colormap": "viridis"}).key)
+
+    def test_url_source(self):
+        url = "https://example.com/cogs/ndvi.tif"
+        response = mock.Mock(status_code=200, headers={"ETag": '"v1"', "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"})
+        with mock.patch("requests.head", return_value=response) as head:
+            source = tileserver.RasterSource(url)
+            same = tileserver.RasterSource(url)
+            response.headers = {"ETag": '"v2"'}
+            updated = tileserver.RasterSource(url)
+        self.assertEqual(source.path, url)
+        head.assert_called_with(url, allow_redirects=True, timeout=10)
+        self.assertEqual(source.key, same.key)
+        self.assertNotEqual(source.key, updated.key)
+        self.assertEqual(tileserver.RasterSource("/vsis3/bucket/ndvi.tif").path, "/vsis3/bucket/ndvi.tif")
+
+    def test_readers_are_not_shared_between_threads(self):
+        server = tileserver.TileServer(cache_dir=False)
+        try:
+            with server.reader(self.path) as first:
+                # A second render of the same raster does not wait for the first one.
+                with server.reader(self.path) as second:
+                    self.assertIsNot(second, first)
+            with server.reader(self.path) as again:
+                self.assertIn(again, (first, second))
+            self.assertEqual(server.info()["open_datasets"], 1)
+        finally:
+            server.shutdown()
+
+    def test_disk_cache_budget(self):
+        class Source(tileserver.TileSource):
+            key = "a" * 40
+
+            def render(self, server, z, x, y):
+                return bytes(1000)
+
+        cache_dir = os.path.join(self.tmpdir.name, "tiles")
+        server = tileserver.TileServer(memory_bytes=0, cache_dir=cache_dir, disk_bytes=5000)
+        source_id = "source"
+        server._sources[source_id] = Source()
+        for x in range(4):
+            server.get_tile(source_id, 10, x, 0)
+        # Reading a tile makes it the most recently used one.
+        first = server._disk_path(Source.key, 10, 0, 0)
+        os.utime(first, (0, 0))
+        self.assertIsNotNone(server.get_tile(source_id, 10, 0, 0))
+        for x in range(4, 7):
+            server.get_tile(source_id, 10, x, 0)
+        sizes = [size for _, _, size in server._disk_entries()]
+        self.assertLessEqual(sum(sizes), 5000)
+        self.assertTrue(os.path.exists(first))
+        self.assertFalse(os.path.exists(server._disk_path(Source.key, 10, 1, 0)))
+        self.assertTrue(os.path.exists(server._disk_path(Source.key, 10, 6, 0)))
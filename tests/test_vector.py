@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+"""Tests for `leafagro.vector` module."""
+
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import geopandas as gpd
+from shapely.geometry import Point
+
+from leafagro import vector
+
+
+class TestVector(unittest.TestCase):
+    """Tests for `leafagro.vector` module."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "parcels.shp")
+        parcels = gpd.GeoDataFrame(
+            {"id": range(100)},
+            geometry=[Point(10 + i * 0.01, 45).buffer(0.002, 64) for i in range(100)],
+            crs="EPSG:4326",
+        ).to_crs("EPSG:32632")
+        parcels.to_file(self.path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_chunks_and_bbox(self):
+        chunks = list(vector.iter_vector(self.path, chunk_size=30))
+        self.assertEqual([len(chunk) for chunk in chunks], [30, 30, 30, 10])
+        self.assertEqual(chunks[0].crs, vector.WGS84)
+        gdf = vector.read_vector(self.path, bbox=(9.9, 44.9, 10.105, 45.1), chunk_size=30)
+        self.assertEqual(sorted(gdf["id"]), list(range(11)))
+
+    def test_geojson_is_read_in_one_pass(self):
+        path = os.path.join(self.tmpdir.name, "parcels.geojson")
+        gpd.read_file(self.path).to_file(path, driver="GeoJSON")
+        with mock.patch("pyogrio.read_dataframe") as read_dataframe:
+            chunks = list(vector.iter_vector(path, columns=["id"], chunk_size=30))
+        read_dataframe.assert_not_called()
+        self.assertEqual([len(chunk) for chunk in chunks], [30, 30, 30, 10])
+        self.assertEqual(chunks[0].crs, vector.WGS84)
+        gdf = vector.read_vector(self.path)
+        self.assertEqual([i for chunk in chunks for i in chunk["id"]], list(gdf["id"]))
+        for chunk in chunks:
+            expected = gdf.geometry.iloc[list(chunk["id"])]
+            self.assertTrue(chunk.geometry.geom_equals_exact(expected.set_axis(chunk.index), 1e-9).all())
+
+    def test_simplify_for_zoom(self):
+        gdf = vector.read_vector(self.path)
+        coarse = vector.simplify_for_zoom(gdf, 12)
+        self.assertEqual(len(coarse), len(gdf))
+        self.assertLess(coarse.count_coordinates().sum(), gdf.count_coordinates().sum() / 4)
+        geojson = vector.to_geojson(coarse)
+        self.assertEqual(len(geojson["features"]), 100)
+        self.assertEqual(geojson["features"][0]["geometry"]["type"], "Polygon")
+        self.assertEqual(geojson["features"][5]["properties"], {"id": 5})
+
+    def test_small_parcels_survive(self):
+        gdf = vector.read_vector(self.path)
+        coarse = vector.simplify_for_zoom(gdf, 5)
+        self.assertEqual(list(coarse["id"]), list(gdf["id"]))
+        self.assertFalse(coarse.geometry.is_empty.any())
+        self.assertTrue(coarse.geometry.is_valid.all())
+
+        from leafagro.leafagro import Map
+
+        m = Map()
+        m.add_shp(self.path)
+        features = m.layers[-1].data["features"]
+        self.assertEqual(len(features), 100)
+        self.assertEqual(
+            len(features[0]["geometry"]["coordinates"][0]),
+            len(vector.to_geojson(gdf)["features"][0]["geometry"]["coordinates"][0]),
+        )
+
+    def test_vector_tiles_need_mapbox_vector_tile(self):
+        with mock.patch.dict(sys.modules, {"mapbox_vector_tile": None}):
+            with self.assertRaises(ImportError):
+                vector.VectorTileSource(self.path)
+
+    def test_vector_tiles(self):
+        try:
+            import mapbox_vector_tile
+        except ImportError:
+            self.skipTest("mapbox-vector-tile is not installed")
+        from leafagro.tileserver import TileServer
+        from leafagro.tiles import lonlat_to_tile
+
+        server = TileServer(cache_dir=False)
+        try:
+            source = vector.VectorTileSource(self.path, columns=["id"])
+            source_id, _ = server.register(source)
+            x, y = lonlat_to_tile(10.0, 45.0, 14)
+            tile = mapbox_vector_tile.decode(server.get_tile(source_id, 14, x, y))
+            features = tile["features"]["features"]
+            self.assertIn({"id": 0, vector.FEATURE_ID: 0}, [f["properties"] for f in features])
+            # Parcels are smaller than a pixel at zoom 5 and are left out.
+            x, y = lonlat_to_tile(10.0, 45.0, 5)
+            self.assertIsNone(server.get_tile(source_id, 5, x, y))
+        finally:
+            server.shutdown()
+
+    def test_quantize_geojson(self):
+        geojson = vector.to_geojson(vector.read_vector(self.path))
+        quantized = vector.quantize_geojson(geojson, 4)
+        ring = quantized["features"][0]["geometry"]["coordinates"][0]
+        self.assertEqual(ring[0], ring[-1])
+        self.assertTrue(all(round(x, 4) == x for x, _ in ring))
+        # Points closer than 1e-4 degrees collapse into one.
+        self.assertLess(len(ring), len(geojson["features"][0]["geometry"]["coordinates"][0]))
+        self.assertEqual(vector.geojson_digest(quantized), vector.geojson_digest(vector.quantize_geojson(geojson, 4)))
+        self.assertNotEqual(vector.geojson_digest(quantized), vector.geojson_digest(geojson))
+
+    def test_topojson_shares_borders(self):
+        def square(x, id):
+            ring = [[x, 0], [x + 1, 0], [x + 1, 1], [x, 1], [x, 0]]
+            return {"type": "Feature", "id": id, "properties": {}, "geometry": {"type": "Polygon", "coordinates": [ring]}}
+
+        topology = vector.to_topojson({"type": "FeatureCollection", "features": [square(0, "a"), square(1, "b")]}, 3)
+        self.assertEqual(topology["transform"], {"scale": [1, 0.5], "translate": [0, 0]})
+        a, b = topology["objects"]["features"]["geometries"]
+        self.assertEqual((a["id"], b["id"]), ("a", "b"))
+        # The border x=1 is stored once and walked in both directions.
+        shared = set(a["arcs"][0]) & {~arc for arc in b["arcs"][0]}
+        self.assertEqual(len(shared), 1)
+        self.assertEqual(len(topology["arcs"]), 3)
+        self.assertEqual(topology["arcs"][0][0], [1, 0])
+        self.assertEqual(topology["arcs"][0][1:], [[0, 2]])
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+"""Tests for `leafagro.zonal` module."""
+
+
+import os
+import tempfile
+import unittest
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from shapely.geometry import box
+
+from leafagro import zonal
+from tests.test_raster import write_band
+
+
+class TestZonal(unittest.TestCase):
+    """Tests for `leafagro.zonal` module."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        self.nir = rng.integers(1, 10000, (300, 200), dtype="uint16")
+        self.nir[0, 0] = 0
+        self.nir_path = os.path.join(self.tmpdir.name, "nir.tif")
+        write_band(self.nir_path, self.nir)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_zonal_stats(self):
+        # Two fields on the 10 m grid: rows 0-9 x cols 0-19 and rows 50-99 x cols 100-149.
+        fields = gpd.GeoDataFrame(
+            {"name": ["a", "b"]},
+            geometry=[
+                box(500000, 4999900, 500200, 5000000),
+                box(501000, 4999000, 501500, 4999500),
+            ],
+            crs="EPSG:32633",
+        )
+        df = zonal.zonal_stats(self.nir_path, fields, id_field="name", blocksize=64)
+        a = self.nir[0:10, 0:20].astype("float64")
+        a = a[a != 0]
+        b = self.nir[50:100, 100:150].astype("float64")
+        self.assertEqual(df.loc["a", "count"], a.size)
+        self.assertAlmostEqual(df.loc["a", "mean"], a.mean(), places=6)
+        self.assertAlmostEqual(df.loc["b", "std"], b.std(), places=4)
+        self.assertEqual(df.loc["b", "max"], b.max())
+        # Percentiles come from histograms, accurate to one bin.
+        self.assertAlmostEqual(df.loc["b", "median"], np.median(b), delta=10000 / 256)
+        # Small blocks and one worker keep only two blocks in flight: same result.
+        small = zonal.zonal_stats(self.nir_path, fields, id_field="name", blocksize=16, max_workers=1)
+        pd.testing.assert_frame_equal(small, df)
+        ranged = zonal.zonal_stats(self.nir_path, fields, id_field="name", value_range=(0, 10000), blocksize=16)
+        self.assertAlmostEqual(ranged.loc["b", "p25"], np.percentile(b, 25), delta=10000 / 256)
+
+    def test_overlapping_zones(self):
+        # Field "b" covers the east half of "a", "c" only touches "a" on its west side.
+        fields = gpd.GeoDataFrame(
+            {"name": ["a", "b", "c"]},
+            geometry=[
+                box(500100, 4999500, 500300, 4999700),
+                box(500200, 4999400, 500400, 4999800),
+                box(500000, 4999500, 500100, 4999700),
+            ],
+            crs="EPSG:32633",
+        )
+        self.assertEqual(list(zonal._overlap_layers(fields, False)), [0, 1, 0])
+        df = zonal.zonal_stats(self.nir_path, fields, id_field="name", value_range=(0, 10000), blocksize=16)
+        for name, rows, cols in (("a", (30, 50), (10, 30)), ("b", (20, 60), (20, 40)), ("c", (30, 50), (0, 10))):
+            expected = self.nir[slice(*rows), slice(*cols)].astype("float64")
+            self.assertEqual(df.loc[name, "count"], expected.size)
+            self.assertAlmostEqual(df.loc[name, "mean"], expected.mean(), places=6)
+            field = fields[fields["name"] == name]
+            single = zonal.zonal_stats(self.nir_path, field, id_field="name", value_range=(0, 10000))
+            pd.testing.assert_series_equal(single.loc[name], df.loc[name])
+
+
+if __name__ == "__main__":
+    unittest.main()